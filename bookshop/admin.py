@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import User, Author, Genre, Publisher, Book, BookAuthor, Order, OrderItem, CartItem, BookGenre
+from .models import User, Author, Genre, Publisher, Book, BookAuthor, Order, OrderItem, CartItem, BookGenre, BookStats
 
 # Register your models here.
 
@@ -14,3 +14,4 @@ admin.site.register(Order)
 admin.site.register(OrderItem)
 admin.site.register(CartItem)
 admin.site.register(BookGenre)
+admin.site.register(BookStats)
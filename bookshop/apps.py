@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BookshopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookshop'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,140 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+
+from .models import Book, BookListing, Author, Publisher, BookAuthor
+from .serializers import BookDetailSerializer, AuthorSerializer, PublisherSerializer
+from .pagination import KeysetPaginator, PaginationError
+from .filters import BookFilterBackend, FilterError
+from .fast_serializers import BookFieldset, FieldsetError, book_list_values, abook_list_data
+from .renderers import ORJSONRenderer
+from .caching import cache_response
+from .conditional import conditional_response
+from . import search, facets
+
+
+class JSONResponse(HttpResponse):
+    """The bytes DRF's Response would render for `data`, without content negotiation."""
+
+    def __init__(self, data, status=200):
+        super().__init__(ORJSONRenderer().render(data), content_type='application/json', status=status)
+        self.data = data
+
+
+def not_found(model):
+    return JSONResponse({'detail': f'No {model._meta.object_name} matches the given query.'}, status=404)
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+class AsyncCatalogView(View):
+    """
+    Read-only catalog endpoints for ASGI deployments. They return the same
+    JSON as the DRF views (without the browsable API or streaming) but await
+    the database instead of holding a worker thread per request.
+    """
+    http_method_names = ['get', 'head', 'options']
+    response_class = JSONResponse
+
+
+class AsyncBookListView(AsyncCatalogView):
+    @conditional_response()
+    @cache_response()
+    async def get(self, request):
+        q = request.GET.get('q')
+        filter_backend = BookFilterBackend()
+        books = BookListing.objects.all()
+        rank_ordering = None
+
+        try:
+            fieldset = BookFieldset.from_params(request.GET)
+            facet_names = facets.requested(request.GET)
+            books = filter_backend.filter_queryset(books, request.GET)
+
+            if q:
+                result = search.search_books(books, q)
+                if result is None:
+                    books = books.none()
+                else:
+                    books, rank_ordering = result
+                    rank_ordering = (rank_ordering,)
+
+            paginator = KeysetPaginator(filter_backend.get_ordering(request.GET, rank_ordering))
+            page = await paginator.apaginate(book_list_values(books, *paginator.ordering, fieldset=fieldset), request)
+        except (FilterError, PaginationError, FieldsetError) as e:
+            return JSONResponse({'error': str(e)}, status=400)
+
+        data = {'data': await abook_list_data(page.object_list, fieldset), 'meta': page.meta}
+        if facet_names:
+            data['facets'] = await sync_to_async(facets.facet_counts)(facet_names, request.GET, books)
+        return JSONResponse(data)
+
+
+class AsyncBookDetailView(AsyncCatalogView):
+    @conditional_response()
+    @cache_response()
+    async def get(self, request, pk):
+        try:
+            book = await BookDetailSerializer.optimize(Book.objects.all()).aget(pk=pk)
+        except Book.DoesNotExist:
+            return not_found(Book)
+        return JSONResponse(BookDetailSerializer(book).data)
+
+
+class AsyncAuthorListView(AsyncCatalogView):
+    @conditional_response((Author, BookAuthor))
+    async def get(self, request):
+        authors = AuthorSerializer.optimize(Author.objects.all())
+
+        q = request.GET.get('q')
+        if q:
+            result = search.search_authors(authors, q)
+            if result is None:
+                authors = authors.none()
+            else:
+                authors, rank_ordering = result
+                authors = authors.order_by(rank_ordering, 'id')
+
+        return JSONResponse(AuthorSerializer(await alist(authors), many=True).data)
+
+
+class AsyncAuthorDetailView(AsyncCatalogView):
+    @conditional_response()
+    @cache_response()
+    async def get(self, request, pk):
+        # The author row and the rows of their books do not depend on each other.
+        book_ids = BookAuthor.objects.filter(author_id=pk).values('book_id')
+        author, books = await asyncio.gather(
+            AuthorSerializer.optimize(Author.objects.all()).filter(pk=pk).afirst(),
+            alist(book_list_values(BookListing.objects.filter(pk__in=book_ids).order_by('id'))),
+        )
+        if author is None:
+            return not_found(Author)
+        data = AuthorSerializer(author).data
+        data['books'] = await abook_list_data(books)
+        return JSONResponse(data)
+
+
+class AsyncPublisherListView(AsyncCatalogView):
+    @conditional_response((Publisher,))
+    async def get(self, request):
+        return JSONResponse(PublisherSerializer(await alist(Publisher.objects.all()), many=True).data)
+
+
+class AsyncPublisherDetailView(AsyncCatalogView):
+    @conditional_response()
+    @cache_response()
+    async def get(self, request, pk):
+        publisher, books = await asyncio.gather(
+            Publisher.objects.filter(pk=pk).afirst(),
+            alist(book_list_values(BookListing.objects.filter(publisher_id=pk).order_by('id'))),
+        )
+        if publisher is None:
+            return not_found(Publisher)
+        data = PublisherSerializer(publisher).data
+        data['books'] = await abook_list_data(books)
+        return JSONResponse(data)
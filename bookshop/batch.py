@@ -0,0 +1,306 @@
+from django.conf import settings
+from django.db import models, router, transaction
+from django.db.models import ProtectedError, RestrictedError
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from . import changes, listings, tasks
+from .caching import bump_version
+from .catalog_io import update_rows
+from .models import Book, Author, Publisher, Genre, BookAuthor, BookGenre
+from .signals import batch_delete
+from .serializers import BookBatchSerializer, AuthorBatchSerializer, PublisherBatchSerializer
+
+BATCH_LIMIT = getattr(settings, 'BOOKSHOP_BATCH_LIMIT', 5000)
+
+
+class BatchError(ValueError):
+    """Rejects a whole batch; `errors` holds {'index', 'errors'} for each bad item."""
+
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+def _ids(value):
+    return value if isinstance(value, list) else [value]
+
+
+def protected_ids(model, pks):
+    """Map each of `pks` that a PROTECT foreign key still points at to the name of the referring model."""
+    found = {}
+    for relation in model._meta.related_objects:
+        if relation.many_to_many or relation.on_delete is not models.PROTECT:
+            continue
+        rows = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks})
+        for pk in rows.values_list(relation.field.attname, flat=True).distinct():
+            found.setdefault(pk, relation.related_model._meta.verbose_name_plural)
+    return found
+
+
+def delete_rows(model, pks):
+    """
+    Delete rows and everything that cascades from them, however deep, with
+    batch_delete(). Callers check the PROTECT relations of `model` first, so
+    each item gets its error, and do the catalog signals' work once.
+    """
+    try:
+        batch_delete(model._base_manager.filter(pk__in=pks))
+    except (ProtectedError, RestrictedError) as e:
+        raise BatchError(e.args[0])
+
+
+class BatchWriter:
+    """
+    Creates, updates or deletes up to BATCH_LIMIT objects of one model in a
+    single transaction. Every item is validated before anything is written
+    and one bad item rejects the whole batch, reporting the errors of every
+    item. Each operation costs a fixed number of queries however many items
+    it holds; bulk writes skip model signals, so the search index and the
+    catalog cache are refreshed once per batch instead.
+    """
+    model = None
+    serializer_class = None
+    # Serializer fields that are columns of `model`; the rest are relations.
+    columns = ()
+    # Catalog models whose cached responses a batch makes stale.
+    changed_models = ()
+    # The change feed kind of `model`, when it is not reached through bookshop.listings.
+    feed_kind = None
+
+    def __init__(self, items):
+        if not isinstance(items, list):
+            raise BatchError('Expected a list of items')
+        if not items:
+            raise BatchError('The batch is empty')
+        if len(items) > BATCH_LIMIT:
+            raise BatchError(f'A batch holds at most {BATCH_LIMIT} items')
+        self.items = items
+        self.errors = [{} for _ in items]
+
+    def fail(self, index, field, message):
+        self.errors[index].setdefault(field, []).append(message)
+
+    def raise_errors(self):
+        invalid = [{'index': index, 'errors': errors} for index, errors in enumerate(self.errors) if errors]
+        if invalid:
+            raise BatchError(f'{len(invalid)} of {len(self.items)} items are invalid; nothing was written', invalid)
+
+    def validate(self, partial=False):
+        """Run the serializer over every item; returns validated data, or None for bad items."""
+        serializer = self.serializer_class(data=self.items, many=True, partial=partial)
+        rows = []
+        for index, item in enumerate(self.items):
+            try:
+                rows.append(serializer.child.run_validation(item))
+            except ValidationError as e:
+                rows.append(None)
+                self.errors[index].update(as_serializer_error(e))
+        return rows
+
+    def check_ids(self, rows, field, model):
+        """Flag ids in `field` that do not exist, with one query for the whole batch."""
+        wanted = {pk for row in rows if row and row.get(field) is not None for pk in _ids(row[field])}
+        found = set(model._base_manager.filter(pk__in=wanted).values_list('pk', flat=True)) if wanted else set()
+        for index, row in enumerate(rows):
+            if row and row.get(field) is not None:
+                missing = sorted(set(_ids(row[field])) - found)
+                if missing:
+                    self.fail(index, field, f'Unknown {model._meta.verbose_name} ids: {missing}')
+
+    def check_existing(self, ids):
+        """Flag missing and repeated ids; `ids` holds one id (or None) per item."""
+        found = set(self.model._base_manager.filter(pk__in=[pk for pk in ids if pk]).values_list('pk', flat=True))
+        seen = set()
+        for index, pk in enumerate(ids):
+            if pk is None:
+                continue
+            if pk in seen:
+                self.fail(index, 'id', 'Appears more than once in the batch')
+            elif pk not in found:
+                self.fail(index, 'id', 'Not found')
+            seen.add(pk)
+
+    def check(self, rows):
+        """Validate what needs the database, for all rows at once."""
+
+    def build(self, row):
+        return self.model(**{name: row[name] for name in self.columns if name in row})
+
+    def new(self, row):
+        return self.build(row)
+
+    def created(self, objects, rows):
+        pass
+
+    def updated(self, rows):
+        pass
+
+    def deleted(self, ids):
+        pass
+
+    def changed(self, ids):
+        if self.feed_kind:
+            changes.publish(self.feed_kind, ids)
+        for model in self.changed_models:
+            bump_version(model)
+        tasks.refresh_catalog_cache.delay(sorted(model._meta.model_name for model in self.changed_models))
+
+    def atomic(self):
+        return transaction.atomic(using=router.db_for_write(self.model))
+
+    def create(self):
+        with self.atomic():
+            rows = self.validate()
+            for index, row in enumerate(rows):
+                if row and 'id' in row:
+                    self.fail(index, 'id', 'Only allowed when updating')
+            self.check(rows)
+            self.raise_errors()
+            objects = self.model._default_manager.bulk_create([self.new(row) for row in rows])
+            self.created(objects, rows)
+            self.changed([obj.pk for obj in objects])
+        return [{'index': index, 'id': obj.pk, 'status': 'created'} for index, obj in enumerate(objects)]
+
+    def update(self):
+        """Apply partial updates; items sharing a set of changed fields are written by one statement."""
+        with self.atomic():
+            rows = self.validate(partial=True)
+            for index, row in enumerate(rows):
+                if row is not None and 'id' not in row:
+                    self.fail(index, 'id', 'This field is required.')
+            self.check_existing([row.get('id') if row else None for row in rows])
+            self.check(rows)
+            self.raise_errors()
+
+            now = timezone.now()
+            auto_now = [field.name for field in self.model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+            groups = {}
+            for row in rows:
+                fields = tuple(name for name in self.columns if name in row)
+                if fields:
+                    obj = self.build(row)
+                    obj.pk = row['id']
+                    for name in auto_now:
+                        setattr(obj, name, now)
+                    groups.setdefault(fields, []).append(obj)
+            for fields, objects in groups.items():
+                update_rows(self.model, objects, list(fields) + auto_now)
+            self.updated(rows)
+            self.changed([row['id'] for row in rows])
+        return [{'index': index, 'id': row['id'], 'status': 'updated'} for index, row in enumerate(rows)]
+
+    def delete(self):
+        with self.atomic():
+            ids = []
+            for index, pk in enumerate(self.items):
+                if isinstance(pk, int) and not isinstance(pk, bool) and pk > 0:
+                    ids.append(pk)
+                else:
+                    ids.append(None)
+                    self.fail(index, 'id', 'A valid integer is required.')
+            self.check_existing(ids)
+            protected = protected_ids(self.model, [pk for pk in ids if pk])
+            for index, pk in enumerate(ids):
+                if pk in protected:
+                    self.fail(index, 'id', f'Still referenced by {protected[pk]}')
+            self.check_delete(ids)
+            self.raise_errors()
+            delete_rows(self.model, ids)
+            self.deleted(ids)
+            self.changed(ids)
+        return [{'index': index, 'id': pk, 'status': 'deleted'} for index, pk in enumerate(ids)]
+
+    def check_delete(self, ids):
+        pass
+
+
+class BookBatchWriter(BatchWriter):
+    model = Book
+    serializer_class = BookBatchSerializer
+    columns = (
+        'title', 'description', 'isbn', 'publisher_id', 'price', 'currency', 'stock', 'pages',
+        'published_date', 'cover_url', 'rating',
+    )
+    changed_models = (Book, BookAuthor, BookGenre)
+
+    def check(self, rows):
+        self.check_ids(rows, 'publisher_id', Publisher)
+        self.check_ids(rows, 'authors', Author)
+        self.check_ids(rows, 'genres', Genre)
+
+    def new(self, row):
+        book = super().new(row)
+        book.created_at = timezone.now()
+        book.currency = row.get('currency', 'UAH')
+        return book
+
+    def link(self, links, replace=()):
+        """Write (book_id, author_ids, genre_ids) links; `replace` lists books whose old links go first."""
+        for model, position in ((BookAuthor, 1), (BookGenre, 2)):
+            book_ids = [link[0] for link in links if link[position] is not None]
+            if replace and book_ids:
+                batch_delete(model.objects.filter(book_id__in=book_ids))
+            column = 'author_id' if model is BookAuthor else 'genre_id'
+            model.objects.bulk_create([
+                model(book_id=link[0], **{column: related_id})
+                for link in links if link[position] for related_id in dict.fromkeys(link[position])
+            ])
+
+    def created(self, objects, rows):
+        self.link([(book.pk, row.get('authors'), row.get('genres')) for book, row in zip(objects, rows)])
+        listings.refresh([book.pk for book in objects])
+        tasks.reindex_books.delay(sorted(book.pk for book in objects))
+
+    def updated(self, rows):
+        self.link([(row['id'], row.get('authors'), row.get('genres')) for row in rows], replace=True)
+        listings.refresh([row['id'] for row in rows])
+        tasks.reindex_books.delay(sorted(row['id'] for row in rows))
+
+    def deleted(self, ids):
+        listings.remove(ids)
+        tasks.remove_books.delay(sorted(ids))
+
+
+class AuthorBatchWriter(BatchWriter):
+    model = Author
+    serializer_class = AuthorBatchSerializer
+    columns = ('name', 'bio', 'photo_url')
+    changed_models = (Author,)
+    feed_kind = 'authors'
+
+    def check_delete(self, ids):
+        with_books = set(BookAuthor.objects.filter(author_id__in=[pk for pk in ids if pk]).values_list('author_id', flat=True))
+        for index, pk in enumerate(ids):
+            if pk in with_books:
+                self.fail(index, 'id', 'Author has books')
+
+    def created(self, objects, rows):
+        tasks.reindex_authors.delay(sorted(author.pk for author in objects))
+
+    def updated(self, rows):
+        tasks.reindex_authors.delay(sorted(row['id'] for row in rows))
+        # Book documents carry author names.
+        renamed = [row['id'] for row in rows if 'name' in row]
+        if renamed:
+            listings.refresh_authors(renamed)
+            book_ids = BookAuthor.objects.filter(author_id__in=renamed).values_list('book_id', flat=True)
+            tasks.reindex_books.delay(sorted(set(book_ids)))
+
+    def deleted(self, ids):
+        tasks.remove_authors.delay(sorted(ids))
+
+
+class PublisherBatchWriter(BatchWriter):
+    model = Publisher
+    serializer_class = PublisherBatchSerializer
+    columns = ('name', 'description', 'website')
+    changed_models = (Publisher,)
+    feed_kind = 'publishers'
+
+    def updated(self, rows):
+        listings.refresh_publishers([row['id'] for row in rows if 'name' in row])
+
+    def deleted(self, ids):
+        listings.refresh_publishers(ids)
@@ -0,0 +1,261 @@
+import contextlib
+import datetime
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User as AuthUser
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .models import Book, Author, Publisher, Genre
+
+BENCH_USERNAME = 'benchmark'
+BENCH_PASSWORD = 'benchmark-password'
+SEARCH_WORDS = ['dragon', 'night', 'river', 'garden', 'storm']
+
+# name -> (method, path); the placeholders are filled in by Benchmark.request_args().
+ENDPOINTS = {
+    'books-list': ('GET', '/books/'),
+    'books-list-filtered': ('GET', '/books/?genre={genre}&sort=price_asc'),
+    'books-search': ('GET', '/books/?q={word}'),
+    'books-detail': ('GET', '/books/{book}/'),
+    'authors-list': ('GET', '/authors/'),
+    'authors-detail': ('GET', '/authors/{author}/'),
+    'publishers-detail': ('GET', '/publishers/{publisher}/'),
+    'async-books-list': ('GET', '/async/books/'),
+    'async-books-search': ('GET', '/async/books/?q={word}'),
+    'async-books-detail': ('GET', '/async/books/{book}/'),
+    'async-authors-detail': ('GET', '/async/authors/{author}/'),
+    'async-publishers-detail': ('GET', '/async/publishers/{publisher}/'),
+    'auth-login': ('POST', '/auth/login/'),
+    'auth-login-flood': ('POST', '/auth/login/'),
+    'auth-refresh': ('POST', '/auth/token/refresh/'),
+    'auth-register': ('POST', '/auth/register/'),
+}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def is_error(name, status):
+    """Throttled responses are counted apart, and the login flood expects its wrong passwords to fail."""
+    if status == 429 or (name == 'auth-login-flood' and status == 401):
+        return False
+    return status >= 400
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, errors, elapsed, queries=None, throttled=0, cpu=None):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None  # noqa: E731
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'queries': round(sum(queries) / len(queries), 1) if queries else None,
+        'throttled': throttled,
+        'cpu_ms': ms(sum(cpu) / len(cpu)) if cpu else None,
+    }
+
+
+class Benchmark:
+    """
+    Drives the API endpoints and reports latency percentiles, throughput,
+    throttled (429) responses and, in-process only, SQL queries and CPU time
+    per request.
+
+    Without `base_url` requests go through the Django test client one at a
+    time, in this process; with it they are sent over HTTP by `concurrency`
+    threads to a running server that shares this database. Unless
+    `warm_cache` is set every GET carries a unique `_bench` param, so the
+    response cache and conditional requests never short-circuit the view.
+    In-process runs lift the rate limits unless `throttle` is set, so the
+    auth endpoints measure their real cost; `auth-login-flood` (wrong
+    passwords for random usernames) with `throttle` shows how much CPU a
+    login flood still gets.
+    """
+
+    def __init__(self, requests=100, endpoints=None, base_url=None, concurrency=10, warm_cache=False, seed=0,
+                 throttle=False):
+        unknown = set(endpoints or ()) - set(ENDPOINTS)
+        if unknown:
+            raise BenchmarkError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        self.requests = requests
+        self.endpoints = list(endpoints or ENDPOINTS)
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.concurrency = concurrency
+        self.warm_cache = warm_cache
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.client = Client()
+
+    def run(self):
+        self.ids = {
+            'book': list(Book.objects.values_list('id', flat=True)[:5000]),
+            'author': list(Author.objects.values_list('id', flat=True)[:5000]),
+            'publisher': list(Publisher.objects.values_list('id', flat=True)[:5000]),
+            'genre': list(Genre.objects.values_list('name', flat=True)),
+        }
+        if not self.ids['book'] or not self.ids['author'] or not self.ids['publisher']:
+            raise BenchmarkError('The catalog is empty; run `manage.py seed_catalog` first')
+        if not AuthUser.objects.filter(username=BENCH_USERNAME).exists():
+            AuthUser.objects.create_user(BENCH_USERNAME, f'{BENCH_USERNAME}@example.com', BENCH_PASSWORD)
+        self.refresh_token = None
+
+        rates = settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] if self.throttle else {}
+        # The test client sends Host: testserver, which only a test run allows by itself.
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}, ALLOWED_HOSTS=allowed_hosts,
+        ):
+            results = {name: self.run_endpoint(name) for name in self.endpoints}
+        return {
+            'meta': {
+                'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'mode': 'http' if self.base_url else 'client',
+                'base_url': self.base_url,
+                'concurrency': self.concurrency if self.base_url else 1,
+                'requests_per_endpoint': self.requests,
+                'warm_cache': self.warm_cache,
+                'throttle': self.throttle or self.base_url is not None,
+                'database': connections['default'].vendor,
+                'books': Book.objects.count(),
+                'django': django.get_version(),
+            },
+            'results': results,
+        }
+
+    def request_args(self, name):
+        method, path = ENDPOINTS[name]
+        if method == 'GET':
+            path = path.format(
+                book=self.random.choice(self.ids['book']),
+                author=self.random.choice(self.ids['author']),
+                publisher=self.random.choice(self.ids['publisher']),
+                genre=self.random.choice(self.ids['genre']),
+                word=self.random.choice(SEARCH_WORDS),
+            )
+            if not self.warm_cache:
+                path += ('&' if '?' in path else '?') + f'_bench={uuid.uuid4().hex}'
+            return method, path, None
+        if name == 'auth-login':
+            return method, path, {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}
+        if name == 'auth-login-flood':
+            return method, path, {'username': f'flood-{uuid.uuid4().hex[:12]}', 'password': 'wrong-password'}
+        if name == 'auth-refresh':
+            return method, path, {'refresh': self.get_refresh_token()}
+        username = f'bench-{uuid.uuid4().hex[:12]}'
+        return method, path, {
+            'username': username, 'email': f'{username}@example.com',
+            'password': BENCH_PASSWORD, 'password2': BENCH_PASSWORD,
+        }
+
+    def get_refresh_token(self):
+        if self.refresh_token is None:
+            status, body = self.send('POST', '/auth/login/', {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+            if status != 200:
+                raise BenchmarkError(f'Could not log in as {BENCH_USERNAME} (HTTP {status})')
+            self.refresh_token = json.loads(body)['refresh']
+        return self.refresh_token
+
+    def send(self, method, path, payload):
+        if self.base_url is None:
+            if method == 'GET':
+                response = self.client.get(path, HTTP_ACCEPT='application/json')
+            else:
+                response = self.client.post(path, payload, content_type='application/json')
+            return response.status_code, response.content
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def run_endpoint(self, name):
+        args = [self.request_args(name) for _ in range(self.requests)]
+        if self.base_url is None:
+            return self.run_in_process(name, args)
+        return self.run_over_http(name, args)
+
+    def run_in_process(self, name, args):
+        latencies, queries, cpu, errors, throttled = [], [], [], 0, 0
+        started = time.perf_counter()
+        for method, path, payload in args:
+            with contextlib.ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                begin, begin_cpu = time.perf_counter(), time.process_time()
+                status, _ = self.send(method, path, payload)
+                latencies.append(time.perf_counter() - begin)
+                cpu.append(time.process_time() - begin_cpu)
+            queries.append(sum(len(context) for context in captured))
+            errors += is_error(name, status)
+            throttled += status == 429
+        return summarize(latencies, errors, time.perf_counter() - started, queries, throttled, cpu)
+
+    def run_over_http(self, name, args):
+        latencies, errors, throttled = [], 0, 0
+
+        def call(arg):
+            nonlocal errors, throttled
+            begin = time.perf_counter()
+            try:
+                status, _ = self.send(*arg)
+            except OSError:
+                status = 599
+            elapsed = time.perf_counter() - begin
+            with self.lock:
+                latencies.append(elapsed)
+                errors += is_error(name, status)
+                throttled += status == 429
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            list(pool.map(call, args))
+        return summarize(latencies, errors, time.perf_counter() - started, throttled=throttled)
+
+
+def compare(current, baseline, max_regression=0.2):
+    """
+    Return one message per regression of `current` against `baseline`: p95
+    latency more than `max_regression` (a fraction) slower, more SQL queries
+    per request, or new errors.
+    """
+    problems = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        if before['p95_ms'] and result['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            problems.append(f"{name}: p95 {result['p95_ms']}ms vs {before['p95_ms']}ms")
+        if before['queries'] is not None and result['queries'] is not None and result['queries'] > before['queries']:
+            problems.append(f"{name}: {result['queries']} queries per request vs {before['queries']}")
+        if result['errors'] > before['errors']:
+            problems.append(f"{name}: {result['errors']} errors vs {before['errors']}")
+    return problems
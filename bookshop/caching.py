@@ -0,0 +1,206 @@
+import asyncio
+import functools
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .models import Book, Author, Publisher, Genre, BookAuthor, BookGenre
+from .streaming import stream_format
+
+CATALOG_MODELS = (Book, Author, Publisher, Genre, BookAuthor, BookGenre)
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'BOOKSHOP_RESPONSE_CACHE_TIMEOUT', 300)
+LOCK_TIMEOUT = getattr(settings, 'BOOKSHOP_RESPONSE_CACHE_LOCK_TIMEOUT', 5)
+LOCK_POLL_INTERVAL = 0.05
+# Seconds the counters of single objects are kept; one that expires is seeded again from the clock.
+OBJECT_VERSION_TIMEOUT = 24 * 60 * 60
+
+
+def _key(kind, model):
+    """`model` is a model, or a (model, pk) pair for the counter of one object."""
+    if isinstance(model, tuple):
+        model, pk = model
+        return f'bookshop:{kind}:{model._meta.model_name}:{pk}'
+    return f'bookshop:{kind}:{model._meta.model_name}'
+
+
+def _version_key(model):
+    return _key('version', model)
+
+
+def _modified_key(model):
+    return _key('modified', model)
+
+
+def _timeout(model):
+    return OBJECT_VERSION_TIMEOUT if isinstance(model, tuple) else None
+
+
+def bump_version(model):
+    """Invalidate what was cached under `model`'s counter; a (model, pk) pair moves only that object's."""
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Seed from the clock so an evicted counter never reuses an old version.
+        cache.set(key, time.time_ns(), _timeout(model))
+    cache.set(_modified_key(model), time.time(), _timeout(model))
+
+
+def scoped(models, per_object, pk):
+    """`models` plus the counters of object `pk` of each of `per_object`."""
+    return tuple(models) + tuple((model, pk) for model in per_object)
+
+
+def get_catalog_state(models=CATALOG_MODELS):
+    """
+    Return (versions, last_modified) for `models` in one cache round trip.
+    last_modified is the unix time of the latest recorded change, or None
+    if any of the timestamps has been evicted.
+    """
+    version_keys = [_version_key(model) for model in models]
+    modified_keys = [_modified_key(model) for model in models]
+    values = cache.get_many(version_keys + modified_keys)
+    for model, key in zip(models, version_keys):
+        if key not in values:
+            cache.add(key, time.time_ns(), _timeout(model))
+            values[key] = cache.get(key)
+    versions = [values[key] for key in version_keys]
+    stamps = [values.get(key) for key in modified_keys]
+    last_modified = max(stamps) if None not in stamps else None
+    return versions, last_modified
+
+
+def get_versions(models):
+    return get_catalog_state(models)[0]
+
+
+def versioned_key(prefix, parts, models=CATALOG_MODELS):
+    raw = '|'.join(str(part) for part in list(parts) + get_versions(models))
+    return f'bookshop:{prefix}:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_or_compute(key, compute, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    Return the cached value for `key`, computing it on a miss. Only the
+    worker that takes the lock recomputes; the others poll for its result
+    until the lock times out, so an expired hot key is rebuilt once.
+    `compute` may return None to skip caching.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = key + ':lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
+
+
+def _get_or_lock(key):
+    value = cache.get(key)
+    if value is not None:
+        return value, False
+    return None, cache.add(key + ':lock', 1, LOCK_TIMEOUT)
+
+
+def _set_and_unlock(key, value, timeout):
+    if value is not None:
+        cache.set(key, value, timeout)
+    cache.delete(key + ':lock')
+
+
+async def aget_or_compute(key, compute, timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    get_or_compute() for async callers; `compute` is a coroutine function.
+    Cache calls are grouped so a hit costs one trip to the sync thread and a
+    miss two, since each trip queues behind every other request's queries.
+    """
+    value, locked = await sync_to_async(_get_or_lock)(key)
+    if value is not None:
+        return value
+    if locked:
+        try:
+            value = await compute()
+        finally:
+            await sync_to_async(_set_and_unlock)(key, value, timeout)
+        return value
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        value = await cache.aget(key)
+        if value is not None:
+            return value
+    return await compute()
+
+
+def response_cache_key(request, models=CATALOG_MODELS):
+    params = sorted((name, sorted(values)) for name, values in request.GET.lists())
+    return versioned_key('response', [request.path, params, stream_format(request)], models)
+
+
+def cache_response(models=CATALOG_MODELS, timeout=RESPONSE_CACHE_TIMEOUT, per_object=()):
+    """
+    Cache a view method's 200 response data until any of `models` changes,
+    or the object of `per_object` with the view's `pk` does (bump_version()
+    with a (model, pk) pair). Streamed responses are not cached. Async view
+    methods are supported; their view class rebuilds a cached response
+    through its `response_class`.
+    """
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                response = None
+
+                async def compute():
+                    nonlocal response
+                    response = await method(view, request, *args, **kwargs)
+                    if response.status_code == 200:
+                        return response.data
+                    return None
+
+                key = await sync_to_async(response_cache_key)(request, scoped(models, per_object, kwargs.get('pk')))
+                data = await aget_or_compute(key, compute, timeout)
+                if response is not None:
+                    return response
+                return view.response_class(data)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if stream_format(request):
+                return method(view, request, *args, **kwargs)
+            response = None
+
+            def compute():
+                nonlocal response
+                response = method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    return response.data
+                return None
+
+            key = response_cache_key(request, scoped(models, per_object, kwargs.get('pk')))
+            data = get_or_compute(key, compute, timeout)
+            if response is not None:
+                return response
+            return Response(data)
+        return wrapper
+    return decorator
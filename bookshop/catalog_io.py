@@ -0,0 +1,365 @@
+import csv
+import datetime
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import changes, listings, search
+from .caching import CATALOG_MODELS, bump_version
+from .models import Book, Author, Publisher, Genre, BookAuthor, BookGenre
+from .signals import batch_delete
+
+FORMATS = ('csv', 'jsonl')
+BATCH_SIZE = 2000
+# CSV cells holding several authors or genres separate them with this.
+LIST_SEPARATOR = '|'
+# The largest stock or page count an IntegerField holds on every backend.
+MAX_COUNT = 2 ** 31 - 1
+
+FIELDS = [
+    'isbn', 'title', 'description', 'publisher', 'authors', 'genres', 'price', 'currency',
+    'stock', 'pages', 'published_date', 'cover_url', 'rating',
+]
+BOOK_COPY_FIELDS = [
+    'title', 'description', 'price', 'currency', 'stock', 'pages', 'published_date', 'cover_url', 'rating',
+]
+BOOK_UPDATE_FIELDS = [
+    'title', 'description', 'publisher', 'price', 'currency', 'stock', 'pages',
+    'published_date', 'cover_url', 'rating', 'updated_at',
+]
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+def guess_format(filename):
+    for fmt in FORMATS:
+        if filename.lower().endswith('.' + fmt):
+            return fmt
+    if filename.lower().endswith('.json') or filename.lower().endswith('.ndjson'):
+        return 'jsonl'
+    raise CatalogImportError(f"Cannot tell the format of {filename}; use one of: {', '.join(FORMATS)}")
+
+
+def read_records(stream, fmt):
+    """
+    Yield one dict per book from a text stream, without reading it all into
+    memory. A JSONL line that is not a JSON object is yielded as the
+    CatalogImportError describing it, so it is reported as a row error.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            for field in ('authors', 'genres'):
+                value = row.get(field) or ''
+                row[field] = [name.strip() for name in value.split(LIST_SEPARATOR) if name.strip()]
+            yield row
+    elif fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield CatalogImportError(f'invalid JSON: {e}')
+                continue
+            yield record if isinstance(record, dict) else CatalogImportError('each line must be a JSON object')
+    else:
+        raise CatalogImportError(f"format must be one of: {', '.join(FORMATS)}")
+
+
+def _check_length(field, value, max_length):
+    if max_length and len(value) > max_length:
+        raise CatalogImportError(f'{field} must be at most {max_length} characters')
+    return value
+
+
+def _text(record, field, max_length=None, strip=True):
+    """A text value of `record`, no longer than the Book column it goes in (or `max_length`)."""
+    value = record.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise CatalogImportError(f'{field} must be text')
+    if strip:
+        value = value.strip()
+    return _check_length(field, value, max_length or Book._meta.get_field(field).max_length)
+
+
+def _names(field, value, model):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, type(None))):
+        raise CatalogImportError(f'{field} must be a list of names')
+    names = [str(name).strip() for name in value or [] if str(name).strip()]
+    for name in names:
+        _check_length(field, name, model._meta.get_field('name').max_length)
+    return names
+
+
+def _clean(record):
+    if isinstance(record, CatalogImportError):
+        raise record
+    title = _text(record, 'title')
+    if not title:
+        raise CatalogImportError('title is required')
+    try:
+        price = Decimal(str(record.get('price')))
+        rating = Decimal(str(record.get('rating') or 0))
+        stock = int(record.get('stock') or 0)
+        pages = int(record.get('pages') or 0)
+    except (InvalidOperation, TypeError, ValueError):
+        raise CatalogImportError('price, rating, stock and pages must be numbers')
+    if not price.is_finite() or not rating.is_finite():
+        raise CatalogImportError('price, rating, stock and pages must be numbers')
+    for field, value in (('price', price), ('rating', rating)):
+        try:
+            Book._meta.get_field(field).run_validators(value)
+        except ValidationError as e:
+            raise CatalogImportError(f'{field}: {" ".join(e.messages)}')
+    if not (0 <= stock <= MAX_COUNT and 0 <= pages <= MAX_COUNT):
+        raise CatalogImportError(f'stock and pages must be between 0 and {MAX_COUNT}')
+    published_date = record.get('published_date') or None
+    if published_date and not isinstance(published_date, datetime.date):
+        try:
+            published_date = parse_date(str(published_date))
+        except ValueError:
+            published_date = None
+        if published_date is None:
+            raise CatalogImportError('published_date must be YYYY-MM-DD')
+    return {
+        'isbn': _text(record, 'isbn'),
+        'title': title,
+        'description': _text(record, 'description', strip=False),
+        'publisher': _text(record, 'publisher', Publisher._meta.get_field('name').max_length),
+        'authors': _names('authors', record.get('authors'), Author),
+        'genres': _names('genres', record.get('genres'), Genre),
+        'price': price,
+        'currency': _text(record, 'currency') or 'UAH',
+        'stock': stock,
+        'pages': pages,
+        'published_date': published_date,
+        'cover_url': _text(record, 'cover_url'),
+        'rating': rating,
+    }
+
+
+def _book_key(isbn, title, publisher_id):
+    """What identifies a book on import: its ISBN, else its title and publisher."""
+    return isbn if isbn else ('', title, publisher_id)
+
+
+def update_rows(model, objects, field_names):
+    """
+    Write `field_names` of `objects` with one prepared UPDATE run through
+    executemany. bulk_update() would build a CASE expression per column and
+    row, which dominates the cost of large re-imports and batch edits.
+    """
+    objects = list(objects)
+    if not objects:
+        return
+    connection = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(name) for name in field_names]
+    assignments = ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields)
+    pk_column = connection.ops.quote_name(model._meta.pk.column)
+    sql = f'UPDATE {connection.ops.quote_name(model._meta.db_table)} SET {assignments} WHERE {pk_column} = %s'
+    params = [
+        [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields] + [obj.pk]
+        for obj in objects
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+class CatalogImporter:
+    """
+    Upserts books in batches, matched by ISBN, or by title and publisher
+    for books without one. Publishers, authors and genres are
+    resolved through name -> id maps held in memory and created in bulk the
+    first time a name is seen; each batch then costs a fixed number of
+    queries no matter how many rows it holds.
+
+    Bulk writes skip model signals, so the search index is refreshed per
+    batch and the catalog cache versions are bumped once at the end.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.publishers = dict(Publisher.objects.values_list('name', 'id'))
+        self.authors = dict(Author.objects.values_list('name', 'id'))
+        self.genres = dict(Genre.objects.values_list('name', 'id'))
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+
+    def run(self, records):
+        batch = []
+        for line, record in enumerate(records, start=1):
+            try:
+                batch.append(_clean(record))
+            except CatalogImportError as e:
+                self.errors.append({'row': line, 'error': str(e)})
+                continue
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        for model in CATALOG_MODELS:
+            bump_version(model)
+        return self.result()
+
+    def result(self):
+        return {'created': self.created, 'updated': self.updated, 'unchanged': self.unchanged, 'errors': self.errors}
+
+    def resolve(self, lookup, model, names, kind, **defaults):
+        missing = {name for name in names if name not in lookup}
+        if missing:
+            model.objects.bulk_create([model(name=name, **defaults) for name in missing], ignore_conflicts=True)
+            created = dict(model.objects.filter(name__in=missing).values_list('name', 'id'))
+            lookup.update(created)
+            changes.publish(kind, created.values())
+
+    @transaction.atomic
+    def write_batch(self, rows):
+        self.resolve(self.publishers, Publisher, {row['publisher'] for row in rows if row['publisher']}, 'publishers')
+        self.resolve(self.authors, Author, {name for row in rows for name in row['authors']}, 'authors', bio='')
+        self.resolve(self.genres, Genre, {name for row in rows for name in row['genres']}, 'genres')
+
+        isbns = [row['isbn'] for row in rows if row['isbn']]
+        titles = [row['title'] for row in rows if not row['isbn']]
+        existing = {}
+        for book in Book.objects.filter(Q(isbn__in=isbns) | Q(isbn='', title__in=titles)).order_by('id'):
+            existing.setdefault(_book_key(book.isbn, book.title, book.publisher_id), book)
+        current_links = self.current_links([book.pk for book in existing.values()])
+
+        now = timezone.now()
+        to_create, to_update, relink = [], {}, {}
+        for row in rows:
+            publisher_id = self.publishers.get(row['publisher'])
+            key = _book_key(row['isbn'], row['title'], publisher_id)
+            book = existing.get(key)
+            if book is None:
+                book = existing[key] = Book(created_at=now, isbn=row['isbn'])
+                to_create.append(book)
+            values = {field: row[field] for field in BOOK_COPY_FIELDS}
+            values['publisher_id'] = publisher_id
+            links = (
+                {self.authors[name] for name in row['authors']},
+                {self.genres[name] for name in row['genres']},
+            )
+            if book.pk:
+                # Unchanged rows cost nothing, so re-importing a feed only writes what moved.
+                if any(getattr(book, field) != value for field, value in values.items()):
+                    to_update[book.pk] = book
+                if current_links.get(book.pk, (set(), set())) != links:
+                    relink[book.pk] = links
+            for field, value in values.items():
+                setattr(book, field, value)
+            book.updated_at = now
+            row['book'] = book
+            row['links'] = links
+
+        Book.objects.bulk_create(to_create)
+        self.update_books(to_update.values())
+        created_ids = {book.pk for book in to_create}
+        changed_ids = set(to_update) | set(relink)
+        for row in rows:
+            if row['book'].pk in created_ids:
+                relink[row['book'].pk] = row['links']
+
+        # The links' own signals leave the listings and the search index to the end of the batch.
+        for model in (BookAuthor, BookGenre):
+            batch_delete(model.objects.filter(book_id__in=[pk for pk in relink if current_links.get(pk)]))
+        BookAuthor.objects.bulk_create([
+            BookAuthor(book_id=book_id, author_id=author_id)
+            for book_id, (author_ids, _) in relink.items() for author_id in author_ids
+        ], ignore_conflicts=True)
+        BookGenre.objects.bulk_create([
+            BookGenre(book_id=book_id, genre_id=genre_id)
+            for book_id, (_, genre_ids) in relink.items() for genre_id in genre_ids
+        ], ignore_conflicts=True)
+
+        listings.refresh(created_ids | changed_ids)
+        search.reindex_books(created_ids | changed_ids)
+        self.created += len(created_ids)
+        self.updated += len(changed_ids)
+        self.unchanged += len({row['book'].pk for row in rows} - created_ids - changed_ids)
+
+    def update_books(self, books):
+        update_rows(Book, books, BOOK_UPDATE_FIELDS)
+
+    def current_links(self, book_ids):
+        links = {}
+        for book_id, author_id in BookAuthor.objects.filter(book_id__in=book_ids).values_list('book_id', 'author_id'):
+            links.setdefault(book_id, (set(), set()))[0].add(author_id)
+        for book_id, genre_id in BookGenre.objects.filter(book_id__in=book_ids).values_list('book_id', 'genre_id'):
+            links.setdefault(book_id, (set(), set()))[1].add(genre_id)
+        return links
+
+
+def import_catalog(stream, fmt, batch_size=BATCH_SIZE):
+    return CatalogImporter(batch_size).run(read_records(stream, fmt))
+
+
+def export_records(queryset=None, chunk_size=BATCH_SIZE):
+    """Yield one dict per book, loading authors and genres a chunk at a time."""
+    if queryset is None:
+        queryset = Book.objects.all()
+    queryset = queryset.select_related('publisher').order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        ids = [book.id for book in chunk]
+        authors, genres = {}, {}
+        for book_id, name in BookAuthor.objects.filter(book_id__in=ids).order_by('id').values_list('book_id', 'author__name'):
+            authors.setdefault(book_id, []).append(name)
+        for book_id, name in BookGenre.objects.filter(book_id__in=ids).order_by('id').values_list('book_id', 'genre__name'):
+            genres.setdefault(book_id, []).append(name)
+        for book in chunk:
+            yield {
+                'isbn': book.isbn,
+                'title': book.title,
+                'description': book.description,
+                'publisher': book.publisher.name if book.publisher else '',
+                'authors': authors.get(book.id, []),
+                'genres': genres.get(book.id, []),
+                'price': str(book.price),
+                'currency': book.currency,
+                'stock': book.stock,
+                'pages': book.pages,
+                'published_date': book.published_date.isoformat() if book.published_date else '',
+                'cover_url': book.cover_url,
+                'rating': str(book.rating),
+            }
+        last_id = ids[-1]
+
+
+def export_lines(fmt, queryset=None, chunk_size=BATCH_SIZE):
+    """Yield the export as text chunks (a header, then one line per book)."""
+    if fmt not in FORMATS:
+        raise CatalogImportError(f"format must be one of: {', '.join(FORMATS)}")
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    if fmt == 'csv':
+        writer.writeheader()
+    for record in export_records(queryset, chunk_size):
+        if fmt == 'csv':
+            record['authors'] = LIST_SEPARATOR.join(record['authors'])
+            record['genres'] = LIST_SEPARATOR.join(record['genres'])
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
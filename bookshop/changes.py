@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Seconds a published change stays readable; a process that falls further behind rebuilds.
+FEED_TIMEOUT = getattr(settings, 'BOOKSHOP_CHANGE_FEED_TIMEOUT', 24 * 60 * 60)
+# A reader this many changes behind rebuilds instead of catching up.
+MAX_BACKLOG = 1000
+# Seconds a change may stay missing after a later one is readable, while its writer stores it.
+GRACE = 5
+SEQUENCE_KEY = 'bookshop:changes:sequence'
+KINDS = ('books', 'authors', 'publishers', 'genres')
+
+
+def _entry_key(position):
+    return f'bookshop:changes:{position}'
+
+
+def publish(kind, ids=None):
+    """
+    Tell the in-memory indexes of every process that the `kind` rows with
+    `ids` changed, once the transaction commits. `ids` of None means the
+    whole kind changed. Readers re-read those rows, so publishing an id
+    twice, or one that did not change, only costs a lookup.
+    """
+    if ids is not None:
+        ids = sorted(set(ids))
+        if not ids:
+            return
+    transaction.on_commit(lambda: _append(kind, ids))
+
+
+def _append(kind, ids):
+    try:
+        position = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, None)
+        position = cache.incr(SEQUENCE_KEY)
+    cache.set(_entry_key(position), (kind, ids), FEED_TIMEOUT)
+
+
+def current():
+    return cache.get(SEQUENCE_KEY) or 0
+
+
+class Reader:
+    """
+    A position in the change feed. Start it before reading the state it
+    follows, so changes committed meanwhile are read again rather than lost.
+    """
+
+    def __init__(self):
+        self.position = None
+        self.missing_since = None
+
+    def start(self):
+        self.position = current()
+        self.missing_since = None
+
+    def read(self):
+        """
+        The (kind, ids) changes published since the last read, or None when
+        some are gone (expired, evicted, or too many) and the reader's state
+        has to be rebuilt. Costs one cache read when nothing changed.
+        """
+        end = current()
+        if end < self.position or end - self.position > MAX_BACKLOG:
+            return None
+        if end == self.position:
+            return []
+        keys = [_entry_key(position) for position in range(self.position + 1, end + 1)]
+        entries = cache.get_many(keys)
+        found = []
+        for key in keys:
+            if key not in entries:
+                break
+            found.append(entries[key])
+        self.position += len(found)
+        if len(found) < len(keys):
+            # Its writer may not have stored it yet; a change still missing after GRACE is lost.
+            now = time.monotonic()
+            if found or self.missing_since is None:
+                self.missing_since = now
+            elif now - self.missing_since > GRACE:
+                return None
+        else:
+            self.missing_since = None
+        return found
@@ -0,0 +1,71 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .caching import CATALOG_MODELS, get_catalog_state, response_cache_key, scoped
+
+
+def get_validators(request, models=CATALOG_MODELS):
+    """Return (etag, last_modified) for a catalog GET; last_modified is unix seconds or None."""
+    etag = response_cache_key(request, models).rsplit(':', 1)[-1]
+    # Cached data is shared by every format; the rendered bytes are not.
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is not None and renderer.format != 'json':
+        etag = f'{etag}.{renderer.format}'
+    etag = quote_etag(etag)
+    # Without a recorded stamp (a restart, an eviction) the ETag alone answers: no
+    # column moves on deletes or relation changes, so none can stand in for it.
+    last_modified = get_catalog_state(models)[1]
+    if last_modified is not None:
+        last_modified = int(last_modified)
+    return etag, last_modified
+
+
+def conditional_response(models=CATALOG_MODELS, per_object=()):
+    """
+    Answer If-None-Match / If-Modified-Since on a GET view method with a 304
+    before the view body runs.
+
+    The ETag is the response cache key (path, query params and the version
+    counters of `models`), so answering needs no query. Every write path moves
+    a counter: model signals for saves, deletes and relation changes, the bulk
+    writers for theirs, and bookshop.listings for QuerySet.update() writes
+    (stock, holds, popularity). Last-Modified comes from the change
+    timestamps recorded next to the counters, and is left out while any of
+    them is missing from the cache. `per_object` models are versioned by the view's
+    `pk`, as with cache_response().
+    """
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                etag, last_modified = await sync_to_async(get_validators)(
+                    request, scoped(models, per_object, kwargs.get('pk')),
+                )
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is not None:
+                    return response
+                return _add_validators(await method(view, request, *args, **kwargs), etag, last_modified)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            etag, last_modified = get_validators(request, scoped(models, per_object, kwargs.get('pk')))
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+            return _add_validators(method(view, request, *args, **kwargs), etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def _add_validators(response, etag, last_modified):
+    patch_vary_headers(response, ('Accept',))
+    if response.status_code == 200:
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+    return response
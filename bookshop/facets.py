@@ -0,0 +1,353 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from itertools import chain
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import changes, routers
+from .filters import BookFilterBackend, FilterError, parse_id
+from .models import BookListing
+
+FACETS = ('genre', 'publisher', 'author', 'price', 'rating')
+# Band edges: prices below 10, 10 to 20, ..., 500 and up.
+PRICE_BANDS = [Decimal(edge) for edge in getattr(settings, 'BOOKSHOP_PRICE_FACETS', [10, 20, 50, 100, 200, 500])]
+RATING_BANDS = [Decimal(edge) for edge in (1, 2, 3, 4)]
+# Most publishers and authors listed, by count.
+FACET_LIMIT = getattr(settings, 'BOOKSHOP_FACET_LIMIT', 20)
+# Seconds between applying the listing changes published to the change feed, on a thread of each process;
+# 0 applies them on the requests instead (tests, and a single-threaded development server).
+SYNC_INTERVAL = getattr(settings, 'BOOKSHOP_FACET_SYNC_INTERVAL', 1)
+# A sync that finds more changed listings than this rebuilds instead.
+REBUILD_ROWS = 5000
+READ_BATCH_SIZE = 1000
+# The BookFilterBackend filters the index applies itself; any other goes through the queryset.
+INDEXED_FILTERS = ('authorId', 'publisherId', 'genre', 'inStock')
+COLUMNS = ('id', 'publisher_id', 'publisher_name', 'authors', 'genres', 'price', 'rating', 'in_stock')
+# The set bit positions of each byte value.
+_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def bitmap(ids):
+    """An int with bit n set for each book id n."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        bits[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _group(book_ids, keys):
+    groups = {}
+    for book_id in book_ids:
+        for key in keys(book_id):
+            groups.setdefault(key, []).append(book_id)
+    return groups
+
+
+def members(bits):
+    """The book ids set in a bitmap, ascending."""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        if byte:
+            base = index * 8
+            for bit in _BITS[byte]:
+                yield base + bit
+
+
+def _band(edges, value):
+    return None if value is None else bisect.bisect_right(edges, value)
+
+
+def _values(row):
+    """(publisher_id, author_ids, genre_ids, price band, rating band, in_stock) of a listing row."""
+    return (
+        row['publisher_id'],
+        tuple(pk for pk, _ in row['authors']),
+        tuple(pk for pk, _ in row['genres']),
+        _band(PRICE_BANDS, row['price']),
+        _band(RATING_BANDS, row['rating']),
+        row['in_stock'],
+    )
+
+
+def _bitmap_keys(values):
+    publisher_id, author_ids, genre_ids, price, rating, in_stock = values
+    keys = [('genre', pk) for pk in genre_ids]
+    keys += [('price', price), ('rating', rating)]
+    if in_stock:
+        keys.append(('inStock', True))
+    return keys
+
+
+def _posting_keys(values):
+    publisher_id, author_ids = values[:2]
+    keys = [('author', pk) for pk in author_ids]
+    if publisher_id is not None:
+        keys.append(('publisher', publisher_id))
+    return keys
+
+
+def _add_names(names, row):
+    for facet, column in (('author', 'authors'), ('genre', 'genres')):
+        names[facet].update(row[column])
+    if row['publisher_id'] is not None:
+        names['publisher'][row['publisher_id']] = row['publisher_name']
+
+
+class FacetIndex:
+    """
+    An in-memory index of the book listings for counting facet values.
+
+    Genres, price and rating bands and the stock flag have few values, so
+    each value keeps a bitmap of its books (a Python int, bit n = book id n)
+    and counting under a filter is one AND and a popcount. Publishers and
+    authors have thousands of values with a few books each, so they keep
+    sets of book ids instead. apply() changes the index in place with the
+    listings the change feed names; readers hold `lock`.
+    """
+
+    def __init__(self, books, names, bitmaps, postings):
+        self.books = books
+        self.names = names
+        self.bitmaps = bitmaps
+        self.postings = postings
+        self.all = bitmap(books)
+        self.lock = threading.Lock()
+        self._totals = {}
+
+    @classmethod
+    def build(cls):
+        books = {}
+        names = {'genre': {}, 'publisher': {}, 'author': {}}
+        for row in BookListing.objects.values(*COLUMNS).iterator(chunk_size=2000):
+            books[row['id']] = _values(row)
+            _add_names(names, row)
+        groups, postings = {}, {}
+        for book_id, values in books.items():
+            for key in _bitmap_keys(values):
+                groups.setdefault(key, []).append(book_id)
+            for key in _posting_keys(values):
+                postings.setdefault(key, set()).add(book_id)
+        bitmaps = {key: bitmap(ids) for key, ids in groups.items()}
+        return cls(books, names, bitmaps, postings)
+
+    def apply(self, book_ids, rows):
+        """
+        Replace the listings `book_ids` with `rows`, read after they changed;
+        an id without a row was deleted. Each bitmap touched costs one AND
+        and one OR, however many of its books changed.
+        """
+        rows = {row['id']: row for row in rows}
+        with self.lock:
+            old = {book_id: self.books.pop(book_id) for book_id in book_ids if book_id in self.books}
+            for book_id, row in rows.items():
+                self.books[book_id] = _values(row)
+                _add_names(self.names, row)
+            cleared = _group(old, lambda book_id: _bitmap_keys(old[book_id]))
+            added = _group(rows, lambda book_id: _bitmap_keys(self.books[book_id]))
+            for key in cleared.keys() | added.keys():
+                bits = self.bitmaps.get(key, 0) & ~bitmap(cleared.get(key, ())) | bitmap(added.get(key, ()))
+                if bits:
+                    self.bitmaps[key] = bits
+                else:
+                    self.bitmaps.pop(key, None)
+            for book_id, values in old.items():
+                for key in _posting_keys(values):
+                    ids = self.postings[key]
+                    ids.discard(book_id)
+                    if not ids:
+                        del self.postings[key]
+            for book_id in rows:
+                for key in _posting_keys(self.books[book_id]):
+                    self.postings.setdefault(key, set()).add(book_id)
+            self.all = self.all & ~bitmap(old) | bitmap(rows)
+            self._totals.clear()
+
+    def filter_bitmap(self, param, value):
+        """The books matching one BookFilterBackend filter, with its values parsed the same way."""
+        if param == 'authorId':
+            return bitmap(self.postings.get(('author', parse_id(param, value)), ()))
+        if param == 'publisherId':
+            return bitmap(self.postings.get(('publisher', parse_id(param, value)), ()))
+        if param == 'genre':
+            if value.isdigit():
+                return self.bitmaps.get(('genre', parse_id(param, value)), 0)
+            genre_ids = [pk for pk, name in self.names['genre'].items() if name == value]
+            return self.bitmaps.get(('genre', genre_ids[0]), 0) if genre_ids else 0
+        if param == 'inStock':
+            in_stock = self.bitmaps.get(('inStock', True), 0)
+            return in_stock if value == 'true' else self.all & ~in_stock
+        raise ValueError(f'{param} is not indexed')
+
+    def _named(self, facet, counts):
+        names = self.names[facet]
+        return [{'id': pk, 'name': names.get(pk, ''), 'count': count} for pk, count in counts if count]
+
+    def _bands(self, facet, edges, mask):
+        bands = []
+        for band in range(len(edges) + 1):
+            count = (mask & self.bitmaps.get((facet, band), 0)).bit_count()
+            if count:
+                bands.append({
+                    'min': str(edges[band - 1]) if band else None,
+                    'max': str(edges[band]) if band < len(edges) else None,
+                    'count': count,
+                })
+        return bands
+
+    def counts(self, facets, mask, limit=FACET_LIMIT):
+        """Book counts per value of each of `facets` among the books in `mask`."""
+        result = {}
+        if 'genre' in facets:
+            genres = [(pk, (mask & self.bitmaps.get(('genre', pk), 0)).bit_count()) for pk in self.names['genre']]
+            result['genre'] = self._named('genre', sorted(genres, key=lambda item: (-item[1], item[0])))
+        if 'price' in facets:
+            result['price'] = self._bands('price', PRICE_BANDS, mask)
+        if 'rating' in facets:
+            result['rating'] = self._bands('rating', RATING_BANDS, mask)
+        for facet in ('publisher', 'author'):
+            if facet in facets:
+                result[facet] = self._named(facet, self._top(facet, mask, limit))
+        return result
+
+    def _top(self, facet, mask, limit):
+        if mask == self.all:
+            # Unfiltered counts are the posting sizes; kept, as they are asked for most.
+            if (facet, limit) not in self._totals:
+                sizes = ((key[1], len(ids)) for key, ids in self.postings.items() if key[0] == facet)
+                self._totals[facet, limit] = heapq.nlargest(limit, sizes, key=lambda item: (item[1], -item[0]))
+            return self._totals[facet, limit]
+        books = self.books
+        if facet == 'author':
+            counts = Counter(chain.from_iterable(books[book_id][1] for book_id in members(mask)))
+        else:
+            counts = Counter(books[book_id][0] for book_id in members(mask))
+            counts.pop(None, None)
+        return heapq.nlargest(limit, counts.items(), key=lambda item: (item[1], -item[0]))
+
+
+logger = logging.getLogger(__name__)
+_index = None
+_feed = changes.Reader()
+# Held while the index is built or synced; requests only take it for the first build.
+_lock = threading.Lock()
+_syncer = None
+
+
+def _start():
+    # Started first, so listings committed while the index is read are applied again rather than lost.
+    _feed.start()
+    return FacetIndex.build()
+
+
+def _read(book_ids):
+    book_ids = sorted(book_ids)
+    rows = []
+    for start in range(0, len(book_ids), READ_BATCH_SIZE):
+        batch = book_ids[start:start + READ_BATCH_SIZE]
+        rows += BookListing.objects.filter(pk__in=batch).values(*COLUMNS)
+    return rows
+
+
+def sync():
+    """
+    Apply the listing changes published since the last sync, rebuilding
+    when some were lost or too many. The rows are read on the primary, so a
+    lagging replica cannot hand back the listing from before the change.
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            return
+        token = routers.pin_to_primary()
+        try:
+            found = _feed.read()
+            book_ids = set()
+            for kind, ids in found or ():
+                if kind == 'books':
+                    if ids is None:
+                        found = None
+                        break
+                    book_ids.update(ids)
+            if found is None or len(book_ids) > REBUILD_ROWS:
+                _index = _start()
+            elif book_ids:
+                _index.apply(book_ids, _read(book_ids))
+        finally:
+            routers.release(token)
+
+
+def _follow():
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        try:
+            sync()
+        except Exception:
+            logger.exception('Facet index sync failed')
+        finally:
+            close_old_connections()
+
+
+def get_index():
+    """
+    The process's facet index. It is built on first use, then a thread
+    applies the change feed every SYNC_INTERVAL seconds, so a request never
+    polls the database; with SYNC_INTERVAL 0 the request applies it.
+    """
+    global _index, _syncer
+    if _index is None:
+        with _lock:
+            if _index is None:
+                token = routers.pin_to_primary()
+                try:
+                    _index = _start()
+                finally:
+                    routers.release(token)
+            if SYNC_INTERVAL and _syncer is None:
+                _syncer = threading.Thread(target=_follow, name='bookshop-facets', daemon=True)
+                _syncer.start()
+    elif not SYNC_INTERVAL:
+        sync()
+    return _index
+
+
+def requested(params):
+    """The facets asked for with `facets=genre,price,...`."""
+    value = params.get('facets')
+    if not value:
+        return ()
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FACETS]
+    if unknown:
+        raise FilterError(f"Unknown facets: {', '.join(unknown)}. Choose from: {', '.join(FACETS)}")
+    return tuple(dict.fromkeys(names))
+
+
+def facet_counts(facets, params, queryset):
+    """
+    Counts for `facets` over the books `queryset` lists. The filters are
+    applied to the index's bitmaps; a search (or a filter the index does not
+    know) falls back to reading the matching ids from `queryset`.
+    """
+    index = get_index()
+    active = {param: params.get(param) for param in BookFilterBackend.filters if params.get(param)}
+    matched = None
+    if params.get('q') or any(param not in INDEXED_FILTERS for param in active):
+        # Read before taking the lock, so the query does not hold up the sync.
+        matched = bitmap(queryset.order_by().values_list('id', flat=True))
+    with index.lock:
+        if matched is not None:
+            mask = matched & index.all
+        else:
+            mask = index.all
+            for param, value in active.items():
+                mask &= index.filter_bitmap(param, value)
+        return index.counts(facets, mask)
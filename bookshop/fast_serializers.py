@@ -0,0 +1,205 @@
+import asyncio
+from decimal import Decimal
+from operator import itemgetter
+
+from .instrumentation import serializing
+from .models import Author, Publisher
+from .serializers import AuthorSerializer
+
+CHUNK_SIZE = 500
+
+# The BookListSerializer fields, in output order, and the nested fields each relation can return.
+BOOK_LIST_FIELDS = ('id', 'title', 'authors', 'publisher', 'price', 'currency', 'stock', 'rating', 'genres', 'cover_url')
+RELATION_FIELDS = {
+    'authors': ('id', 'name', 'bio', 'photo_url', 'book_count'),
+    'publisher': ('id', 'name', 'description', 'website'),
+    'genres': ('id', 'name'),
+}
+
+_CENTS = Decimal('0.01')
+
+
+def _decimal(value):
+    # Same output as serializers.DecimalField(decimal_places=2) with COERCE_DECIMAL_TO_STRING.
+    if value is None:
+        return None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value).strip())
+    return '{:f}'.format(value.quantize(_CENTS))
+
+
+class FieldsetError(ValueError):
+    pass
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+
+class BookFieldset:
+    """
+    The parts of a book listing a client asked for. `fields` names the book
+    fields to return (`id` always comes along). A relation named there comes
+    back as ids, or as objects when it is also in `expand`; `authors.name`
+    style entries expand a relation with just those nested fields. Only the
+    columns and lookups the fieldset needs are queried.
+    """
+
+    def __init__(self, fields=None, expand=()):
+        selected = {'id'}
+        nested = {}
+        for name in BOOK_LIST_FIELDS if fields is None else fields:
+            base, _, sub = name.partition('.')
+            if base not in BOOK_LIST_FIELDS or (sub and sub not in RELATION_FIELDS.get(base, ())):
+                raise FieldsetError(f'Unknown field: {name}')
+            selected.add(base)
+            if sub:
+                nested.setdefault(base, {'id'}).add(sub)
+            elif fields is None and base in RELATION_FIELDS:
+                nested[base] = set(RELATION_FIELDS[base])
+        for name in expand:
+            if name not in RELATION_FIELDS:
+                raise FieldsetError(f'Cannot expand: {name}')
+            selected.add(name)
+            nested.setdefault(name, set(RELATION_FIELDS[name]))
+        self.fields = tuple(name for name in BOOK_LIST_FIELDS if name in selected)
+        self.expand = {
+            name: tuple(field for field in RELATION_FIELDS[name] if field in nested[name]) for name in nested
+        }
+        columns = []
+        for name in self.fields:
+            if name == 'publisher':
+                columns.append('publisher_id')
+                if 'publisher' in self.expand:
+                    columns.append('publisher_name')
+            else:
+                columns.append(name)
+        self.columns = tuple(columns)
+
+    def queries(self, relation):
+        """Whether the expanded `relation` needs fields the listing does not store (it keeps ids and names)."""
+        return relation in self.expand and not set(self.expand[relation]) <= {'id', 'name'}
+
+    @classmethod
+    def from_params(cls, params):
+        """
+        The fieldset for `?fields=` and `?expand=`, both comma separated. With
+        neither, every field with every relation expanded, as BookListSerializer
+        returns them; with only `expand`, the plain fields plus those relations.
+        """
+        fields, expand = params.get('fields'), params.get('expand')
+        if fields is None and expand is None:
+            return FULL_FIELDSET
+        if fields is None:
+            fields = ','.join(name for name in BOOK_LIST_FIELDS if name not in RELATION_FIELDS)
+        return cls(_split(fields), _split(expand))
+
+
+FULL_FIELDSET = BookFieldset()
+
+
+def book_list_values(queryset, *extra, fieldset=FULL_FIELDSET):
+    """A BookListing queryset as dict rows; `extra` adds columns such as the keyset ordering."""
+    extra = [name.lstrip('-') for name in extra]
+    return queryset.values(*fieldset.columns, *[name for name in extra if name not in fieldset.columns])
+
+
+def _relation_queries(rows, fieldset):
+    """
+    The lookups book_list_data() needs for `rows`, as a dict of unevaluated
+    querysets. Listing rows carry the ids and names of their authors, genres
+    and publisher, so only fields beyond those cost a query.
+    """
+    queries = {}
+    if fieldset.queries('authors'):
+        authors = Author.objects.filter(pk__in={author[0] for row in rows for author in row['authors']})
+        if 'book_count' in fieldset.expand['authors']:
+            authors = authors.annotate(**AuthorSerializer.annotations)
+        queries['authors'] = authors.values(*fieldset.expand['authors'])
+    if fieldset.queries('publisher'):
+        queries['publishers'] = (
+            Publisher.objects.filter(id__in={row['publisher_id'] for row in rows if row['publisher_id']})
+            .values(*fieldset.expand['publisher'])
+        )
+    return queries
+
+
+def _stored(fields):
+    """Build the nested objects of an expanded relation from the [id, name] pairs of a listing row."""
+    if 'name' in fields:
+        return lambda pairs: [{'id': pk, 'name': name} for pk, name in pairs]
+    return lambda pairs: [{'id': pk} for pk, name in pairs]
+
+
+def _relation_getter(relation, fieldset, related):
+    if relation not in fieldset.expand:
+        return lambda row: [pair[0] for pair in row[relation]]
+    if relation in related:
+        objects = {obj['id']: obj for obj in related[relation]}
+        return lambda row: [objects[pair[0]] for pair in row[relation]]
+    stored = _stored(fieldset.expand[relation])
+    return lambda row: stored(row[relation])
+
+
+def _publisher_getter(fieldset, related):
+    if 'publisher' not in fieldset.expand:
+        return itemgetter('publisher_id')
+    if 'publishers' in related:
+        publishers = {publisher['id']: publisher for publisher in related['publishers']}
+        return lambda row: publishers.get(row['publisher_id'])
+    stored = _stored(fieldset.expand['publisher'])
+    return lambda row: stored([(row['publisher_id'], row['publisher_name'])])[0] if row['publisher_id'] else None
+
+
+def _build(rows, fieldset, related):
+    getters = {
+        'authors': _relation_getter('authors', fieldset, related),
+        'genres': _relation_getter('genres', fieldset, related),
+        'publisher': _publisher_getter(fieldset, related),
+        'price': lambda row: _decimal(row['price']),
+        'rating': lambda row: _decimal(row['rating']),
+    }
+    fields = [(name, getters.get(name, itemgetter(name))) for name in fieldset.fields]
+    return [{name: get(row) for name, get in fields} for row in rows]
+
+
+def book_list_data(rows, fieldset=FULL_FIELDSET):
+    """
+    Build exactly what BookListSerializer(many=True).data gives for the
+    books in `rows` (dicts from book_list_values()), without model
+    instances or nested serializer fields, trimmed to `fieldset`. Costs at
+    most two queries however many rows there are, and none unless authors
+    or the publisher are expanded beyond their ids and names.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    related = {name: list(queryset) for name, queryset in _relation_queries(rows, fieldset).items()}
+    with serializing():
+        return _build(rows, fieldset, related)
+
+
+async def abook_list_data(rows, fieldset=FULL_FIELDSET):
+    """book_list_data() for async views, awaiting the lookups together."""
+    if not rows:
+        return []
+    queries = _relation_queries(rows, fieldset)
+    results = await asyncio.gather(*[_alist(queryset) for queryset in queries.values()])
+    with serializing():
+        return _build(rows, fieldset, dict(zip(queries, results)))
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
+
+
+def iter_book_list(queryset, chunk_size=CHUNK_SIZE, fieldset=FULL_FIELDSET):
+    """Yield book_list_data() for a queryset of any size, one chunk of rows in memory at a time."""
+    chunk = []
+    for row in book_list_values(queryset, fieldset=fieldset).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from book_list_data(chunk, fieldset)
+            chunk = []
+    if chunk:
+        yield from book_list_data(chunk, fieldset)
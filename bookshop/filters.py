@@ -0,0 +1,80 @@
+from .models import BookAuthor, BookGenre
+
+# The largest id a 64-bit primary key can hold; larger values overflow the database driver.
+MAX_ID = 2 ** 63 - 1
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_id(name, value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise FilterError(f'{name} must be an integer')
+    if not 1 <= value <= MAX_ID:
+        raise FilterError(f'{name} must be between 1 and {MAX_ID}')
+    return value
+
+
+def filter_author(queryset, value):
+    author_id = parse_id('authorId', value)
+    return queryset.filter(id__in=BookAuthor.objects.filter(author_id=author_id).values('book_id'))
+
+
+def filter_publisher(queryset, value):
+    return queryset.filter(publisher_id=parse_id('publisherId', value))
+
+
+def filter_genre(queryset, value):
+    if value.isdigit():
+        genres = BookGenre.objects.filter(genre_id=parse_id('genre', value))
+    else:
+        genres = BookGenre.objects.filter(genre__name=value)
+    return queryset.filter(id__in=genres.values('book_id'))
+
+
+def filter_in_stock(queryset, value):
+    if value not in ('true', 'false'):
+        raise FilterError('inStock must be true or false')
+    return queryset.filter(in_stock=value == 'true')
+
+
+class BookFilterBackend:
+    """
+    Query-param filters and sort orders for the book listing, applied to
+    BookListing rows.
+
+    `filters` maps a query param to a function(queryset, value); `sorts` maps
+    a `sort` value to the ordering handed to the paginator. Every filter and
+    ordering here is backed by an index (see BookListing.Meta and the through
+    models' unique constraints); `manage.py check_query_plans` verifies that.
+    """
+    filters = {
+        'authorId': filter_author,
+        'publisherId': filter_publisher,
+        'genre': filter_genre,
+        'inStock': filter_in_stock,
+    }
+    sorts = {
+        'price_asc': ('price',),
+        'price_desc': ('-price',),
+        'popularity': ('-popularity',),
+    }
+    default_ordering = ('created_at',)
+
+    def filter_queryset(self, queryset, params):
+        for param, apply_filter in self.filters.items():
+            value = params.get(param)
+            if value:
+                queryset = apply_filter(queryset, value)
+        return queryset
+
+    def get_ordering(self, params, default=None):
+        sort = params.get('sort')
+        if not sort:
+            return default or self.default_ordering
+        if sort not in self.sorts:
+            raise FilterError(f"sort must be one of: {', '.join(self.sorts)}")
+        return self.sorts[sort]
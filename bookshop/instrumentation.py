@@ -0,0 +1,199 @@
+import bisect
+import contextlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger('bookshop.requests')
+
+# A statement template run this many times in one request is reported as a likely N+1.
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'BOOKSHOP_N_PLUS_ONE_THRESHOLD', 5)
+# Client addresses (REMOTE_ADDR, not X-Forwarded-For) that may read /metrics without a staff session.
+METRICS_ALLOWED_IPS = getattr(settings, 'BOOKSHOP_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+_current = ContextVar('bookshop_request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.templates = Counter()
+        self.statements = Counter()
+
+    def problems(self):
+        """(kind, count, sql) for statements repeated with the same parameters, or templates run N+1 style."""
+        duplicates = {}
+        for (sql, _), count in self.statements.items():
+            if count > 1:
+                duplicates[sql] = max(count, duplicates.get(sql, 0))
+        found = [('duplicate', count, sql) for sql, count in duplicates.items()]
+        found += [
+            ('n+1', count, sql) for sql, count in self.templates.items() if count >= N_PLUS_ONE_THRESHOLD
+        ]
+        return found
+
+
+def start():
+    """Begin collecting metrics for the current request; returns a token for finish()."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper (installed on every connection) that times and counts statements."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+        template = IN_LIST_RE.sub('IN (...)', sql)
+        metrics.templates[template] += 1
+        metrics.statements[(template, repr(params))] += 1
+
+
+@contextlib.contextmanager
+def serializing():
+    """Count the enclosed block as serialization time for the current request."""
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialize_time += time.perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """In-process per-route metrics, rendered in the Prometheus text format by /metrics."""
+    histograms = {
+        'bookshop_request_duration_seconds': ('Time spent handling the request', DURATION_BUCKETS),
+        'bookshop_request_db_seconds': ('Time spent in SQL queries per request', DURATION_BUCKETS),
+        'bookshop_request_serialize_seconds': ('Time spent serializing the response', DURATION_BUCKETS),
+        'bookshop_request_db_queries': ('SQL queries per request', QUERY_BUCKETS),
+        'bookshop_response_bytes': ('Response body size', SIZE_BUCKETS),
+    }
+    counters = {
+        'bookshop_query_problems_total': 'Requests with duplicate or N+1 query patterns',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.series.get(key)
+            if histogram is None:
+                histogram = self.series[key] = Histogram(self.histograms[name][1])
+            histogram.observe(value)
+
+    def increment(self, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            series = sorted(self.series.items())
+        for name, (help_text, _) in self.histograms.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (series_name, labels), histogram in series:
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+        for name, help_text in self.counters.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [
+                f'{name}{_labels(labels)} {value}'
+                for (series_name, labels), value in series if series_name == name
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + [(key, str(value)) for key, value in extra.items()]
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+registry = Registry()
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def finish(request, response, metrics, token):
+    """Stop collecting; add Server-Timing, log the request and update the per-route metrics."""
+    _current.reset(token)
+    total = time.perf_counter() - metrics.started
+    route = route_name(request)
+    size = None if response.streaming else len(response.content)
+
+    response.headers['Server-Timing'] = ', '.join([
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'serialize;dur={metrics.serialize_time * 1000:.1f}',
+    ])
+
+    labels = {'route': route, 'method': request.method}
+    registry.observe('bookshop_request_duration_seconds', labels, total)
+    registry.observe('bookshop_request_db_seconds', labels, metrics.db_time)
+    registry.observe('bookshop_request_serialize_seconds', labels, metrics.serialize_time)
+    registry.observe('bookshop_request_db_queries', labels, metrics.queries)
+    if size is not None:
+        registry.observe('bookshop_response_bytes', labels, size)
+
+    logger.info(json.dumps({
+        'route': route,
+        'method': request.method,
+        'status': response.status_code,
+        'duration_ms': round(total * 1000, 2),
+        'db_queries': metrics.queries,
+        'db_ms': round(metrics.db_time * 1000, 2),
+        'serialize_ms': round(metrics.serialize_time * 1000, 2),
+        'bytes': size,
+    }))
+    for kind, count, sql in metrics.problems():
+        registry.increment('bookshop_query_problems_total', {'route': route, 'kind': kind})
+        logger.warning(json.dumps({'route': route, 'method': request.method, 'problem': kind, 'count': count, 'sql': sql}))
+    return response
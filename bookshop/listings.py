@@ -0,0 +1,204 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+
+from . import changes
+from .caching import bump_version
+from .models import Book, BookAuthor, BookGenre, BookListing, CartItem, Publisher
+
+BATCH_SIZE = 1000
+# Book columns copied as they are; the listing adds in_stock, the publisher name and the relation lists.
+BOOK_COLUMNS = (
+    'title', 'price', 'currency', 'stock', 'rating', 'cover_url', 'created_at', 'popularity', 'publisher_id',
+)
+LISTING_COLUMNS = BOOK_COLUMNS + ('in_stock', 'publisher_name', 'authors', 'genres')
+# Moved by the cart holds in bookshop.orders; refresh() only sets it on new rows.
+HELD_COLUMNS = ('reserved',)
+
+
+def _batches(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _pairs(links):
+    pairs = {}
+    for book_id, related_id, name in links:
+        pairs.setdefault(book_id, []).append([related_id, name])
+    return pairs
+
+
+def linked(listings):
+    """{kind: ids} of the authors, publishers and genres of `listings`, whose popularity is their books'."""
+    found = {'authors': set(), 'publishers': set(), 'genres': set()}
+    for publisher_id, authors, genres in listings:
+        if publisher_id is not None:
+            found['publishers'].add(publisher_id)
+        found['authors'].update(pk for pk, _ in authors)
+        found['genres'].update(pk for pk, _ in genres)
+    return found
+
+
+def _linked(book_ids):
+    return linked(BookListing.objects.filter(pk__in=list(book_ids)).values_list('publisher_id', 'authors', 'genres'))
+
+
+def changed(book_ids=(), names=None):
+    """
+    Drop the cached catalog responses and their ETags once the transaction
+    commits, and publish `book_ids` (None for every book) and the {kind: ids}
+    `names` whose scores moved with them to the change feed the in-memory
+    indexes follow. Every function here that writes listings calls it, so
+    writes made with QuerySet.update(), which send no signals, are covered too.
+    """
+    transaction.on_commit(lambda: bump_version(Book))
+    if book_ids is None:
+        for kind in changes.KINDS:
+            changes.publish(kind)
+        return
+    changes.publish('books', book_ids)
+    for kind, ids in (names or {}).items():
+        changes.publish(kind, ids)
+
+
+def build(book_ids):
+    """The BookListing rows for `book_ids`, computed from the source tables with four queries."""
+    authors = _pairs(
+        BookAuthor.objects.filter(book_id__in=book_ids).order_by('author_id')
+        .values_list('book_id', 'author_id', 'author__name')
+    )
+    genres = _pairs(
+        BookGenre.objects.filter(book_id__in=book_ids).order_by('genre_id')
+        .values_list('book_id', 'genre_id', 'genre__name')
+    )
+    reserved = dict(
+        CartItem.objects.filter(book_id__in=book_ids, held_until__isnull=False).order_by()
+        .values('book_id').annotate(total=Sum('quantity')).values_list('book_id', 'total')
+    )
+    return [
+        BookListing(
+            id=row['id'],
+            **{column: row[column] for column in BOOK_COLUMNS},
+            in_stock=row['stock'] > 0,
+            publisher_name=row['publisher__name'] or '',
+            authors=authors.get(row['id'], []),
+            genres=genres.get(row['id'], []),
+            reserved=reserved.get(row['id'], 0),
+        )
+        for row in Book.objects.filter(pk__in=book_ids).values('id', *BOOK_COLUMNS, 'publisher__name')
+    ]
+
+
+def refresh(book_ids):
+    """Recompute the listing rows of `book_ids`, dropping those whose book is gone."""
+    book_ids = sorted(set(book_ids))
+    names = {}
+    for batch in _batches(book_ids, BATCH_SIZE):
+        listings = build(batch)
+        # The names the books leave are rescored as well as those they join.
+        new = linked((listing.publisher_id, listing.authors, listing.genres) for listing in listings)
+        for found in (_linked(batch), new):
+            for kind, ids in found.items():
+                names.setdefault(kind, set()).update(ids)
+        found = {listing.id for listing in listings}
+        gone = [pk for pk in batch if pk not in found]
+        if gone:
+            BookListing.objects.filter(pk__in=gone).delete()
+        BookListing.objects.bulk_create(
+            listings, update_conflicts=True, unique_fields=['id'], update_fields=LISTING_COLUMNS + ('updated_at',),
+        )
+    changed(book_ids, names)
+
+
+def recount_reserved(book_ids):
+    """Recompute `reserved` from the held cart lines, for repairs; live holds keep it current."""
+    held = (
+        CartItem.objects.filter(book_id=OuterRef('pk'), held_until__isnull=False).order_by()
+        .values('book_id').annotate(total=Sum('quantity')).values('total')
+    )
+    BookListing.objects.filter(pk__in=list(book_ids)).update(reserved=Coalesce(Subquery(held), 0), updated_at=Now())
+    changed()
+
+
+def remove(book_ids):
+    book_ids = list(book_ids)
+    names = _linked(book_ids)
+    BookListing.objects.filter(pk__in=book_ids).delete()
+    changed(book_ids, names)
+
+
+def refresh_authors(author_ids):
+    """After authors are renamed: recompute the listings of their books."""
+    links = BookAuthor.objects.filter(author_id__in=list(author_ids))
+    refresh(links.values_list('book_id', flat=True))
+
+
+def refresh_genres(genre_ids):
+    links = BookGenre.objects.filter(genre_id__in=list(genre_ids))
+    refresh(links.values_list('book_id', flat=True))
+
+
+def refresh_publishers(publisher_ids):
+    """
+    After publishers are renamed or deleted: copy their names onto their
+    books' listings, clearing the publisher of deleted ones, in one UPDATE.
+    """
+    publisher_ids = list(publisher_ids)
+    publishers = Publisher.objects.filter(pk=OuterRef('publisher_id'))
+    rows = BookListing.objects.filter(publisher_id__in=publisher_ids)
+    book_ids = list(rows.values_list('pk', flat=True))
+    rows.update(
+        publisher_id=Subquery(publishers.values('pk')[:1]),
+        publisher_name=Coalesce(Subquery(publishers.values('name')[:1]), Value('')),
+        updated_at=Now(),
+    )
+    changed(book_ids, {'publishers': publisher_ids})
+
+
+def copy_columns(fields, book_ids=None):
+    """
+    Copy `fields` from books onto their listings with one UPDATE, for writes
+    made with QuerySet.update() (stock taken at checkout, popularity).
+    """
+    books = Book.objects.filter(pk=OuterRef('pk'))
+    values = {field: Subquery(books.values(field)[:1]) for field in fields}
+    values['updated_at'] = Now()
+    if 'stock' in fields:
+        values['in_stock'] = Exists(books.filter(stock__gt=0))
+    listings = BookListing.objects.all()
+    if book_ids is not None:
+        book_ids = list(book_ids)
+        listings = listings.filter(pk__in=book_ids)
+    listings.update(**values)
+    changed(book_ids, _linked(book_ids) if book_ids is not None and 'popularity' in fields else None)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Recreate every listing row; returns how many were written."""
+    BookListing.objects.all().delete()
+    book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+    for batch in _batches(book_ids, batch_size):
+        BookListing.objects.bulk_create(build(batch))
+    changed(None)
+    return len(book_ids)
+
+
+def check(batch_size=BATCH_SIZE):
+    """
+    Compare the stored listings with what build() computes now. Returns the
+    ids of books with no listing (`missing`), with a listing that differs
+    (`stale`), and of listings whose book is gone (`orphaned`).
+    """
+    book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+    orphaned = set(BookListing.objects.values_list('pk', flat=True)) - set(book_ids)
+    problems = {'missing': [], 'stale': [], 'orphaned': sorted(orphaned)}
+    for batch in _batches(book_ids, batch_size):
+        columns = LISTING_COLUMNS + HELD_COLUMNS
+        stored = {row['id']: row for row in BookListing.objects.filter(pk__in=batch).values('id', *columns)}
+        for listing in build(batch):
+            row = stored.get(listing.id)
+            if row is None:
+                problems['missing'].append(listing.id)
+            elif any(row[column] != getattr(listing, column) for column in columns):
+                problems['stale'].append(listing.id)
+    return problems
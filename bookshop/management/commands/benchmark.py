@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookshop import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Measure latency, throughput and SQL queries per request of the main API endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint')
+        parser.add_argument('--endpoints', help=f"Comma separated subset of: {', '.join(benchmark.ENDPOINTS)}")
+        parser.add_argument('--url', help='Load-test a running server (sharing this database) instead of the test client')
+        parser.add_argument('--concurrency', type=int, default=10, help='Parallel HTTP requests with --url')
+        parser.add_argument('--warm-cache', action='store_true', help='Let the response cache serve repeated requests')
+        parser.add_argument('--throttle', action='store_true', help='Keep the rate limits for in-process runs')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Fail if the results regress against this JSON file')
+        parser.add_argument('--max-regression', type=float, default=0.2, help='Allowed p95 slowdown, as a fraction')
+
+    def handle(self, *args, **options):
+        endpoints = options['endpoints'].split(',') if options['endpoints'] else None
+        try:
+            report = benchmark.Benchmark(
+                requests=options['requests'], endpoints=endpoints, base_url=options['url'],
+                concurrency=options['concurrency'], warm_cache=options['warm_cache'], seed=options['seed'],
+                throttle=options['throttle'],
+            ).run()
+        except benchmark.BenchmarkError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{'endpoint':<22}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'cpu ms':>9}"
+            f"{'errors':>8}{'429s':>7}"
+        )
+        for name, result in report['results'].items():
+            queries = '-' if result['queries'] is None else result['queries']
+            cpu = '-' if result['cpu_ms'] is None else result['cpu_ms']
+            self.stdout.write(
+                f"{name:<22}{result['rps']:>9}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                f"{result['p99_ms']:>9}{queries:>9}{cpu:>9}{result['errors']:>8}{result['throttled']:>7}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                problems = benchmark.compare(report, json.load(f), options['max_regression'])
+            if problems:
+                raise CommandError('Benchmark regressed:\n' + '\n'.join(problems))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
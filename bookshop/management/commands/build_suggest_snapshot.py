@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bookshop import suggest
+
+
+class Command(BaseCommand):
+    help = 'Write the snapshot of book, author, publisher and genre names that /suggest/ starts from (run this hourly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=suggest.SNAPSHOT_PATH)
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('Set BOOKSHOP_SUGGEST_SNAPSHOT or pass --path')
+        count = suggest.build_snapshot(options['path'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} names to {options['path']}"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+
+from bookshop import listings, routers
+from bookshop.models import BookListing
+
+
+class Command(BaseCommand):
+    help = 'Compare the BookListing read model with the catalog tables and report rows that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Rewrite missing and stale rows, drop orphaned ones')
+        parser.add_argument('--batch-size', type=int, default=listings.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        # Compared and repaired on the primary: a lagging replica would report, and copy, stale rows.
+        token = routers.pin_to_primary()
+        try:
+            self.check_listings(options)
+        finally:
+            routers.release(token)
+
+    def check_listings(self, options):
+        problems = listings.check(options['batch_size'])
+        for kind, ids in problems.items():
+            if ids:
+                shown = ', '.join(map(str, ids[:20])) + (' ...' if len(ids) > 20 else '')
+                self.stderr.write(f'{len(ids)} {kind}: {shown}')
+        if not any(problems.values()):
+            self.stdout.write(self.style.SUCCESS('Listings match the catalog'))
+            return
+        if not options['repair']:
+            raise CommandError('Listings have drifted from the catalog; run with --repair to fix them')
+        with transaction.atomic(using=router.db_for_write(BookListing)):
+            listings.refresh(problems['missing'] + problems['stale'])
+            listings.recount_reserved(problems['stale'])
+            listings.remove(problems['orphaned'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired {sum(map(len, problems.values()))} listings'))
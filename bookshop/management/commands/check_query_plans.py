@@ -0,0 +1,70 @@
+import itertools
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import QueryDict
+from django.utils import timezone
+
+from bookshop.filters import BookFilterBackend
+from bookshop.models import BookListing, Genre
+from bookshop.pagination import KeysetPaginator
+
+# Plan lines that mean a table is read in full rather than through an index.
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!.*\b(?:USING|VIRTUAL TABLE)\b)(?P<table>\S+)'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\S+)'),
+}
+
+CURSOR_DEFAULTS = {
+    'created_at': timezone.now,
+    'price': lambda: 0,
+    'popularity': lambda: 0,
+    'id': lambda: 0,
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every supported book filter/sort combination and fail on full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        connection = connections[BookListing.objects.db]
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'No plan checker for the {connection.vendor} backend')
+
+        backend = BookFilterBackend()
+        genre = Genre.objects.first()
+        sample = {'authorId': '1', 'publisherId': '1', 'genre': genre.name if genre else 'Fantasy', 'inStock': 'true'}
+        failures = []
+        checked = 0
+
+        for size in range(len(sample) + 1):
+            for names in itertools.combinations(sample, size):
+                for sort in [None] + list(backend.sorts):
+                    params = QueryDict(mutable=True)
+                    params.update({name: sample[name] for name in names})
+                    if sort:
+                        params['sort'] = sort
+                    for plan in self.plans(backend, params, options['limit']):
+                        checked += 1
+                        scans = [m.group('table') for m in pattern.finditer(plan)]
+                        if scans:
+                            failures.append((params.urlencode(), scans, plan))
+
+        for query, scans, plan in failures:
+            self.stderr.write(f'?{query}: full scan of {", ".join(scans)}\n{plan}\n')
+        if failures:
+            raise CommandError(f'{len(failures)} of {checked} query plans use a full table scan')
+        self.stdout.write(self.style.SUCCESS(f'{checked} query plans checked, no full table scans'))
+
+    def plans(self, backend, params, limit):
+        queryset = backend.filter_queryset(BookListing.objects.all(), params)
+        paginator = KeysetPaginator(backend.get_ordering(params))
+        ordered = queryset.order_by(*paginator.ordering)
+        cursor_values = [CURSOR_DEFAULTS[field.lstrip('-')]() for field in paginator.ordering]
+        yield ordered[:limit].explain()
+        yield ordered.filter(paginator.keyset_filter(cursor_values))[:limit].explain()
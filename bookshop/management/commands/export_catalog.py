@@ -0,0 +1,22 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from bookshop import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Stream the book catalog out as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=catalog_io.FORMATS, default='jsonl')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--batch-size', type=int, default=catalog_io.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        lines = catalog_io.export_lines(options['format'], chunk_size=options['batch_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+                out.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bookshop import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Stream books from a CSV or JSONL file into the catalog, upserting on ISBN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=catalog_io.FORMATS)
+        parser.add_argument('--batch-size', type=int, default=catalog_io.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['format'] or catalog_io.guess_format(options['path'])
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                result = catalog_io.import_catalog(stream, fmt, options['batch_size'])
+        except (OSError, catalog_io.CatalogImportError) as e:
+            raise CommandError(str(e))
+
+        for error in result['errors']:
+            self.stderr.write(f"row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['created']} books created, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged, {len(result['errors'])} rows skipped"
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from bookshop import stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild BookStats and book popularity from OrderItem history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--windows-only', action='store_true',
+            help='Only roll the 7/30-day sales windows forward; required daily, as sales only ever enter them',
+        )
+        parser.add_argument('--batch-size', type=int, default=stats.REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['windows_only']:
+            stats.refresh_windows(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS('Sales windows refreshed'))
+        else:
+            count = stats.rebuild(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {count} books'))
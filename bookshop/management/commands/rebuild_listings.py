@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+
+from bookshop import listings, routers
+from bookshop.models import BookListing
+
+
+class Command(BaseCommand):
+    help = 'Recreate the BookListing read model from the catalog tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=listings.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        token = routers.pin_to_primary()
+        try:
+            with transaction.atomic(using=router.db_for_write(BookListing)):
+                count = listings.rebuild(options['batch_size'])
+        finally:
+            routers.release(token)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt listings for {count} books'))
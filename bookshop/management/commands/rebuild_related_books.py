@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from bookshop import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related books of every book from co-purchases, authors and genres (run this nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=recommendations.REBUILD_BATCH_SIZE)
+        parser.add_argument(
+            '--co-purchases', action='store_true',
+            help='First recount the co-purchase pairs from the whole order history (a repair; orders keep them current)',
+        )
+
+    def handle(self, *args, **options):
+        if options['co_purchases']:
+            pairs = recommendations.rebuild_co_purchases(options['batch_size'])
+            self.stdout.write(f'Recounted {pairs} co-purchase pairs')
+        count = recommendations.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt related books for {count} books'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from bookshop import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for books and authors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        with transaction.atomic(using=options['database']):
+            search.rebuild(connection)
+        backend = type(search.get_backend(connection)).__name__
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt ({backend})'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bookshop import orders
+
+
+class Command(BaseCommand):
+    help = 'Give the copies held by expired cart holds back to the stock (run this every minute)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=orders.HOLD_SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = orders.release_expired_holds(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {count} expired holds'))
@@ -0,0 +1,56 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from bookshop import tasks
+
+
+def work(batch_size, poll_interval, burst):
+    import django
+    django.setup()
+    tasks.Worker(batch_size, poll_interval).run(burst)
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers for the database broker (BOOKSHOP_TASK_BROKER = "database")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to run')
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        if tasks.TASK_BROKER != 'database':
+            raise CommandError(f'BOOKSHOP_TASK_BROKER is {tasks.TASK_BROKER!r}; workers only serve the "database" broker')
+        if not tasks.cache_is_shared():
+            self.stderr.write(self.style.WARNING(
+                'The cache is per process: workers will not warm the response cache. '
+                'Set REDIS_URL or MEMCACHED_LOCATION to share it with the web processes.'
+            ))
+        worker_args = (options['batch_size'], options['poll_interval'], options['burst'])
+        if options['processes'] <= 1:
+            tasks.Worker(*worker_args[:2]).run(options['burst'])
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=work, args=worker_args, name=f'bookshop-worker-{number}')
+            for number in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS(f"{options['processes']} workers stopped"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from bookshop import seeding
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with generated books, authors, publishers and orders for development and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--authors', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--publishers', type=int, help='Defaults to one per 200 books (at least 5)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible datasets')
+        parser.add_argument('--batch-size', type=int, default=seeding.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        result = seeding.seed_catalog(
+            options['books'], options['authors'], options['orders'],
+            publishers=options['publishers'], seed=options['seed'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['books']} books, {result['authors']} authors, "
+            f"{result['publishers']} publishers and {result['orders']} orders"
+        ))
@@ -0,0 +1,138 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+from . import instrumentation, routers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Brotli's default quality (11) is meant for static files; 4-5 compresses API
+# responses about as fast as gzip and noticeably smaller.
+BROTLI_QUALITY = getattr(settings, 'BOOKSHOP_BROTLI_QUALITY', 5)
+
+re_accepts_br = _lazy_re_compile(r'\bbr\b')
+
+
+class PrimaryDatabaseMiddleware:
+    """
+    Scopes ReplicaRouter's read-your-writes pinning to a request. Unsafe
+    methods (checkout, cart and catalog writes) run entirely on the primary,
+    and a client that wrote gets a short-lived cookie keeping its reads there
+    until the replicas have caught up.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.pin_to_primary(self.needs_primary(request))
+        try:
+            return self.remember_write(self.get_response(request))
+        finally:
+            routers.release(token)
+
+    async def __acall__(self, request):
+        token = routers.pin_to_primary(self.needs_primary(request))
+        try:
+            return self.remember_write(await self.get_response(request))
+        finally:
+            routers.release(token)
+
+    def needs_primary(self, request):
+        return request.method not in SAFE_METHODS or routers.PRIMARY_COOKIE in request.COOKIES
+
+    def remember_write(self, response):
+        if routers.READ_REPLICAS and routers.has_written():
+            response.set_cookie(routers.PRIMARY_COOKIE, '1', max_age=routers.REPLICA_LAG, httponly=True, samesite='Lax')
+        return response
+
+
+class InstrumentationMiddleware:
+    """
+    Times each request and the SQL it runs (through the execute wrapper
+    installed by bookshop.signals), adds a Server-Timing header, writes a
+    JSON log line to `bookshop.requests` and feeds the per-route histograms
+    served at /metrics. Statements repeated within one request are logged as
+    duplicate or N+1 queries with the route that ran them.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = instrumentation.start()
+        return instrumentation.finish(request, self.get_response(request), metrics, token)
+
+    async def __acall__(self, request):
+        metrics, token = instrumentation.start()
+        return instrumentation.finish(request, await self.get_response(request), metrics, token)
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compresses responses with Brotli when the client accepts `br` and the
+    brotli package is installed, and with gzip otherwise. Only responses to
+    safe methods are compressed, so the tokens that login and other writes
+    return never share a compressed body with attacker-chosen input
+    (BREACH). HTML keeps to gzip, which Django pads against the same attack.
+    """
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            return response
+        if (
+            brotli is None
+            or (response.streaming and response.is_async)
+            or response.get('Content-Type', '').startswith('text/html')
+            or not re_accepts_br.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        if not response.streaming and len(response.content) < 200:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming:
+            response.streaming_content = brotli_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A compressed body is a different representation: weaken strong ETags, as GZipMiddleware does.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
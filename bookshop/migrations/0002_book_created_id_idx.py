@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['created_at', 'id'], name='book_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from bookshop import search
+    search.rebuild(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from bookshop import search
+    with schema_editor.connection.cursor() as cursor:
+        search.get_backend(schema_editor.connection).drop(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0002_book_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
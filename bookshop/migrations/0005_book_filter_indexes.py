@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:40
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_links(apps, schema_editor):
+    for model_name, field in (('BookAuthor', 'author'), ('BookGenre', 'genre')):
+        model = apps.get_model('bookshop', model_name)
+        keep = model.objects.values('book', field).annotate(keep_id=Min('id')).values('keep_id')
+        model.objects.exclude(id__in=keep).delete()
+
+
+def populate_popularity(apps, schema_editor):
+    Book = apps.get_model('bookshop', 'Book')
+    OrderItem = apps.get_model('bookshop', 'OrderItem')
+    sold = (OrderItem.objects.filter(book=OuterRef('pk')).exclude(order__status='cancelled')
+            .values('book').annotate(units=Sum('quantity')).values('units'))
+    Book.objects.update(popularity=Coalesce(Subquery(sold), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_popularity, migrations.RunPython.noop),
+        migrations.RunPython(remove_duplicate_links, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='book_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['rating', 'id'], name='book_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['popularity', 'id'], name='book_popularity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_date'], name='book_published_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookauthor',
+            constraint=models.UniqueConstraint(fields=('author', 'book'), name='bookauthor_author_book_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookgenre',
+            constraint=models.UniqueConstraint(fields=('genre', 'book'), name='bookgenre_genre_book_uniq'),
+        ),
+    ]
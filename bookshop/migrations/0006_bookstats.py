@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:41
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def populate_book_stats(apps, schema_editor):
+    Book = apps.get_model('bookshop', 'Book')
+    BookStats = apps.get_model('bookshop', 'BookStats')
+    OrderItem = apps.get_model('bookshop', 'OrderItem')
+    now = timezone.now()
+    rows = OrderItem.objects.exclude(order__status='cancelled').values('book_id').order_by().annotate(
+        units_sold=Sum('quantity'),
+        revenue=Sum(F('quantity') * F('unit_price')),
+        units_sold_7d=Coalesce(Sum('quantity', filter=Q(order__created_at__gte=now - datetime.timedelta(days=7))), 0),
+        units_sold_30d=Coalesce(Sum('quantity', filter=Q(order__created_at__gte=now - datetime.timedelta(days=30))), 0),
+    )
+    BookStats.objects.bulk_create((BookStats(**row) for row in rows.iterator()), batch_size=1000)
+    units_30d = BookStats.objects.filter(book=OuterRef('pk')).values('units_sold_30d')
+    Book.objects.update(popularity=Coalesce(Subquery(units_30d), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0005_book_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='bookshop.book')),
+                ('units_sold', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units_sold_7d', models.PositiveIntegerField(default=0)),
+                ('units_sold_30d', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['units_sold', 'book'], name='bookstats_units_idx'), models.Index(fields=['units_sold_7d', 'book'], name='bookstats_units_7d_idx'), models.Index(fields=['units_sold_30d', 'book'], name='bookstats_units_30d_idx')],
+            },
+        ),
+        migrations.RunPython(populate_book_stats, migrations.RunPython.noop),
+    ]
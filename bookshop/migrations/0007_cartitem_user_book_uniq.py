@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:42
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('bookshop', 'CartItem')
+    keep = CartItem.objects.values('user', 'book').annotate(keep_id=Max('id')).values('keep_id')
+    CartItem.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0006_bookstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='cartitem_user_book_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0007_cartitem_user_book_uniq'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['isbn'], name='book_isbn_idx'),
+        ),
+    ]
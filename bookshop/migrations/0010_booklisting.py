@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+BOOK_COLUMNS = (
+    'title', 'price', 'currency', 'stock', 'rating', 'cover_url', 'created_at', 'popularity', 'publisher_id',
+)
+
+
+def populate_listings(apps, schema_editor):
+    Book = apps.get_model('bookshop', 'Book')
+    BookAuthor = apps.get_model('bookshop', 'BookAuthor')
+    BookGenre = apps.get_model('bookshop', 'BookGenre')
+    BookListing = apps.get_model('bookshop', 'BookListing')
+    book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(book_ids), 1000):
+        batch = book_ids[start:start + 1000]
+        related = {'authors': {}, 'genres': {}}
+        for key, links in (
+            ('authors', BookAuthor.objects.filter(book_id__in=batch).order_by('author_id')
+                .values_list('book_id', 'author_id', 'author__name')),
+            ('genres', BookGenre.objects.filter(book_id__in=batch).order_by('genre_id')
+                .values_list('book_id', 'genre_id', 'genre__name')),
+        ):
+            for book_id, related_id, name in links:
+                related[key].setdefault(book_id, []).append([related_id, name])
+        BookListing.objects.bulk_create([
+            BookListing(
+                id=row['id'],
+                **{column: row[column] for column in BOOK_COLUMNS},
+                in_stock=row['stock'] > 0,
+                publisher_name=row['publisher__name'] or '',
+                authors=related['authors'].get(row['id'], []),
+                genres=related['genres'].get(row['id'], []),
+            )
+            for row in Book.objects.filter(pk__in=batch).values('id', *BOOK_COLUMNS, 'publisher__name')
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0009_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(max_length=10)),
+                ('stock', models.IntegerField()),
+                ('in_stock', models.BooleanField()),
+                ('rating', models.DecimalField(decimal_places=2, max_digits=3)),
+                ('cover_url', models.URLField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('popularity', models.PositiveIntegerField()),
+                ('publisher_id', models.BigIntegerField(null=True)),
+                ('publisher_name', models.CharField(blank=True, max_length=100)),
+                ('authors', models.JSONField(default=list)),
+                ('genres', models.JSONField(default=list)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'id'], name='listing_created_id_idx'), models.Index(fields=['price', 'id'], name='listing_price_id_idx'), models.Index(fields=['popularity', 'id'], name='listing_popularity_id_idx'), models.Index(fields=['publisher_id', 'id'], name='listing_publisher_id_idx'), models.Index(fields=['in_stock', 'created_at', 'id'], name='listing_in_stock_idx')],
+            },
+        ),
+        migrations.RunPython(populate_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0010_booklisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booklisting',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='held_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['held_until'], name='cartitem_held_until_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0011_cart_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedBooks',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related', serialize=False, to='bookshop.book')),
+                ('book_ids', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0012_relatedbooks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booklisting',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='booklisting',
+            index=models.Index(fields=['updated_at'], name='listing_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def populate_co_purchases(apps, schema_editor):
+    CoPurchase = apps.get_model('bookshop', 'CoPurchase')
+    OrderItem = apps.get_model('bookshop', 'OrderItem')
+    rows = OrderItem.objects.exclude(order__status='cancelled').values_list(
+        'book_id', 'order__items__book_id',
+    ).order_by().annotate(orders=Count('order_id', distinct=True))
+    CoPurchase.objects.bulk_create(
+        (CoPurchase(book_id=book_id, other_id=other, orders=orders) for book_id, other, orders in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshop', '0013_booklisting_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_purchases', to='bookshop.book')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bookshop.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='copurchase',
+            constraint=models.UniqueConstraint(fields=('book', 'other'), name='copurchase_book_other_uniq'),
+        ),
+        migrations.RunPython(populate_co_purchases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def link_accounts(apps, schema_editor):
+    # Carry over the carts and orders matched by email so far, but only where the
+    # email names exactly one account; shared and blank emails start a new shop user.
+    AuthUser = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    User = apps.get_model('bookshop', 'User')
+    unique = AuthUser.objects.exclude(email='').values('email').annotate(accounts=Count('pk')).filter(accounts=1)
+    for account_id, email in AuthUser.objects.filter(email__in=unique.values('email')).values_list('pk', 'email'):
+        user = User.objects.filter(email=email, account__isnull=True).order_by('id').first()
+        if user is not None:
+            User.objects.filter(pk=user.pk).update(account_id=account_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bookshop', '0014_copurchase'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='account',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shop_user', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(link_accounts, migrations.RunPython.noop),
+    ]
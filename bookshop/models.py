@@ -1,6 +1,12 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 class User(models.Model):
+    # The login account that owns this cart and these orders; emails are not unique, so they cannot link the two.
+    account = models.OneToOneField(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='shop_user',
+    )
     name = models.CharField(max_length=100)
     email = models.EmailField(max_length=150)
     password_hash = models.CharField(max_length=500)
@@ -12,6 +18,7 @@ class Author(models.Model):
     name = models.CharField(max_length=100)
     bio = models.TextField()
     photo_url = models.URLField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -26,6 +33,7 @@ class Publisher(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     website = models.URLField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -43,10 +51,23 @@ class Book(models.Model):
     cover_url = models.URLField(blank=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2)
     created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Mirrors BookStats.units_sold_30d so the popularity sort is an index scan on this table.
+    popularity = models.PositiveIntegerField(default=0)
 
     authors = models.ManyToManyField(Author, through='BookAuthor', related_name='books')
     genres = models.ManyToManyField(Genre, through='BookGenre', related_name='books')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='book_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='book_price_id_idx'),
+            models.Index(fields=['rating', 'id'], name='book_rating_id_idx'),
+            models.Index(fields=['popularity', 'id'], name='book_popularity_id_idx'),
+            models.Index(fields=['published_date'], name='book_published_date_idx'),
+            models.Index(fields=['isbn'], name='book_isbn_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -54,10 +75,20 @@ class BookAuthor(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     author = models.ForeignKey(Author, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'book'], name='bookauthor_author_book_uniq'),
+        ]
+
 class BookGenre(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     genre = models.ForeignKey(Genre, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['genre', 'book'], name='bookgenre_genre_book_uniq'),
+        ]
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('created','created'),
@@ -79,4 +110,113 @@ class CartItem(models.Model):
     user = models.ForeignKey(User,on_delete=models.CASCADE, related_name='cart_items')
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
-
+    # While set, `quantity` copies are held for this cart (counted in BookListing.reserved).
+    held_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='cartitem_user_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['held_until'], name='cartitem_held_until_idx'),
+        ]
+
+class BookStats(models.Model):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units_sold_7d = models.PositiveIntegerField(default=0)
+    units_sold_30d = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['units_sold', 'book'], name='bookstats_units_idx'),
+            models.Index(fields=['units_sold_7d', 'book'], name='bookstats_units_7d_idx'),
+            models.Index(fields=['units_sold_30d', 'book'], name='bookstats_units_30d_idx'),
+        ]
+
+class RelatedBooks(models.Model):
+    """A book's precomputed related books, most related first; built by bookshop.recommendations."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='related')
+    book_ids = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class CoPurchase(models.Model):
+    """
+    How many non-cancelled orders hold both books; with `other` the book
+    itself, how many hold the book. Kept by bookshop.recommendations.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='co_purchases')
+    other = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'other'], name='copurchase_book_other_uniq'),
+        ]
+
+class BookListing(models.Model):
+    """
+    One denormalized row per book holding everything the book listings
+    filter, sort and show, so they read a single table. Kept in sync by
+    bookshop.listings from the signals on the source models; `manage.py
+    check_listings` verifies it and `manage.py rebuild_listings` rebuilds it.
+    """
+    id = models.BigIntegerField(primary_key=True)  # the book's id
+    title = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=10)
+    stock = models.IntegerField()
+    in_stock = models.BooleanField()
+    # Copies held by carts; stock - reserved can still be added to a cart.
+    reserved = models.PositiveIntegerField(default=0)
+    rating = models.DecimalField(max_digits=3, decimal_places=2)
+    cover_url = models.URLField(blank=True)
+    created_at = models.DateTimeField()
+    popularity = models.PositiveIntegerField()
+    publisher_id = models.BigIntegerField(null=True)
+    publisher_name = models.CharField(max_length=100, blank=True)
+    # [[id, name], ...] ordered by id.
+    authors = models.JSONField(default=list)
+    genres = models.JSONField(default=list)
+    # When the listing columns last changed; bookshop.facets reads the rows changed since its last sync.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='listing_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='listing_price_id_idx'),
+            models.Index(fields=['popularity', 'id'], name='listing_popularity_id_idx'),
+            models.Index(fields=['publisher_id', 'id'], name='listing_publisher_id_idx'),
+            models.Index(fields=['in_stock', 'created_at', 'id'], name='listing_in_stock_idx'),
+            models.Index(fields=['updated_at'], name='listing_updated_at_idx'),
+        ]
+
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    dedupe_key = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+        constraints = [
+            # At most one pending copy of an identical task; running and failed ones don't count.
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=models.Q(status='pending') & ~models.Q(dedupe_key=''),
+                name='task_pending_dedupe_uniq',
+            ),
+        ]
@@ -0,0 +1,200 @@
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+
+from . import listings, recommendations, stats, tasks
+from .models import Book, BookListing, CartItem, Order, OrderItem, User
+
+# Seconds a cart holds the copies added to it.
+HOLD_TTL = getattr(settings, 'BOOKSHOP_CART_HOLD_TTL', 15 * 60)
+HOLD_SWEEP_BATCH_SIZE = getattr(settings, 'BOOKSHOP_HOLD_SWEEP_BATCH_SIZE', 500)
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, book_id):
+        super().__init__(f'Not enough stock for book {book_id}')
+        self.book_id = book_id
+
+
+def get_shop_user(auth_user):
+    """
+    The bookshop User (cart and order owner) of an authenticated auth.User,
+    found by the account's id and created on its first visit. Emails are
+    neither unique nor verified, so they never decide whose cart it is.
+    """
+    user = User.objects.filter(account_id=auth_user.pk).first()
+    if user is not None:
+        return user
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return User.objects.create(
+                account_id=auth_user.pk,
+                name=auth_user.get_full_name() or auth_user.get_username(),
+                email=auth_user.email,
+                password_hash='',
+                role='admin' if auth_user.is_staff else 'user',
+                created_at=now,
+                updated_at=now,
+            )
+    except IntegrityError:
+        # A concurrent first request of the same account created it.
+        return User.objects.get(account_id=auth_user.pk)
+
+
+def release(quantities):
+    """Hand held copies back, `quantities` mapping book ids to counts, with one UPDATE."""
+    if not quantities:
+        return
+    released = Case(
+        *[When(pk=book_id, then=Value(quantity)) for book_id, quantity in quantities.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+    BookListing.objects.filter(pk__in=list(quantities)).update(
+        reserved=Greatest(F('reserved') - released, 0), updated_at=Now(),
+    )
+    listings.changed()
+
+
+def _release_holds(items):
+    """Release the holds of the cart lines in `items`, skipping lines another transaction has locked."""
+    rows = list(items.select_for_update(skip_locked=True).values_list('pk', 'book_id', 'quantity'))
+    if not rows:
+        return 0
+    CartItem.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(held_until=None)
+    quantities = {}
+    for _, book_id, quantity in rows:
+        quantities[book_id] = quantities.get(book_id, 0) + quantity
+    release(quantities)
+    return len(rows)
+
+
+def release_expired_holds(batch_size=HOLD_SWEEP_BATCH_SIZE):
+    """
+    Give the copies of expired holds back to the stock, `batch_size` cart
+    lines per transaction; returns how many holds were released. The cart
+    lines stay, unheld. Run it every minute or so (`manage.py
+    release_expired_holds`); until then expired holds still count.
+    """
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = CartItem.objects.filter(held_until__lte=timezone.now()).order_by('held_until', 'pk')
+            count = _release_holds(expired[:batch_size])
+        released += count
+        if count < batch_size:
+            return released
+
+
+def _reserve(book_id, quantity):
+    reserved = BookListing.objects.filter(pk=book_id, stock__gte=F('reserved') + quantity).update(
+        reserved=F('reserved') + quantity, updated_at=Now(),
+    )
+    if reserved:
+        listings.changed()
+    return reserved
+
+
+def lock_cart(user):
+    """Lock the user's cart until the end of the transaction, with a no-op write to its owner's row."""
+    User.objects.filter(pk=user.pk).update(updated_at=F('updated_at'))
+
+
+def hold(user, book_id, quantity):
+    """
+    Set the user's cart line for a book to `quantity` copies and hold them
+    for HOLD_TTL seconds. Held copies are not available to other carts: each
+    change is one conditional `UPDATE ... SET reserved = reserved + n WHERE
+    stock >= reserved + n` on the book's listing row, so any number of
+    concurrent calls can never hold more than the stock. Raises
+    OutOfStockError, leaving the cart as it was, when too few are free.
+    """
+    with transaction.atomic():
+        # Write first: it locks the cart owner's row, which exists even before
+        # the cart line does, so two first holds of a book wait for each other;
+        # and SQLite takes its write lock now (waiting out the busy timeout)
+        # instead of failing to upgrade a read.
+        lock_cart(user)
+        item = CartItem.objects.filter(user=user, book_id=book_id).first()
+        held = item.quantity if item and item.held_until else 0
+        extra = quantity - held
+        if extra > 0 and not _reserve(book_id, extra):
+            # Expired holds count until the sweeper runs; reclaim this book's now and try again.
+            expired = CartItem.objects.filter(book_id=book_id, held_until__lte=timezone.now()).exclude(user=user)
+            if not (_release_holds(expired) and _reserve(book_id, extra)):
+                raise OutOfStockError(book_id)
+        elif extra < 0:
+            release({book_id: -extra})
+        held_until = timezone.now() + datetime.timedelta(seconds=HOLD_TTL)
+        CartItem.objects.update_or_create(
+            user=user, book_id=book_id, defaults={'quantity': quantity, 'held_until': held_until},
+        )
+
+
+def checkout(user):
+    """
+    Turn the user's cart into an Order in one transaction.
+
+    Stock is taken with one conditional `UPDATE ... SET stock = stock - qty
+    WHERE stock >= qty` per book, in id order, so concurrent checkouts only
+    contend on the rows they share and can never oversell; if any book is
+    short the whole transaction rolls back. Copies the cart holds are its
+    own; the rest must not be held by other carts.
+    """
+    with transaction.atomic():
+        # Write first, as hold() does: it waits out the cart's holds, and SQLite
+        # takes its write lock now instead of failing to upgrade a read under contention.
+        lock_cart(user)
+        cart = list(
+            CartItem.objects.filter(user=user).order_by('book_id').values_list('book_id', 'quantity', 'held_until')
+        )
+        if not cart:
+            raise EmptyCartError('Cart is empty')
+
+        for book_id, quantity, held_until in cart:
+            held = quantity if held_until else 0
+            taken = Book.objects.filter(pk=book_id, stock__gte=quantity).update(
+                stock=F('stock') - quantity, updated_at=Now(),
+            )
+            # The listing's stock is still the pre-checkout value here.
+            if taken:
+                taken = BookListing.objects.filter(pk=book_id, stock__gte=F('reserved') - held + quantity).update(
+                    reserved=Greatest(F('reserved') - held, 0), updated_at=Now(),
+                )
+            if not taken:
+                raise OutOfStockError(book_id)
+        cart = [(book_id, quantity) for book_id, quantity, _ in cart]
+        listings.copy_columns(['stock'], [book_id for book_id, _ in cart])
+
+        prices = dict(Book.objects.filter(pk__in=[book_id for book_id, _ in cart]).values_list('id', 'price'))
+        order = Order.objects.create(
+            user=user,
+            status='created',
+            total_amount=sum(prices[book_id] * quantity for book_id, quantity in cart),
+            created_at=timezone.now(),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, book_id=book_id, quantity=quantity, unit_price=prices[book_id])
+            for book_id, quantity in cart
+        ])
+        # bulk_create skips the OrderItem signals that keep BookStats current.
+        stats.record_sales([(book_id, quantity, prices[book_id]) for book_id, quantity in cart], order.created_at)
+        recommendations.record_baskets((), [book_id for book_id, _ in cart])
+        tasks.refresh_related_books.delay([book_id for book_id, _ in cart])
+        # The holds were used up above; clear them first so deleting the lines does not release them again.
+        items = CartItem.objects.filter(user=user)
+        items.update(held_until=None)
+        items.delete()
+    return order
@@ -0,0 +1,153 @@
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+from .caching import versioned_key
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+TOTAL_CACHE_TIMEOUT = 60
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(values, list):
+        raise PaginationError('Invalid cursor')
+    return values
+
+
+def cursor_value(queryset, name, value):
+    """
+    A cursor value converted to the type of the ordering field `name`, so a
+    crafted cursor is a PaginationError rather than a database error.
+    """
+    if value is None or isinstance(value, (bool, dict, list)):
+        raise PaginationError('Invalid cursor')
+    try:
+        field = queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # An annotation, such as the search rank: always a number.
+        if not isinstance(value, (int, float)):
+            raise PaginationError('Invalid cursor')
+        return value
+    try:
+        value = field.to_python(value)
+        field.run_validators(value)
+    except (ValidationError, TypeError, ValueError):
+        raise PaginationError('Invalid cursor')
+    if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+        raise PaginationError('Invalid cursor')
+    return value
+
+
+def _positive_int(value, name, default):
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError(f'{name} must be a positive integer')
+    if value < 1:
+        raise PaginationError(f'{name} must be a positive integer')
+    return value
+
+
+class Page:
+    def __init__(self, object_list, meta):
+        self.object_list = object_list
+        self.meta = meta
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by `page`/`limit` or by an opaque keyset `cursor`.
+
+    `ordering` is a list of field names (prefixed with '-' for descending);
+    `id` is appended as a tie-breaker so every row has a unique position.
+    A cursor encodes the ordering values of the last row of a page, so the
+    next page is a range scan on the matching index instead of an OFFSET.
+    """
+
+    def __init__(self, ordering=('created_at',)):
+        ordering = [f for f in ordering if f.lstrip('-') != 'id']
+        tie_breaker = '-id' if ordering and ordering[-1].startswith('-') else 'id'
+        self.ordering = ordering + [tie_breaker]
+
+    def paginate(self, queryset, request):
+        rows, page, limit = self.page_queryset(queryset, request.GET)
+        total = self.get_total(queryset)
+        return self.make_page(list(rows), page, limit, total)
+
+    async def apaginate(self, queryset, request):
+        """paginate() for async views, using the async ORM for the page itself."""
+        rows, page, limit = self.page_queryset(queryset, request.GET)
+        total = await sync_to_async(self.get_total)(queryset)
+        return self.make_page([row async for row in rows], page, limit, total)
+
+    def page_queryset(self, queryset, params):
+        """Return (queryset, page, limit): the rows for the requested page plus one to detect a next page."""
+        limit = min(_positive_int(params.get('limit'), 'limit', DEFAULT_LIMIT), MAX_LIMIT)
+        cursor = params.get('cursor')
+        queryset = queryset.order_by(*self.ordering)
+
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != len(self.ordering):
+                raise PaginationError('Invalid cursor')
+            values = [cursor_value(queryset, field.lstrip('-'), value) for field, value in zip(self.ordering, values)]
+            return queryset.filter(self.keyset_filter(values))[:limit + 1], None, limit
+        page = _positive_int(params.get('page'), 'page', 1)
+        offset = (page - 1) * limit
+        return queryset[offset:offset + limit + 1], page, limit
+
+    def make_page(self, rows, page, limit, total):
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(self.row_values(rows[-1])) if has_next else None
+        meta = {'page': page, 'limit': limit, 'total': total, 'next': next_cursor}
+        return Page(rows, meta)
+
+    def keyset_filter(self, values):
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def row_values(self, row):
+        if isinstance(row, dict):
+            return [row[field.lstrip('-')] for field in self.ordering]
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def get_total(self, queryset):
+        queryset = queryset.order_by()
+        try:
+            sql = str(queryset.query)
+        except Exception:
+            return queryset.count()
+        key = versioned_key('total', [sql])
+        total = cache.get(key)
+        if total is None:
+            total = queryset.count()
+            cache.set(key, total, TOTAL_CACHE_TIMEOUT)
+        return total
@@ -0,0 +1,198 @@
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .caching import bump_version
+from .models import Book, BookAuthor, BookGenre, BookListing, BookStats, CoPurchase, OrderItem, RelatedBooks
+
+RELATED_BOOKS = getattr(settings, 'BOOKSHOP_RELATED_BOOKS', 10)
+REBUILD_BATCH_SIZE = 1000
+# Added to the co-purchase score (0..1) for sharing an author, and times the genre overlap (0..1).
+AUTHOR_WEIGHT = 0.5
+GENRE_WEIGHT = 0.2
+# Co-purchased books scored per book, most bought together first.
+CANDIDATES = RELATED_BOOKS * 5
+QUERY_BATCH_SIZE = 900
+
+
+def _batches(ids, size=QUERY_BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _grouped_in(queryset, field, ids, *values):
+    """{key: set of values} of the (key, value) rows of `queryset` with `field` in `ids`, a bounded number per query."""
+    groups = {}
+    for batch in _batches(ids):
+        for key, value in queryset.filter(**{f'{field}__in': batch}).values_list(*values):
+            groups.setdefault(key, set()).add(value)
+    return groups
+
+
+def co_purchases(book_ids):
+    """
+    For each of `book_ids`, how many orders it shares with each other book,
+    read from the CoPurchase rows of `book_ids` rather than their order history.
+    """
+    counts = {}
+    for batch in _batches(book_ids):
+        for book_id, other, orders in CoPurchase.objects.filter(book_id__in=batch).values_list(
+            'book_id', 'other_id', 'orders',
+        ):
+            counts.setdefault(book_id, Counter())[other] = orders
+    return counts
+
+
+def _pairs(book_ids):
+    return {(book_id, other) for book_id in book_ids for other in book_ids}
+
+
+def record_baskets(before, after=()):
+    """
+    Move the CoPurchase counts from an order holding the `before` books to
+    one holding the `after` books (empty for an order that does not count),
+    as F() increments in the caller's transaction: an UPDATE per book of the
+    order however many orders came before. Pairs that reach 0 are deleted.
+    """
+    delta = Counter(_pairs(set(after)))
+    delta.subtract(_pairs(set(before)))
+    steps = {}
+    for (book_id, other), step in delta.items():
+        if step:
+            steps.setdefault((book_id, step), []).append(other)
+    CoPurchase.objects.bulk_create([
+        CoPurchase(book_id=book_id, other_id=other)
+        for (book_id, step), others in steps.items() if step > 0 for other in others
+    ], ignore_conflicts=True)
+    for (book_id, step), others in sorted(steps.items()):
+        CoPurchase.objects.filter(book_id=book_id, other_id__in=others).update(orders=Greatest(F('orders') + step, 0))
+    emptied = {book_id for book_id, step in steps if step < 0}
+    if emptied:
+        CoPurchase.objects.filter(book_id__in=emptied, orders=0).delete()
+
+
+def co_purchase_rows():
+    """(book_id, other_id, orders) of every pair bought together, from the order history with one GROUP BY."""
+    items = OrderItem.objects.exclude(order__status='cancelled')
+    return items.values_list('book_id', 'order__items__book_id').order_by().annotate(
+        orders=Count('order_id', distinct=True),
+    )
+
+
+@transaction.atomic
+def rebuild_co_purchases(batch_size=REBUILD_BATCH_SIZE):
+    """Recount CoPurchase from the whole order history, for repairs; returns how many pairs it holds."""
+    CoPurchase.objects.all().delete()
+    count = 0
+    batch = []
+    for book_id, other, orders in co_purchase_rows().iterator(chunk_size=batch_size):
+        batch.append(CoPurchase(book_id=book_id, other_id=other, orders=orders))
+        if len(batch) >= batch_size:
+            CoPurchase.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    CoPurchase.objects.bulk_create(batch)
+    return count + len(batch)
+
+
+def _genre_leaders(genre_ids, size):
+    """The `size` most popular books of each genre, so books without sales history get related books too."""
+    leaders = {}
+    for genre_id in genre_ids:
+        books = BookListing.objects.filter(pk__in=BookGenre.objects.filter(genre_id=genre_id).values('book_id'))
+        leaders[genre_id] = list(books.order_by('-popularity', 'id').values_list('id', flat=True)[:size])
+    return leaders
+
+
+def compute(book_ids, k=RELATED_BOOKS):
+    """
+    The top `k` related books of each of `book_ids`, as {book_id: [ids]}.
+
+    A candidate scores the cosine of the two books' co-purchase vectors
+    (orders shared, over the square root of the product of units sold), plus
+    AUTHOR_WEIGHT if it shares an author and GENRE_WEIGHT times the Jaccard
+    overlap of their genres. Candidates are the books most often bought
+    together with the book, books by the same authors, and the most popular
+    books of its genres. Ties go to the better seller.
+    """
+    book_ids = list(book_ids)
+    bought = co_purchases(book_ids)
+    authors = _grouped_in(BookAuthor.objects.all(), 'book_id', book_ids, 'book_id', 'author_id')
+    by_author = _grouped_in(
+        BookAuthor.objects.all(), 'author_id', {a for ids in authors.values() for a in ids}, 'author_id', 'book_id',
+    )
+    genres = _grouped_in(BookGenre.objects.all(), 'book_id', book_ids, 'book_id', 'genre_id')
+    leaders = _genre_leaders({g for ids in genres.values() for g in ids}, k)
+
+    candidates = {}
+    for book_id in book_ids:
+        found = {other for other, _ in bought.get(book_id, Counter()).most_common(CANDIDATES + 1)}
+        found.update(other for author_id in authors.get(book_id, ()) for other in by_author[author_id])
+        found.update(other for genre_id in genres.get(book_id, ()) for other in leaders[genre_id])
+        found.discard(book_id)
+        candidates[book_id] = found
+
+    everyone = set(book_ids).union(*candidates.values())
+    candidate_genres = _grouped_in(BookGenre.objects.all(), 'book_id', everyone - set(genres), 'book_id', 'genre_id')
+    candidate_genres.update(genres)
+    units = {}
+    for batch in _batches(everyone):
+        units.update(BookStats.objects.filter(pk__in=batch).values_list('book_id', 'units_sold'))
+
+    related = {}
+    for book_id in book_ids:
+        counts = bought.get(book_id, Counter())
+        # An order holds each book once, so a book's own count is the number of its orders.
+        own_orders = counts[book_id]
+        own_authors = authors.get(book_id, set())
+        own_genres = genres.get(book_id, set())
+        scored = []
+        for other in candidates[book_id]:
+            score = 0.0
+            if counts[other]:
+                score += counts[other] / math.sqrt(
+                    max(units.get(book_id, 0), own_orders) * max(units.get(other, 0), counts[other])
+                )
+            if any(other in by_author[author_id] for author_id in own_authors):
+                score += AUTHOR_WEIGHT
+            other_genres = candidate_genres.get(other, set())
+            if own_genres and other_genres:
+                score += GENRE_WEIGHT * len(own_genres & other_genres) / len(own_genres | other_genres)
+            if score:
+                scored.append((-score, -units.get(other, 0), other))
+        related[book_id] = [other for _, _, other in sorted(scored)[:k]]
+    return related
+
+
+def _store(book_ids):
+    """Recompute and store the related books of `book_ids`; returns the ids of those that still exist."""
+    book_ids = sorted(set(book_ids))
+    existing = set(Book.objects.filter(pk__in=book_ids).values_list('pk', flat=True))
+    book_ids = [pk for pk in book_ids if pk in existing]
+    if book_ids:
+        with transaction.atomic():
+            RelatedBooks.objects.bulk_create(
+                [RelatedBooks(book_id=book_id, book_ids=ids) for book_id, ids in compute(book_ids).items()],
+                update_conflicts=True, unique_fields=['book'], update_fields=['book_ids', 'updated_at'],
+            )
+    return book_ids
+
+
+def refresh(book_ids):
+    """Recompute and store the related books of `book_ids`; safe to repeat. Only their cached lists go stale."""
+    for book_id in _store(book_ids):
+        bump_version((RelatedBooks, book_id))
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    """Recompute the related books of every book; returns how many books were done."""
+    book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+    for batch in _batches(book_ids, batch_size):
+        _store(batch)
+    bump_version(RelatedBooks)
+    return len(book_ids)
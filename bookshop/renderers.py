@@ -0,0 +1,117 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer, BrowsableAPIRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .instrumentation import serializing
+from .streaming import NDJSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed. The bytes
+    match JSONRenderer's compact output; indented output and anything orjson
+    cannot encode go through the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serializing():
+            return self.encode(data, accepted_media_type, renderer_context)
+
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=JSONEncoder().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same strict-javascript-subset escaping as JSONRenderer.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def _table(items, included):
+    columns = list(dict.fromkeys(key for item in items for key in item))
+    rows = []
+    for item in items:
+        row = []
+        for column in columns:
+            value = item.get(column)
+            if isinstance(value, dict) and 'id' in value:
+                included.setdefault(column, {})[value['id']] = value
+                value = value['id']
+            elif isinstance(value, list) and value and all(isinstance(v, dict) and 'id' in v for v in value):
+                objects = included.setdefault(column, {})
+                for obj in value:
+                    objects[obj['id']] = obj
+                value = [obj['id'] for obj in value]
+            row.append(value)
+        rows.append(row)
+    return {'columns': columns, 'rows': rows}
+
+
+def _is_table(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def columnar(data):
+    """
+    Rewrite lists of objects in `data` (the value itself, or its top-level
+    values such as `data` or `books`) as {'columns': [...], 'rows': [[...]]},
+    so each key is sent once. Nested objects with an `id` (authors,
+    publishers) are sent once under `included`, keyed by column, and rows
+    refer to them by id.
+    """
+    included = {}
+    if _is_table(data):
+        data = _table(data, included)
+    elif isinstance(data, dict):
+        data = {key: _table(value, included) if _is_table(value) else value for key, value in data.items()}
+    else:
+        return data
+    if included:
+        data['included'] = {column: list(objects.values()) for column, objects in included.items()}
+    return data
+
+
+class ColumnarJSONRenderer(ORJSONRenderer):
+    """JSON with lists of objects sent as columns and rows; see columnar()."""
+    media_type = 'application/vnd.bookshop.columns+json'
+    format = 'columns'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serializing():
+            return self.encode(columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """The JSON payload encoded as MessagePack; offered when the msgpack package is installed."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with serializing():
+            return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+CATALOG_RENDERER_CLASSES = [ORJSONRenderer, BrowsableAPIRenderer, NDJSONRenderer, ColumnarJSONRenderer]
+if msgpack is not None:
+    CATALOG_RENDERER_CLASSES.append(MessagePackRenderer)
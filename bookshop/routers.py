@@ -0,0 +1,79 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_REPLICAS = getattr(settings, 'BOOKSHOP_READ_REPLICAS', [])
+# How long (seconds) a client keeps reading from the primary after it wrote, to ride out replication lag.
+REPLICA_LAG = getattr(settings, 'BOOKSHOP_REPLICA_LAG', 5)
+PRIMARY_COOKIE = 'bookshop_primary'
+
+
+class Scope:
+    """A request or job: whether its reads are pinned to the primary, and whether it wrote."""
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.written = False
+
+
+# The current Scope; None outside of one, where every read goes to the primary and writes are not remembered.
+_scope = ContextVar('bookshop_primary_scope', default=None)
+
+
+def pin_to_primary(pinned=True):
+    """
+    Start a request or job, optionally with every read on the primary;
+    returns a token for release(), which must be called in a finally block.
+    """
+    return _scope.set(Scope(pinned))
+
+
+def release(token):
+    scope = _scope.get()
+    _scope.reset(token)
+    outer = _scope.get()
+    if outer is not None and scope is not None and scope.written:
+        outer.written = True
+
+
+def has_written():
+    scope = _scope.get()
+    return scope is not None and scope.written
+
+
+class ReplicaRouter:
+    """
+    Reads of bookshop models made by a request go to a random database in
+    BOOKSHOP_READ_REPLICAS; writes, and reads of every other app, go to the
+    primary. Only PrimaryDatabaseMiddleware opens unpinned scopes: commands,
+    tasks and threads read the primary, so their read-modify-write work never
+    copies lagging replica rows. Reads stay on the primary inside transactions
+    and once the request has written anything, so a client sees its own writes;
+    PrimaryDatabaseMiddleware carries that over to the client's next
+    requests for REPLICA_LAG seconds. A write is remembered on the Scope
+    that pin_to_primary() opened, so it ends with that request or job.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not READ_REPLICAS or model._meta.app_label != 'bookshop':
+            return None
+        scope = _scope.get()
+        on_primary = scope is None or scope.pinned or scope.written
+        if on_primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(READ_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            scope.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
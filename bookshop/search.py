@@ -0,0 +1,324 @@
+import re
+import sqlite3
+
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+
+from .models import Book, Author
+
+MAX_TERMS = 10
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 index with one row per book (rowid = book id) holding the title,
+    description, author names and genre names, plus one row per author.
+    Queries are prefix matches on every term, ranked with weighted bm25.
+    """
+    book_table = 'bookshop_book_fts'
+    author_table = 'bookshop_author_fts'
+    # bm25() is lower-is-better
+    rank_ordering = 'search_rank'
+
+    BOOK_DOCUMENT_SQL = """
+        SELECT b.id, b.title, b.description,
+            (SELECT group_concat(a.name, ' ') FROM bookshop_bookauthor ba
+                JOIN bookshop_author a ON a.id = ba.author_id WHERE ba.book_id = b.id),
+            (SELECT group_concat(g.name, ' ') FROM bookshop_bookgenre bg
+                JOIN bookshop_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id)
+        FROM bookshop_book b
+    """
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.book_table} USING fts5("
+            "title, description, authors, genres, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.author_table} USING fts5("
+            "name, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.book_table}')
+        cursor.execute(f'DROP TABLE IF EXISTS {self.author_table}')
+
+    def match_expression(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def rank_sql(self, table, rank, model, match):
+        """
+        The rank of each matching row, looked up in a materialized CTE: a
+        subquery with `MATCH ... AND rowid = outer.id` would re-run the full
+        text query for every row, which is quadratic for common terms.
+        """
+        materialized = 'MATERIALIZED ' if sqlite3.sqlite_version_info >= (3, 35) else ''
+        return RawSQL(
+            f'WITH ranked AS {materialized}(SELECT rowid AS id, {rank} AS rank FROM {table} WHERE {table} MATCH %s) '
+            f'SELECT rank FROM ranked WHERE ranked.id = {model._meta.db_table}.id', [match]
+        )
+
+    def filter_books(self, queryset, terms):
+        match = self.match_expression(terms)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {self.book_table} WHERE {self.book_table} MATCH %s', [match])
+        ).annotate(search_rank=self.rank_sql(
+            self.book_table, f'bm25({self.book_table}, 10.0, 1.0, 5.0, 2.0)', queryset.model, match
+        ))
+
+    def filter_authors(self, queryset, terms):
+        match = self.match_expression(terms)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {self.author_table} WHERE {self.author_table} MATCH %s', [match])
+        ).annotate(search_rank=self.rank_sql(self.author_table, f'bm25({self.author_table})', Author, match))
+
+    def index_books(self, cursor, book_ids=None):
+        if book_ids is None:
+            cursor.execute(f'DELETE FROM {self.book_table}')
+            where, params = '', []
+        else:
+            placeholders = ', '.join(['%s'] * len(book_ids))
+            cursor.execute(f'DELETE FROM {self.book_table} WHERE rowid IN ({placeholders})', book_ids)
+            where, params = f' WHERE b.id IN ({placeholders})', book_ids
+        cursor.execute(
+            f'INSERT INTO {self.book_table} (rowid, title, description, authors, genres) '
+            + self.BOOK_DOCUMENT_SQL + where, params
+        )
+
+    def remove_books(self, cursor, book_ids):
+        placeholders = ', '.join(['%s'] * len(book_ids))
+        cursor.execute(f'DELETE FROM {self.book_table} WHERE rowid IN ({placeholders})', book_ids)
+
+    def index_authors(self, cursor, author_ids=None):
+        if author_ids is None:
+            cursor.execute(f'DELETE FROM {self.author_table}')
+            where, params = '', []
+        else:
+            placeholders = ', '.join(['%s'] * len(author_ids))
+            cursor.execute(f'DELETE FROM {self.author_table} WHERE rowid IN ({placeholders})', author_ids)
+            where, params = f' WHERE id IN ({placeholders})', author_ids
+        cursor.execute(
+            f'INSERT INTO {self.author_table} (rowid, name) SELECT id, name FROM bookshop_author' + where,
+            params
+        )
+
+    def remove_authors(self, cursor, author_ids):
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        cursor.execute(f'DELETE FROM {self.author_table} WHERE rowid IN ({placeholders})', author_ids)
+
+
+class PostgresSearchBackend:
+    """
+    tsvector documents kept in side tables with GIN indexes. The title is
+    weighted highest, then authors, genres and description; ranking uses
+    ts_rank and terms are matched by prefix.
+    """
+    book_table = 'bookshop_book_search'
+    author_table = 'bookshop_author_search'
+    # ts_rank() is higher-is-better
+    rank_ordering = '-search_rank'
+
+    BOOK_DOCUMENT_SQL = """
+        SELECT b.id,
+            setweight(to_tsvector('simple', b.title), 'A')
+            || setweight(to_tsvector('simple', coalesce((SELECT string_agg(a.name, ' ')
+                FROM bookshop_bookauthor ba JOIN bookshop_author a ON a.id = ba.author_id
+                WHERE ba.book_id = b.id), '')), 'B')
+            || setweight(to_tsvector('simple', coalesce((SELECT string_agg(g.name, ' ')
+                FROM bookshop_bookgenre bg JOIN bookshop_genre g ON g.id = bg.genre_id
+                WHERE bg.book_id = b.id), '')), 'C')
+            || setweight(to_tsvector('simple', b.description), 'D')
+        FROM bookshop_book b
+    """
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.book_table} ('
+            'book_id bigint PRIMARY KEY REFERENCES bookshop_book (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.book_table}_document_idx '
+            f'ON {self.book_table} USING GIN (document)'
+        )
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.author_table} ('
+            'author_id bigint PRIMARY KEY REFERENCES bookshop_author (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.author_table}_document_idx '
+            f'ON {self.author_table} USING GIN (document)'
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.book_table}')
+        cursor.execute(f'DROP TABLE IF EXISTS {self.author_table}')
+
+    def match_expression(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def filter_books(self, queryset, terms):
+        match = self.match_expression(terms)
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT book_id FROM {self.book_table} WHERE document @@ to_tsquery('simple', %s)", [match]
+            )
+        ).annotate(search_rank=RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {self.book_table} "
+            f"WHERE book_id = {queryset.model._meta.db_table}.id", [match]
+        ))
+
+    def filter_authors(self, queryset, terms):
+        match = self.match_expression(terms)
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT author_id FROM {self.author_table} WHERE document @@ to_tsquery('simple', %s)", [match]
+            )
+        ).annotate(search_rank=RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {self.author_table} "
+            f"WHERE author_id = {Author._meta.db_table}.id", [match]
+        ))
+
+    def index_books(self, cursor, book_ids=None):
+        where, params = '', []
+        if book_ids is None:
+            cursor.execute(f'TRUNCATE {self.book_table}')
+        else:
+            where, params = ' WHERE b.id = ANY(%s)', [list(book_ids)]
+        cursor.execute(
+            f'INSERT INTO {self.book_table} (book_id, document) ' + self.BOOK_DOCUMENT_SQL + where
+            + ' ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document', params
+        )
+
+    def remove_books(self, cursor, book_ids):
+        cursor.execute(f'DELETE FROM {self.book_table} WHERE book_id = ANY(%s)', [list(book_ids)])
+
+    def index_authors(self, cursor, author_ids=None):
+        where, params = '', []
+        if author_ids is None:
+            cursor.execute(f'TRUNCATE {self.author_table}')
+        else:
+            where, params = ' WHERE id = ANY(%s)', [list(author_ids)]
+        cursor.execute(
+            f"INSERT INTO {self.author_table} (author_id, document) "
+            f"SELECT id, to_tsvector('simple', name) FROM bookshop_author" + where
+            + ' ON CONFLICT (author_id) DO UPDATE SET document = EXCLUDED.document', params
+        )
+
+    def remove_authors(self, cursor, author_ids):
+        cursor.execute(f'DELETE FROM {self.author_table} WHERE author_id = ANY(%s)', [list(author_ids)])
+
+
+class FallbackSearchBackend:
+    """Plain icontains matching for backends without a full-text index."""
+    rank_ordering = 'title'
+
+    def create(self, cursor):
+        pass
+
+    def drop(self, cursor):
+        pass
+
+    def filter_books(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(title__icontains=term)
+        return queryset
+
+    def filter_authors(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(name__icontains=term)
+        return queryset
+
+    def index_books(self, cursor, book_ids=None):
+        pass
+
+    def remove_books(self, cursor, book_ids):
+        pass
+
+    def index_authors(self, cursor, author_ids=None):
+        pass
+
+    def remove_authors(self, cursor, author_ids):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor, FallbackSearchBackend)()
+
+
+def _write_connection(model):
+    return connections[router.db_for_write(model)]
+
+
+def search_books(queryset, query):
+    """Return (queryset, ordering) for books matching `query`, or None if it has no terms."""
+    terms = tokenize(query)
+    if not terms:
+        return None
+    backend = get_backend(connections[queryset.db])
+    return backend.filter_books(queryset, terms), backend.rank_ordering
+
+
+def search_authors(queryset, query):
+    terms = tokenize(query)
+    if not terms:
+        return None
+    backend = get_backend(connections[queryset.db])
+    return backend.filter_authors(queryset, terms), backend.rank_ordering
+
+
+def reindex_books(book_ids):
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    connection = _write_connection(Book)
+    with connection.cursor() as cursor:
+        get_backend(connection).index_books(cursor, book_ids)
+
+
+def remove_books(book_ids):
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    connection = _write_connection(Book)
+    with connection.cursor() as cursor:
+        get_backend(connection).remove_books(cursor, book_ids)
+
+
+def reindex_authors(author_ids):
+    author_ids = list(author_ids)
+    if not author_ids:
+        return
+    connection = _write_connection(Author)
+    with connection.cursor() as cursor:
+        get_backend(connection).index_authors(cursor, author_ids)
+
+
+def remove_authors(author_ids):
+    author_ids = list(author_ids)
+    if not author_ids:
+        return
+    connection = _write_connection(Author)
+    with connection.cursor() as cursor:
+        get_backend(connection).remove_authors(cursor, author_ids)
+
+
+def rebuild(connection):
+    backend = get_backend(connection)
+    with connection.cursor() as cursor:
+        backend.create(cursor)
+        backend.index_books(cursor)
+        backend.index_authors(cursor)
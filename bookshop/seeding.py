@@ -0,0 +1,188 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import changes, listings, recommendations, search, stats
+from .caching import CATALOG_MODELS, bump_version
+from .models import Book, Author, Publisher, Genre, BookAuthor, BookGenre, User, Order, OrderItem
+
+BATCH_SIZE = 2000
+GENRES = [
+    'Fantasy', 'Science Fiction', 'Mystery', 'Thriller', 'Romance', 'Horror', 'History', 'Biography',
+    'Poetry', 'Kids', 'Young Adult', 'Business', 'Programming', 'Travel', 'Cooking', 'Philosophy',
+]
+FIRST_NAMES = [
+    'Olena', 'Taras', 'Lesya', 'Ivan', 'Maria', 'Andriy', 'Sofia', 'Mykola', 'Anna', 'Petro',
+    'Emma', 'James', 'Chloe', 'Lucas', 'Hana', 'Kenji', 'Amara', 'Diego', 'Ines', 'Oskar',
+]
+LAST_NAMES = [
+    'Kovalenko', 'Shevchenko', 'Bondarenko', 'Tkachenko', 'Melnyk', 'Franko', 'Ukrainka', 'Smith',
+    'Garcia', 'Tanaka', 'Novak', 'Okafor', 'Larsen', 'Moreau', 'Rossi', 'Silva', 'Weber', 'Kim',
+]
+TITLE_WORDS = [
+    'Shadow', 'River', 'Garden', 'Empire', 'Night', 'Silent', 'Dragon', 'Winter', 'Last', 'Hidden',
+    'City', 'Stars', 'Glass', 'Iron', 'Song', 'Storm', 'Memory', 'Forest', 'Secret', 'Journey',
+    'Fire', 'Ocean', 'Clockwork', 'Letters', 'House', 'Mountain', 'Kingdom', 'Machine', 'Light', 'Salt',
+]
+PUBLISHER_WORDS = ['Books', 'Press', 'Publishing', 'House', 'Editions', 'Media']
+STATUSES = ['created'] * 6 + ['shipped'] * 3 + ['cancelled']
+
+
+def _batches(objects, size):
+    for start in range(0, len(objects), size):
+        yield objects[start:start + size]
+
+
+class CatalogSeeder:
+    """
+    Generates a plausible catalog (and order history) with bulk_create.
+
+    bulk_create skips model signals, so the search index is refreshed per
+    batch, BookStats is rebuilt from the generated orders and the catalog
+    cache versions are bumped once at the end. A fixed `seed` gives the same
+    data on every run against an empty database.
+    """
+
+    def __init__(self, seed=0, batch_size=BATCH_SIZE):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = timezone.now()
+
+    def title(self):
+        words = self.random.sample(TITLE_WORDS, self.random.randint(1, 3))
+        return ('The ' if self.random.random() < 0.4 else '') + ' '.join(words)
+
+    def sentence(self, words):
+        return ' '.join(self.random.choice(TITLE_WORDS).lower() for _ in range(words)).capitalize() + '.'
+
+    @transaction.atomic
+    def run(self, books, authors, orders, publishers=None):
+        publishers = self.seed_publishers(publishers or max(5, books // 200))
+        genres = self.seed_genres()
+        author_ids = self.seed_authors(authors)
+        book_ids = self.seed_books(books, publishers, genres, author_ids)
+        order_count = self.seed_orders(orders, book_ids)
+        if order_count:
+            stats.rebuild()
+            recommendations.rebuild_co_purchases()
+        for model in CATALOG_MODELS:
+            bump_version(model)
+        for kind in changes.KINDS:
+            changes.publish(kind)
+        return {'books': len(book_ids), 'authors': len(author_ids), 'publishers': len(publishers), 'orders': order_count}
+
+    def seed_publishers(self, count):
+        created = Publisher.objects.bulk_create([
+            Publisher(
+                name=f'{self.random.choice(LAST_NAMES)} {self.random.choice(PUBLISHER_WORDS)} {number}',
+                description=self.sentence(12),
+                website=f'https://publisher{number}.example.com',
+            )
+            for number in range(count)
+        ], batch_size=self.batch_size)
+        return [publisher.pk for publisher in created]
+
+    def seed_genres(self):
+        Genre.objects.bulk_create([Genre(name=name) for name in GENRES], ignore_conflicts=True)
+        return list(Genre.objects.values_list('id', flat=True))
+
+    def seed_authors(self, count):
+        ids = []
+        for batch in _batches(range(count), self.batch_size):
+            created = Author.objects.bulk_create([
+                Author(
+                    name=f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}',
+                    bio=self.sentence(20),
+                    photo_url=f'https://img.example.com/authors/{number}.jpg' if self.random.random() < 0.7 else '',
+                )
+                for number in batch
+            ])
+            ids.extend(author.pk for author in created)
+            search.reindex_authors([author.pk for author in created])
+        return ids
+
+    def seed_books(self, count, publisher_ids, genre_ids, author_ids):
+        ids = []
+        isbn_base = 9780000000000 + Book.objects.count()
+        for batch in _batches(range(count), self.batch_size):
+            created = Book.objects.bulk_create([
+                Book(
+                    title=self.title(),
+                    description=self.sentence(40),
+                    isbn=str(isbn_base + number),
+                    publisher_id=self.random.choice(publisher_ids),
+                    price=Decimal(self.random.randint(199, 5999)) / 100,
+                    currency='UAH',
+                    stock=self.random.randint(0, 200),
+                    pages=self.random.randint(80, 900),
+                    published_date=datetime.date(1950, 1, 1) + datetime.timedelta(days=self.random.randint(0, 27000)),
+                    cover_url=f'https://img.example.com/covers/{isbn_base + number}.jpg',
+                    rating=Decimal(self.random.randint(100, 500)) / 100,
+                    created_at=self.now - datetime.timedelta(minutes=self.random.randint(0, 2 * 365 * 24 * 60)),
+                )
+                for number in batch
+            ])
+            batch_ids = [book.pk for book in created]
+            if author_ids:
+                BookAuthor.objects.bulk_create([
+                    BookAuthor(book_id=book_id, author_id=author_id)
+                    for book_id in batch_ids
+                    for author_id in self.random.sample(author_ids, min(len(author_ids), self.random.choice((1, 1, 1, 2, 3))))
+                ])
+            BookGenre.objects.bulk_create([
+                BookGenre(book_id=book_id, genre_id=genre_id)
+                for book_id in batch_ids
+                for genre_id in self.random.sample(genre_ids, self.random.choice((1, 1, 2)))
+            ])
+            listings.refresh(batch_ids)
+            search.reindex_books(batch_ids)
+            ids.extend(batch_ids)
+        return ids
+
+    def seed_orders(self, count, book_ids):
+        if not count or not book_ids:
+            return 0
+        password = make_password(None)
+        users = User.objects.bulk_create([
+            User(
+                name=f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}',
+                email=f'customer{number}@example.com',
+                password_hash=password,
+                role='user',
+                created_at=self.now,
+                updated_at=self.now,
+            )
+            for number in range(max(1, count // 5))
+        ], batch_size=self.batch_size)
+        prices = dict(Book.objects.filter(id__in=book_ids).values_list('id', 'price'))
+
+        for batch in _batches(range(count), self.batch_size):
+            lines = []
+            orders = []
+            for _ in batch:
+                items = [
+                    (book_id, self.random.randint(1, 3))
+                    for book_id in self.random.sample(book_ids, min(len(book_ids), self.random.randint(1, 4)))
+                ]
+                lines.append(items)
+                orders.append(Order(
+                    user=self.random.choice(users),
+                    status=self.random.choice(STATUSES),
+                    total_amount=sum(prices[book_id] * quantity for book_id, quantity in items),
+                    created_at=self.now - datetime.timedelta(minutes=self.random.randint(0, 90 * 24 * 60)),
+                ))
+            Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, book_id=book_id, quantity=quantity, unit_price=prices[book_id])
+                for order, items in zip(orders, lines)
+                for book_id, quantity in items
+            ])
+        return count
+
+
+def seed_catalog(books, authors, orders, publishers=None, seed=0, batch_size=BATCH_SIZE):
+    return CatalogSeeder(seed, batch_size).run(books, authors, orders, publishers)
@@ -1,43 +1,176 @@
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from rest_framework import serializers
-from .models import Book, Author, Publisher, Genre, User
+from .models import Book, Author, Publisher, Genre, User, BookAuthor, BookListing, CartItem, Order, OrderItem
 
-class AuthorSerializer(serializers.ModelSerializer):
-    book_count = serializers.IntegerField(source='books.count')
+
+class QuerysetOptimizationMixin:
+    """
+    Lets a serializer declare the joins and aggregates it reads, so views can
+    build a queryset that serializes in a constant number of queries.
+
+    `prefetch_related` maps a relation name to the serializer used for it (or
+    None); the related queryset is optimized for that serializer in turn.
+    """
+    select_related = ()
+    prefetch_related = {}
+    annotations = {}
+
+    @classmethod
+    def optimize(cls, queryset):
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if cls.annotations:
+            queryset = queryset.annotate(**cls.annotations)
+        lookups = []
+        for name, serializer_class in cls.prefetch_related.items():
+            if serializer_class is None:
+                lookups.append(name)
+            else:
+                related = serializer_class.Meta.model._default_manager.all()
+                # Ordered so nested lists come out the same on every backend.
+                lookups.append(Prefetch(name, queryset=serializer_class.optimize(related).order_by('pk')))
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups)
+        return queryset
+
+
+class AuthorSerializer(QuerysetOptimizationMixin, serializers.ModelSerializer):
+    book_count = serializers.SerializerMethodField()
+
+    # A correlated count rather than Count('bookauthor'): when authors are
+    # prefetched for a page of books, the prefetch filter reuses that join and
+    # the count would only cover the books on the page.
+    annotations = {'book_count': Coalesce(Subquery(
+        BookAuthor.objects.filter(author=OuterRef('pk')).order_by()
+        .values('author').annotate(count=Count('id')).values('count')
+    ), 0)}
 
     class Meta:
         model = Author
         fields = ['id','name','bio','photo_url','book_count']
 
-class PublisherSerializer(serializers.ModelSerializer):
+    def get_book_count(self, obj):
+        if hasattr(obj, 'book_count'):
+            return obj.book_count
+        return obj.books.count()
+
+class PublisherSerializer(QuerysetOptimizationMixin, serializers.ModelSerializer):
     class Meta:
         model = Publisher
         fields = ['id','name','description','website']
 
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(QuerysetOptimizationMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = ['id','name']
 
-class BookListSerializer(serializers.ModelSerializer):
+class BookListSerializer(QuerysetOptimizationMixin, serializers.ModelSerializer):
     authors = AuthorSerializer(many=True)
     publisher = PublisherSerializer()
     genres = GenreSerializer(many=True)
 
+    select_related = ('publisher',)
+    prefetch_related = {'authors': AuthorSerializer, 'genres': GenreSerializer}
+
     class Meta:
         model = Book
         fields = ['id','title','authors','publisher','price','currency','stock','rating','genres','cover_url']
 
-class BookDetailSerializer(serializers.ModelSerializer):
+class BookDetailSerializer(QuerysetOptimizationMixin, serializers.ModelSerializer):
     authors = AuthorSerializer(many=True)
     publisher = PublisherSerializer()
     genres = GenreSerializer(many=True)
+    available = serializers.SerializerMethodField()
+
+    select_related = ('publisher',)
+    prefetch_related = {'authors': AuthorSerializer, 'genres': GenreSerializer}
+    # Stock not held by carts.
+    annotations = {'available': Greatest(F('stock') - Coalesce(Subquery(
+        BookListing.objects.filter(pk=OuterRef('pk')).values('reserved')
+    ), 0), 0)}
 
     class Meta:
         model = Book
-        fields = '__all__'
+        # Listed rather than '__all__', so bookkeeping columns (updated_at, popularity) stay private.
+        fields = [
+            'id','authors','publisher','genres','available','title','description','isbn','price','currency',
+            'stock','pages','published_date','cover_url','rating','created_at',
+        ]
+
+    def get_available(self, obj):
+        if hasattr(obj, 'available'):
+            return obj.available
+        reserved = BookListing.objects.filter(pk=obj.pk).values_list('reserved', flat=True).first() or 0
+        return max(obj.stock - reserved, 0)
+
+class CartItemSerializer(serializers.ModelSerializer):
+    bookId = serializers.PrimaryKeyRelatedField(source='book', queryset=Book.objects.all())
+    title = serializers.CharField(source='book.title', read_only=True)
+    price = serializers.DecimalField(source='book.price', max_digits=10, decimal_places=2, read_only=True)
+    heldUntil = serializers.DateTimeField(source='held_until', read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['bookId','title','price','quantity','heldUntil']
+        extra_kwargs = {'quantity': {'min_value': 1}}
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    bookId = serializers.IntegerField(source='book_id')
+    title = serializers.CharField(source='book.title')
+    price = serializers.DecimalField(source='unit_price', max_digits=10, decimal_places=2)
+
+    class Meta:
+        model = OrderItem
+        fields = ['bookId','title','price','quantity']
+
+class OrderSerializer(QuerysetOptimizationMixin, serializers.ModelSerializer):
+    orderId = serializers.IntegerField(source='id')
+    total = serializers.DecimalField(source='total_amount', max_digits=12, decimal_places=2)
+    items = OrderItemSerializer(many=True)
+
+    prefetch_related = {'items__book': None}
+
+    class Meta:
+        model = Order
+        fields = ['orderId','status','total','created_at','items']
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['name', 'email', 'created_at']
 
+
+class BatchItemMixin:
+    """
+    An item of a batch write (see bookshop.batch). `id` picks the row to
+    update, and relations are plain ids that the batch writer checks for the
+    whole batch at once, so validating an item never queries the database.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        fields['id'] = serializers.IntegerField(min_value=1, required=False)
+        return fields
+
+class BookBatchSerializer(BatchItemMixin, serializers.ModelSerializer):
+    publisher_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    authors = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    genres = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+    class Meta:
+        model = Book
+        fields = [
+            'title', 'description', 'isbn', 'publisher_id', 'price', 'currency', 'stock', 'pages',
+            'published_date', 'cover_url', 'rating', 'authors', 'genres',
+        ]
+        extra_kwargs = {'description': {'required': False, 'allow_blank': True}, 'currency': {'required': False}}
+
+class AuthorBatchSerializer(BatchItemMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Author
+        fields = ['name', 'bio', 'photo_url']
+
+class PublisherBatchSerializer(BatchItemMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Publisher
+        fields = ['name', 'description', 'website']
@@ -0,0 +1,289 @@
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import changes, instrumentation, listings, orders, recommendations, stats, tasks
+from .caching import CATALOG_MODELS, bump_version
+from .models import Book, Author, Publisher, Genre, BookAuthor, BookGenre, CartItem, Order, OrderItem
+
+# WAL lets readers run alongside the single writer; NORMAL sync is safe under WAL.
+SQLITE_PRAGMAS = [
+    'journal_mode = WAL',
+    'synchronous = NORMAL',
+    'cache_size = -32000',
+    'temp_store = MEMORY',
+    'mmap_size = 134217728',
+]
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {pragma}')
+
+
+@receiver(connection_created)
+def instrument_queries(sender, connection, **kwargs):
+    if instrumentation.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrumentation.record_query)
+
+
+def batch_delete(rows):
+    """
+    QuerySet.delete() for bookshop.batch and catalog_io: cascades and SET_NULL
+    go as deep as the models do, but the per-row catalog receivers below skip
+    the listing, search, change feed and cache work the caller does once for
+    the whole batch.
+    """
+    rows._batch_write = True
+    return rows.delete()
+
+
+def batched(origin):
+    return isinstance(origin, QuerySet) and getattr(origin, '_batch_write', False)
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    tasks.reindex_books.delay([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, origin=None, **kwargs):
+    if not batched(origin):
+        tasks.remove_books.delay([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def index_author(sender, instance, created, **kwargs):
+    tasks.reindex_authors.delay([instance.pk])
+    if not created:
+        tasks.reindex_author_books.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Author)
+def unindex_author(sender, instance, origin=None, **kwargs):
+    if not batched(origin):
+        tasks.remove_authors.delay([instance.pk])
+
+
+@receiver(post_save, sender=Genre)
+def index_genre(sender, instance, created, **kwargs):
+    if not created:
+        tasks.reindex_genre_books.delay(instance.pk)
+
+
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+@receiver(post_save, sender=BookGenre)
+@receiver(post_delete, sender=BookGenre)
+def index_book_relation(sender, instance, origin=None, **kwargs):
+    if not batched(origin):
+        tasks.reindex_books.delay([instance.book_id])
+
+
+@receiver(m2m_changed, sender=BookAuthor)
+@receiver(m2m_changed, sender=BookGenre)
+def index_book_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            tasks.reindex_books.delay([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_book_ids = list(instance.books.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        tasks.reindex_books.delay(sorted(getattr(instance, '_cleared_book_ids', [])))
+    elif action in ('post_add', 'post_remove'):
+        tasks.reindex_books.delay(sorted(pk_set))
+
+
+# BookListing is updated in the writing transaction, so listings never show a
+# book that is not committed or miss one that is.
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookAuthor)
+@receiver(post_delete, sender=BookAuthor)
+@receiver(post_save, sender=BookGenre)
+@receiver(post_delete, sender=BookGenre)
+def refresh_book_listing(sender, instance, origin=None, **kwargs):
+    if not batched(origin):
+        listings.refresh([instance.pk if sender is Book else instance.book_id])
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_listing(sender, instance, origin=None, **kwargs):
+    if not batched(origin):
+        listings.remove([instance.pk])
+
+
+@receiver(m2m_changed, sender=BookAuthor)
+@receiver(m2m_changed, sender=BookGenre)
+def refresh_listing_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            listings.refresh([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_listing_ids = list(instance.books.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        listings.refresh(getattr(instance, '_cleared_listing_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        listings.refresh(pk_set)
+
+
+@receiver(post_save, sender=Author)
+def refresh_author_listings(sender, instance, created, **kwargs):
+    if not created:
+        listings.refresh_authors([instance.pk])
+
+
+@receiver(post_save, sender=Genre)
+def refresh_genre_listings(sender, instance, created, **kwargs):
+    if not created:
+        listings.refresh_genres([instance.pk])
+
+
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+def refresh_publisher_listings(sender, instance, created=False, origin=None, **kwargs):
+    if created or batched(origin):
+        return
+    # Deleting a publisher nulls Book.publisher without any Book signals.
+    listings.refresh_publishers([instance.pk])
+
+
+# Book changes reach the change feed through bookshop.listings.
+FEED_KINDS = {Author: 'authors', Publisher: 'publishers', Genre: 'genres'}
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def publish_name_change(sender, instance, origin=None, **kwargs):
+    if not batched(origin):
+        changes.publish(FEED_KINDS[sender], [instance.pk])
+
+
+def bump_catalog_version(sender, action='post_save', origin=None, **kwargs):
+    if action.startswith('post_') and not batched(origin):
+        # The task bumps again after commit: a concurrent read may have cached pre-commit data under this bump.
+        bump_version(sender)
+        tasks.refresh_catalog_cache.delay([sender._meta.model_name])
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(bump_catalog_version, sender=model, dispatch_uid=f'bump_version_{model.__name__}')
+    post_delete.connect(bump_catalog_version, sender=model, dispatch_uid=f'bump_version_delete_{model.__name__}')
+for model in (BookAuthor, BookGenre):
+    m2m_changed.connect(bump_catalog_version, sender=model, dispatch_uid=f'bump_version_m2m_{model.__name__}')
+
+
+# Sales stats and co-purchase counts are counters moved in the writing
+# transaction: a delta applied once, unlike a recount, cannot go through the
+# retrying, deduplicating task queue. Cancelled orders do not count.
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_status_change(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_status', None)
+    if created or previous is None or previous == instance.status:
+        return
+    if 'cancelled' in (previous, instance.status):
+        items = list(instance.items.values_list('book_id', 'quantity', 'unit_price'))
+        basket = {book_id for book_id, _, _ in items}
+        if instance.status == 'cancelled':
+            stats.record_sales(items, instance.created_at, -1)
+            recommendations.record_baskets(basket)
+        else:
+            stats.record_sales(items, instance.created_at)
+            recommendations.record_baskets((), basket)
+        tasks.refresh_related_books.delay(sorted(basket))
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_co_purchases(sender, instance, **kwargs):
+    # Its items' own signals take their sales away, but cannot see each other once deleted together.
+    if instance.status != 'cancelled':
+        recommendations.record_baskets(_basket(instance.pk))
+
+
+def _counted_order(order_id):
+    """When the order was placed, or None when its sales do not count."""
+    return Order.objects.filter(pk=order_id).exclude(status='cancelled').values_list('created_at', flat=True).first()
+
+
+def _basket(order_id):
+    return set(OrderItem.objects.filter(order_id=order_id).values_list('book_id', flat=True))
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item(sender, instance, **kwargs):
+    instance._previous_item = None
+    if instance.pk:
+        previous = OrderItem.objects.filter(pk=instance.pk).values_list('book_id', 'quantity', 'unit_price')
+        instance._previous_item = previous.first()
+    instance._previous_basket = _basket(instance.order_id)
+
+
+@receiver(post_save, sender=OrderItem)
+def add_book_sales(sender, instance, **kwargs):
+    ordered_at = _counted_order(instance.order_id)
+    basket = _basket(instance.order_id)
+    previous_basket = getattr(instance, '_previous_basket', set())
+    if ordered_at is not None:
+        previous = getattr(instance, '_previous_item', None)
+        if previous is not None:
+            stats.record_sales([previous], ordered_at, -1)
+        stats.record_sales([(instance.book_id, instance.quantity, instance.unit_price)], ordered_at)
+        recommendations.record_baskets(previous_basket, basket)
+    # The other books of the order gained or lost a co-purchase too.
+    tasks.refresh_related_books.delay(sorted(basket | previous_basket))
+
+
+@receiver(pre_delete, sender=OrderItem)
+def remove_item_co_purchases(sender, instance, origin=None, **kwargs):
+    """
+    Take the items being deleted out of their orders' baskets, once per
+    delete() call: the signals of items deleted together all run before any
+    of them is gone. Deleting whole orders is left to remove_order_co_purchases().
+    """
+    if origin is instance:
+        going = [(instance.order_id, instance.book_id)]
+    elif isinstance(origin, QuerySet) and origin.model is OrderItem and not getattr(origin, '_baskets_moved', False):
+        origin._baskets_moved = True
+        going = list(origin.values_list('order_id', 'book_id'))
+    else:
+        return
+    by_order = {}
+    for order_id, book_id in going:
+        by_order.setdefault(order_id, set()).add(book_id)
+    for order_id, book_ids in by_order.items():
+        if _counted_order(order_id) is not None:
+            basket = _basket(order_id)
+            recommendations.record_baskets(basket, basket - book_ids)
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_book_sales(sender, instance, **kwargs):
+    ordered_at = _counted_order(instance.order_id)
+    if ordered_at is not None:
+        stats.record_sales([(instance.book_id, instance.quantity, instance.unit_price)], ordered_at, -1)
+    basket = _basket(instance.order_id)
+    tasks.refresh_related_books.delay(sorted(basket | {instance.book_id}))
+
+
+@receiver(post_delete, sender=CartItem)
+def release_cart_hold(sender, instance, **kwargs):
+    # Covers removing a line and the cascades from deleted users and books.
+    if instance.held_until:
+        orders.release({instance.book_id: instance.quantity})
@@ -0,0 +1,106 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import listings
+from .models import Book, BookStats, OrderItem
+
+WINDOWS = {'units_sold_7d': 7, 'units_sold_30d': 30}
+REBUILD_BATCH_SIZE = 1000
+
+
+def sales_rows(book_ids=None):
+    """Per-book aggregates over non-cancelled OrderItems, as one GROUP BY."""
+    now = timezone.now()
+    items = OrderItem.objects.exclude(order__status='cancelled')
+    if book_ids is not None:
+        items = items.filter(book_id__in=book_ids)
+    windows = {
+        field: Coalesce(Sum('quantity', filter=Q(order__created_at__gte=now - datetime.timedelta(days=days))), 0)
+        for field, days in WINDOWS.items()
+    }
+    return items.values('book_id').order_by().annotate(
+        units_sold=Sum('quantity'),
+        revenue=Sum(F('quantity') * F('unit_price')),
+        **windows,
+    )
+
+
+def sync_popularity():
+    units_30d = BookStats.objects.filter(book=OuterRef('pk')).values('units_sold_30d')
+    Book.objects.update(popularity=Coalesce(Subquery(units_30d), 0))
+    listings.copy_columns(['popularity'])
+
+
+@transaction.atomic
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    """Recompute BookStats and Book.popularity from the full OrderItem history."""
+    BookStats.objects.all().delete()
+    batch = []
+    count = 0
+    for row in sales_rows().iterator(chunk_size=batch_size):
+        batch.append(BookStats(book_id=row.pop('book_id'), **row))
+        if len(batch) >= batch_size:
+            BookStats.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    BookStats.objects.bulk_create(batch)
+    count += len(batch)
+    sync_popularity()
+    return count
+
+
+def record_sales(items, ordered_at, sign=1):
+    """
+    Add the (book_id, quantity, unit_price) `items` of an order placed at
+    `ordered_at` to BookStats and Book.popularity, or take them away with
+    `sign` -1, as F() increments in the caller's transaction: a sale costs an
+    UPDATE per book however long its history is. The windows count an order
+    while it is inside them; refresh_windows() drops the orders that left.
+    """
+    now = timezone.now()
+    deltas = {}
+    for book_id, quantity, unit_price in items:
+        delta = deltas.setdefault(book_id, dict.fromkeys(('units_sold', 'revenue', *WINDOWS), 0))
+        delta['units_sold'] += quantity
+        delta['revenue'] += quantity * unit_price
+        for field, days in WINDOWS.items():
+            if ordered_at >= now - datetime.timedelta(days=days):
+                delta[field] += quantity
+    if not deltas:
+        return
+    BookStats.objects.bulk_create([BookStats(book_id=book_id) for book_id in deltas], ignore_conflicts=True)
+    for book_id, delta in sorted(deltas.items()):
+        BookStats.objects.filter(pk=book_id).update(
+            **{field: Greatest(F(field) + sign * value, 0) for field, value in delta.items()}, updated_at=now,
+        )
+        if delta['units_sold_30d']:
+            Book.objects.filter(pk=book_id).update(
+                popularity=Greatest(F('popularity') + sign * delta['units_sold_30d'], 0),
+            )
+    popular = [book_id for book_id, delta in deltas.items() if delta['units_sold_30d']]
+    if popular:
+        listings.copy_columns(['popularity'], popular)
+
+
+@transaction.atomic
+def refresh_windows(batch_size=REBUILD_BATCH_SIZE):
+    """
+    Roll the 7/30-day windows forward; only recomputes the window columns.
+    Sales only ever enter the windows, so this has to run daily
+    (`manage.py rebuild_book_stats --windows-only`).
+    """
+    since = timezone.now() - datetime.timedelta(days=max(WINDOWS.values()))
+    BookStats.objects.update(**{field: 0 for field in WINDOWS})
+    recent = sales_rows().filter(order__created_at__gte=since)
+    batch = []
+    for row in recent.iterator(chunk_size=batch_size):
+        batch.append(BookStats(book_id=row['book_id'], **{field: row[field] for field in WINDOWS}))
+        if len(batch) >= batch_size:
+            BookStats.objects.bulk_update(batch, list(WINDOWS))
+            batch = []
+    BookStats.objects.bulk_update(batch, list(WINDOWS))
+    sync_popularity()
@@ -0,0 +1,62 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+NDJSON = 'application/x-ndjson'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Lets content negotiation accept NDJSON; non-streamed data renders as one line per list item."""
+    media_type = NDJSON
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join((_dumps(item) + '\n').encode() for item in items)
+
+
+def stream_format(request):
+    """'ndjson' or 'json' when the client opted into a streamed response, else None."""
+    if NDJSON in request.META.get('HTTP_ACCEPT', ''):
+        return 'ndjson'
+    if request.GET.get('stream') in ('1', 'true'):
+        return 'json'
+    return None
+
+
+def _dumps(value):
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _json_chunks(head, key, items):
+    # Re-open the head object so the list can be streamed into it.
+    prefix = _dumps(head)[:-1]
+    yield (prefix + (',' if head else '') + _dumps(key) + ':[').encode()
+    first = True
+    for item in items:
+        yield ((',' if not first else '') + _dumps(item)).encode()
+        first = False
+    yield b']}'
+
+
+def _ndjson_chunks(head, items):
+    if head:
+        yield (_dumps(head) + '\n').encode()
+    for item in items:
+        yield (_dumps(item) + '\n').encode()
+
+
+def streaming_response(fmt, items, head=None, key='data'):
+    """
+    Stream `items` either as `{...head, key: [items]}` or, for ndjson, as
+    the head object (if any) followed by one item per line.
+    """
+    head = dict(head or {})
+    if fmt == 'ndjson':
+        return StreamingHttpResponse(_ndjson_chunks(head, items), content_type=NDJSON)
+    return StreamingHttpResponse(_json_chunks(head, key, items), content_type='application/json')
@@ -0,0 +1,374 @@
+import base64
+import bisect
+import datetime
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+from array import array
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import changes, listings, routers
+from .models import Author, BookListing, Genre, Publisher
+
+SUGGEST_LIMIT = 5
+MAX_SUGGEST_LIMIT = 20
+# File written by `manage.py build_suggest_snapshot`; processes load it instead of reading every name.
+SNAPSHOT_PATH = getattr(settings, 'BOOKSHOP_SUGGEST_SNAPSHOT', '')
+# Names changed this long before the snapshot are read again: their transaction may have committed after it.
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+# Names re-read per query when applying changes.
+READ_BATCH_SIZE = 1000
+# Characters of a query (and of each indexed word suffix) that are compared.
+KEY_LENGTH = 32
+# Prefixes matching more words than this have their top names kept until the next change.
+SCAN_LIMIT = 200
+TOP_CACHE_SIZE = 10000
+SNAPSHOT_FORMAT = 2
+# A letter or digit not preceded by one.
+WORD_START = re.compile(r'(?<![^\W_])[^\W_]')
+
+
+def fold(text):
+    """The form names and queries are compared in: case-folded, single spaces."""
+    return ' '.join(text.split()).casefold()
+
+
+def word_starts(folded):
+    """Offsets of the words in a folded name, up to the 256 a key can address."""
+    return [match.start() for match in WORD_START.finditer(folded, 0, 256)]
+
+
+class PrefixIndex:
+    """
+    The names of one kind, found by a prefix of any of their words and
+    ranked by score.
+
+    Each word start is a key packed in one 8-byte int (slot << 8 | offset)
+    in an array sorted by the folded text from that offset, so a prefix is a
+    contiguous range found by bisection. Names are kept once, as given;
+    keys are folded when compared. Ids and scores are arrays indexed by slot.
+    Removing a name leaves its slot empty until the next build.
+    """
+
+    def __init__(self, ids, names, scores, keys):
+        self.ids = ids
+        self.names = names
+        self.scores = scores
+        self.keys = keys
+        # Slots below `ordered` hold ascending ids; later ones are found through `extra`.
+        self.ordered = len(ids)
+        self.extra = {}
+        self.size = sum(1 for name in names if name is not None)
+        self.top = {}
+
+    @classmethod
+    def build(cls, rows):
+        """From (id, name, score) rows in id order."""
+        ids, names, scores = array('q'), [], array('q')
+        for pk, name, score in rows:
+            ids.append(pk)
+            names.append(name)
+            scores.append(score or 0)
+        folded = [fold(name) for name in names]
+        keys = [slot << 8 | offset for slot, text in enumerate(folded) for offset in word_starts(text)]
+        keys.sort(key=lambda packed: folded[packed >> 8][(packed & 255):(packed & 255) + KEY_LENGTH])
+        return cls(ids, names, scores, array('Q', keys))
+
+    def _key(self, length=KEY_LENGTH):
+        names = self.names
+        return lambda packed: fold(names[packed >> 8])[packed & 255:][:length]
+
+    def slot(self, pk):
+        if pk in self.extra:
+            return self.extra[pk]
+        slot = bisect.bisect_left(self.ids, pk, 0, self.ordered)
+        if slot < self.ordered and self.ids[slot] == pk:
+            return slot
+        return None
+
+    def _link(self, slot):
+        folded = fold(self.names[slot])
+        key = self._key()
+        for offset in word_starts(folded):
+            position = bisect.bisect_left(self.keys, folded[offset:][:KEY_LENGTH], key=key)
+            self.keys.insert(position, slot << 8 | offset)
+
+    def _unlink(self, slot):
+        folded = fold(self.names[slot])
+        key = self._key()
+        for offset in word_starts(folded):
+            packed = slot << 8 | offset
+            position = bisect.bisect_left(self.keys, folded[offset:][:KEY_LENGTH], key=key)
+            while self.keys[position] != packed:
+                position += 1
+            del self.keys[position]
+
+    def put(self, pk, name, score):
+        score = score or 0
+        slot = self.slot(pk)
+        if slot is not None and self.names[slot] == name:
+            if self.scores[slot] != score:
+                self.scores[slot] = score
+                self.top.clear()
+            return
+        if slot is None:
+            slot = len(self.ids)
+            if self.ordered == slot and (not slot or pk > self.ids[-1]):
+                self.ordered += 1
+            else:
+                self.extra[pk] = slot
+            self.ids.append(pk)
+            self.names.append(None)
+            self.scores.append(0)
+        if self.names[slot] is None:
+            self.size += 1
+        else:
+            self._unlink(slot)
+        self.names[slot] = name
+        self.scores[slot] = score
+        self._link(slot)
+        self.top.clear()
+
+    def remove(self, pk):
+        slot = self.slot(pk)
+        if slot is None or self.names[slot] is None:
+            return
+        self._unlink(slot)
+        self.names[slot] = None
+        self.scores[slot] = 0
+        self.size -= 1
+        self.top.clear()
+
+    def live_ids(self):
+        return {pk for pk, name in zip(self.ids, self.names) if name is not None}
+
+    def _best(self, lo, hi, limit):
+        slots = {packed >> 8 for packed in self.keys[lo:hi]}
+        scores = self.scores
+        # Ties go to the older name.
+        return heapq.nlargest(limit, slots, key=lambda slot: (scores[slot], -slot))
+
+    def lookup(self, prefix, limit):
+        """[(id, name)] of the top `limit` names with a word starting with the folded `prefix`."""
+        key = self._key(len(prefix))
+        lo = bisect.bisect_left(self.keys, prefix, key=key)
+        hi = bisect.bisect_right(self.keys, prefix, lo, key=key)
+        if hi - lo <= SCAN_LIMIT:
+            slots = self._best(lo, hi, limit)
+        else:
+            if prefix not in self.top:
+                if len(self.top) >= TOP_CACHE_SIZE:
+                    self.top.clear()
+                self.top[prefix] = self._best(lo, hi, MAX_SUGGEST_LIMIT)
+            slots = self.top[prefix][:limit]
+        return [(self.ids[slot], self.names[slot]) for slot in slots]
+
+    def dump(self):
+        """A JSON-ready dict; the arrays are base64, in the byte order of `byteorder`."""
+        live = [slot for slot, name in enumerate(self.names) if name is not None]
+        if len(live) < len(self.names) or self.extra:
+            # Compact: drop empty slots and put ids back in order.
+            return PrefixIndex.build(sorted((self.ids[s], self.names[s], self.scores[s]) for s in live)).dump()
+        encode = lambda values: base64.b64encode(values.tobytes()).decode('ascii')
+        return {
+            'byteorder': sys.byteorder, 'names': self.names,
+            'ids': encode(self.ids), 'scores': encode(self.scores), 'keys': encode(self.keys),
+        }
+
+    @classmethod
+    def load(cls, data):
+        arrays = []
+        for field, typecode in (('ids', 'q'), ('scores', 'q'), ('keys', 'Q')):
+            values = array(typecode, base64.b64decode(data[field]))
+            if data['byteorder'] != sys.byteorder:
+                values.byteswap()
+            arrays.append(values)
+        ids, scores, keys = arrays
+        if len(data['names']) != len(ids) or len(scores) != len(ids):
+            raise ValueError('The snapshot arrays do not match')
+        return cls(ids, list(data['names']), scores, keys)
+
+
+class NameSource:
+    """The (id, name, score) rows of one kind of name."""
+
+    def __init__(self, model, name, score, tracks_updates=True):
+        self.model = model
+        self.name = name
+        self.score = score
+        # Without an updated_at column every row counts as changed.
+        self.tracks_updates = tracks_updates
+
+    def rows(self, queryset=None):
+        queryset = self.model._default_manager.all() if queryset is None else queryset
+        return queryset.annotate(score=self.score).order_by('pk').values_list('pk', self.name, 'score')
+
+
+# Authors, publishers and genres rank by the 30-day sales of their books.
+BOOK_POPULARITY = Coalesce(Sum('books__popularity'), 0)
+SOURCES = {
+    'books': NameSource(BookListing, 'title', F('popularity')),
+    'authors': NameSource(Author, 'name', BOOK_POPULARITY),
+    'publishers': NameSource(Publisher, 'name', BOOK_POPULARITY),
+    # Genres have no updated_at; there are few enough to read them all.
+    'genres': NameSource(Genre, 'name', BOOK_POPULARITY, tracks_updates=False),
+}
+KINDS = tuple(SOURCES)
+
+
+class Suggester:
+    """
+    A PrefixIndex per kind for the process. It starts from the snapshot
+    when there is one, otherwise from the database, and then follows the
+    change feed (bookshop.changes): a request costs one cache read, and only
+    the names published there are read again. Book changes publish the
+    authors, publishers and genres they move the scores of.
+    """
+
+    def __init__(self):
+        self.indexes = None
+        self.feed = changes.Reader()
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    def _start(self):
+        # Started first, so changes committed while the names are read are applied again rather than lost.
+        self.feed.start()
+        snapshot = load_snapshot(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+        if snapshot is None:
+            return {kind: PrefixIndex.build(source.rows()) for kind, source in SOURCES.items()}
+        indexes, since = snapshot
+        self._catch_up(indexes, since - SYNC_OVERLAP)
+        return indexes
+
+    def _catch_up(self, indexes, since):
+        """Apply what changed since a snapshot was taken, and drop what was deleted."""
+        stale = {kind: set() for kind in KINDS}
+        books = BookListing.objects.filter(updated_at__gte=since).values_list('pk', 'publisher_id', 'authors', 'genres')
+        for pk, *links in books.iterator(chunk_size=READ_BATCH_SIZE):
+            stale['books'].add(pk)
+            for kind, ids in listings.linked([links]).items():
+                stale[kind].update(ids)
+        for kind, source in SOURCES.items():
+            names = source.model._default_manager.all()
+            if source.tracks_updates:
+                stale[kind].update(names.filter(updated_at__gte=since).values_list('pk', flat=True))
+            else:
+                stale[kind].update(names.values_list('pk', flat=True))
+            if names.count() != indexes[kind].size:
+                # Names were deleted, or committed later than the overlap allows.
+                live = set(names.values_list('pk', flat=True))
+                known = indexes[kind].live_ids()
+                stale[kind].update(live ^ known)
+        for kind, ids in stale.items():
+            self._apply(indexes[kind], SOURCES[kind], ids)
+
+    def _apply(self, index, source, ids):
+        """Read the names `ids` again; those that are gone are removed."""
+        ids = sorted(ids)
+        for start in range(0, len(ids), READ_BATCH_SIZE):
+            batch = ids[start:start + READ_BATCH_SIZE]
+            rows = list(source.rows(source.model._default_manager.filter(pk__in=batch)))
+            found = {row[0] for row in rows}
+            with self.lock:
+                for pk in batch:
+                    if pk not in found:
+                        index.remove(pk)
+                for pk, name, score in rows:
+                    index.put(pk, name, score)
+
+    def _replace(self, indexes):
+        with self.lock:
+            self.indexes = indexes
+
+    def sync(self):
+        """
+        Apply the changes published since the last sync; another thread's
+        sync is not waited for. The names are read on the primary, so a
+        lagging replica cannot hand back the rows from before the change.
+        """
+        token = routers.pin_to_primary()
+        try:
+            self._sync()
+        finally:
+            routers.release(token)
+
+    def _sync(self):
+        if self.indexes is None:
+            with self.sync_lock:
+                if self.indexes is None:
+                    self._replace(self._start())
+        if not self.sync_lock.acquire(blocking=False):
+            return
+        try:
+            found = self.feed.read()
+            if found is None:
+                # Changes were lost: start again.
+                self._replace(self._start())
+                return
+            pending = {}
+            for kind, ids in found:
+                if ids is None:
+                    pending[kind] = None
+                elif pending.get(kind, ()) is not None:
+                    pending.setdefault(kind, set()).update(ids)
+            for kind, ids in pending.items():
+                source = SOURCES[kind]
+                if ids is None:
+                    index = PrefixIndex.build(source.rows())
+                    with self.lock:
+                        self.indexes[kind] = index
+                else:
+                    self._apply(self.indexes[kind], source, ids)
+        finally:
+            self.sync_lock.release()
+
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        """{kind: [{'id', 'name'}]} of the best names with a word starting with `query`."""
+        prefix = fold(query)[:KEY_LENGTH]
+        self.sync()
+        result = {}
+        with self.lock:
+            for kind in KINDS:
+                found = self.indexes[kind].lookup(prefix, limit) if prefix else []
+                result[kind] = [{'id': pk, 'name': name} for pk, name in found]
+        return result
+
+
+def load_snapshot(path):
+    """({kind: PrefixIndex}, since) from the snapshot at `path`, or None when there is none of this format."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        return None
+    indexes = {kind: PrefixIndex.load(snapshot['kinds'][kind]) for kind in KINDS}
+    return indexes, datetime.datetime.fromisoformat(snapshot['since'])
+
+
+def build_snapshot(path):
+    """Write a snapshot of every name to `path`; returns how many names it holds."""
+    since = timezone.now()
+    indexes = {kind: PrefixIndex.build(source.rows()) for kind, source in SOURCES.items()}
+    snapshot = {
+        'format': SNAPSHOT_FORMAT, 'since': since.isoformat(),
+        'kinds': {kind: index.dump() for kind, index in indexes.items()},
+    }
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+    # The rename keeps a starting process from reading half a file.
+    os.replace(temporary, path)
+    return sum(index.size for index in indexes.values())
+
+
+suggester = Suggester()
@@ -0,0 +1,314 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.test import RequestFactory
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import recommendations, routers, search
+from .caching import CATALOG_MODELS, bump_version
+from .models import BookAuthor, BookGenre, Task
+
+logger = logging.getLogger(__name__)
+
+TASK_BROKER = getattr(settings, 'BOOKSHOP_TASK_BROKER', 'database')
+TASK_THREADS = getattr(settings, 'BOOKSHOP_TASK_THREADS', 4)
+# A running task whose worker has been silent this long (seconds) is handed to another worker.
+TASK_TIMEOUT = getattr(settings, 'BOOKSHOP_TASK_TIMEOUT', 300)
+# Views behind cache_response() to re-render after a catalog write; warming any other only repeats its queries.
+CACHE_WARM_PATHS = getattr(settings, 'BOOKSHOP_CACHE_WARM_PATHS', ['/books/'])
+# Cache backends each process keeps to itself: what a worker process puts there no web process sees.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+registry = {}
+
+
+class TaskFunction:
+    """
+    A function that can run later: `.delay(*args)` hands it to the broker
+    once the current transaction commits (immediately outside one). Arguments
+    must be JSON serializable. Failures are retried up to `max_attempts`
+    times, `retry_delay` seconds apart and doubling; with `dedupe`, an
+    identical call that is still waiting to run is not queued twice.
+    """
+
+    def __init__(self, func, max_attempts=3, retry_delay=5, dedupe=True):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__name__}'
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dedupe = dedupe
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def __repr__(self):
+        return f'<TaskFunction {self.name}>'
+
+    def dedupe_key(self, args):
+        if not self.dedupe:
+            return ''
+        return hashlib.sha256(json.dumps([self.name, args], sort_keys=True).encode()).hexdigest()
+
+    def delay(self, *args):
+        args = json.loads(json.dumps(args))
+        transaction.on_commit(lambda: get_broker().send(self, args))
+
+    def retry_at(self, attempts):
+        return timezone.now() + datetime.timedelta(seconds=self.retry_delay * 2 ** max(0, attempts - 1))
+
+
+def task(max_attempts=3, retry_delay=5, dedupe=True):
+    def decorator(func):
+        task_function = TaskFunction(func, max_attempts, retry_delay, dedupe)
+        registry[task_function.name] = task_function
+        return task_function
+    return decorator
+
+
+def get_task(name):
+    if name not in registry:
+        import_module(name.rsplit('.', 1)[0])
+    return registry[name]
+
+
+class ImmediateBroker:
+    """Runs each task in the committing thread; for tests and single-process development."""
+
+    def send(self, task_function, args):
+        try:
+            task_function(*args)
+        except Exception:
+            logger.exception('Task %s%r failed', task_function.name, tuple(args))
+
+
+class ThreadBroker:
+    """
+    Runs tasks on a thread pool inside the web process, so nothing else has
+    to be deployed. Tasks still queued or waiting to be retried are lost if
+    the process exits, and one sent while it shuts down is logged and dropped.
+    """
+
+    def __init__(self, threads=TASK_THREADS):
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='bookshop-task')
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def send(self, task_function, args, attempts=0):
+        key = task_function.dedupe_key(args)
+        with self.lock:
+            if key and attempts == 0 and key in self.pending:
+                return
+            self.pending.add(key)
+        try:
+            self.executor.submit(self.run, task_function, args, key, attempts + 1)
+        except RuntimeError:
+            # The pool has shut down with the interpreter.
+            logger.error('Task %s%r dropped: the process is exiting', task_function.name, tuple(args))
+            with self.lock:
+                self.pending.discard(key)
+
+    def run(self, task_function, args, key, attempts):
+        with self.lock:
+            self.pending.discard(key)
+        close_old_connections()
+        # Each task is a job of its own, on the primary; its pinning ends with it.
+        token = routers.pin_to_primary()
+        try:
+            task_function(*args)
+        except Exception:
+            logger.exception('Task %s%r failed (attempt %s)', task_function.name, tuple(args), attempts)
+            if attempts < task_function.max_attempts:
+                delay = (task_function.retry_at(attempts) - timezone.now()).total_seconds()
+                timer = threading.Timer(delay, self.send, (task_function, args, attempts))
+                timer.daemon = True
+                timer.start()
+        finally:
+            routers.release(token)
+            close_old_connections()
+
+
+class DatabaseBroker:
+    """Stores tasks as Task rows for `manage.py run_workers` to claim; they survive restarts."""
+
+    def send(self, task_function, args):
+        Task.objects.bulk_create(
+            [Task(name=task_function.name, args=args, dedupe_key=task_function.dedupe_key(args))],
+            ignore_conflicts=True,
+        )
+
+
+BROKERS = {'immediate': ImmediateBroker, 'thread': ThreadBroker, 'database': DatabaseBroker}
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = BROKERS.get(TASK_BROKER) or import_string(TASK_BROKER)
+                _broker = broker_class()
+    return _broker
+
+
+class Worker:
+    """
+    Claims due Task rows and runs them. Any number of workers, in any number
+    of processes, can share the table: a row is claimed with a conditional
+    UPDATE, so exactly one worker wins it. Successful tasks are deleted;
+    failed ones go back to pending until they run out of attempts.
+    """
+
+    def __init__(self, batch_size=10, poll_interval=1.0, name=None):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+
+    def claimable(self, now):
+        stale = now - datetime.timedelta(seconds=TASK_TIMEOUT)
+        return Q(status=Task.PENDING, run_after__lte=now) | Q(status=Task.RUNNING, locked_at__lt=stale)
+
+    def claim(self):
+        now = timezone.now()
+        candidates = list(
+            Task.objects.filter(self.claimable(now)).order_by('run_after', 'id')
+            .values_list('id', flat=True)[:self.batch_size]
+        )
+        claimed = [
+            pk for pk in candidates
+            if Task.objects.filter(self.claimable(now), pk=pk).update(
+                status=Task.RUNNING, locked_by=self.name, locked_at=now, attempts=F('attempts') + 1,
+            )
+        ]
+        return list(Task.objects.filter(pk__in=claimed, locked_by=self.name).order_by('run_after', 'id'))
+
+    def execute(self, record):
+        try:
+            task_function = get_task(record.name)
+            task_function(*record.args)
+        except Exception:
+            logger.exception('Task %s (%s) failed (attempt %s)', record.name, record.pk, record.attempts)
+            self.failed(record, traceback.format_exc())
+        else:
+            Task.objects.filter(pk=record.pk).delete()
+
+    def failed(self, record, error):
+        task_function = registry.get(record.name)
+        if task_function is None or record.attempts >= task_function.max_attempts:
+            Task.objects.filter(pk=record.pk).update(status=Task.FAILED, last_error=error, locked_by='')
+            return
+        try:
+            Task.objects.filter(pk=record.pk).update(
+                status=Task.PENDING, run_after=task_function.retry_at(record.attempts), last_error=error, locked_by='',
+            )
+        except IntegrityError:
+            # An identical task was queued meanwhile; it will do the work.
+            Task.objects.filter(pk=record.pk).delete()
+
+    def run_once(self):
+        """Claim and run one batch; returns how many tasks ran."""
+        close_old_connections()
+        records = self.claim()
+        for record in records:
+            self.execute(record)
+        return len(records)
+
+    def run(self, burst=False):
+        """Work until stopped (SIGTERM/SIGINT), or with `burst` until the queue is empty."""
+        token = routers.pin_to_primary()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+        try:
+            while not self.stopping:
+                if not self.run_once():
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+        finally:
+            routers.release(token)
+
+    def stop(self, *args):
+        self.stopping = True
+
+
+def cache_is_shared():
+    """Whether the default cache is one all processes share (Redis, memcached), not a per-process one."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@task()
+def reindex_books(book_ids):
+    search.reindex_books(book_ids)
+
+
+@task()
+def remove_books(book_ids):
+    search.remove_books(book_ids)
+
+
+@task()
+def reindex_authors(author_ids):
+    search.reindex_authors(author_ids)
+
+
+@task()
+def remove_authors(author_ids):
+    search.remove_authors(author_ids)
+
+
+@task()
+def reindex_author_books(author_id):
+    search.reindex_books(BookAuthor.objects.filter(author_id=author_id).values_list('book_id', flat=True))
+
+
+@task()
+def reindex_genre_books(genre_id):
+    search.reindex_books(BookGenre.objects.filter(genre_id=genre_id).values_list('book_id', flat=True))
+
+
+@task()
+def refresh_related_books(book_ids):
+    recommendations.refresh(book_ids)
+
+
+@task()
+def refresh_catalog_cache(model_names):
+    """
+    Bump the versions of the changed catalog models once more (a read racing
+    the write may have cached pre-commit data) and re-render the first page
+    of the main listings into the response cache.
+    """
+    for model in CATALOG_MODELS:
+        if model._meta.model_name in model_names:
+            bump_version(model)
+    if isinstance(get_broker(), DatabaseBroker) and not cache_is_shared():
+        # Run by a worker process, which would only warm its own cache.
+        return
+    factory = RequestFactory()
+    token = routers.pin_to_primary()
+    try:
+        for path in CACHE_WARM_PATHS:
+            request = factory.get(path, HTTP_ACCEPT='application/json')
+            resolve(path).func(request)
+    finally:
+        routers.release(token)
@@ -0,0 +1,59 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User as AuthUser
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookshop import facets, tasks
+from bookshop.models import Author, Book, BookAuthor, BookGenre, Genre, Publisher
+
+
+@pytest.fixture(autouse=True)
+def immediate_tasks(monkeypatch):
+    # Tasks run in the committing thread; tests that need them capture on_commit callbacks.
+    monkeypatch.setattr(tasks, '_broker', tasks.ImmediateBroker())
+    monkeypatch.setattr(tasks, 'CACHE_WARM_PATHS', [])
+    # The facet index follows the feed on the request: a sync thread cannot see the test's transaction.
+    monkeypatch.setattr(facets, 'SYNC_INTERVAL', 0)
+    monkeypatch.setattr(facets, '_index', None)
+    cache.clear()
+
+
+@pytest.fixture
+def catalog(db, django_capture_on_commit_callbacks):
+    """30 books over 3 publishers, 5 authors and 3 genres; every third title contains 'dragon'."""
+    # Run the post-commit work (search indexing among it) as if each write had committed.
+    with django_capture_on_commit_callbacks(execute=True):
+        return _create_catalog()
+
+
+def _create_catalog():
+    publishers = [Publisher.objects.create(name=f'Pub {i}') for i in range(3)]
+    authors = [Author.objects.create(name=f'Author {i}', bio='bio') for i in range(5)]
+    genres = [Genre.objects.create(name=name) for name in ('Fantasy', 'Kids', 'Sci-Fi')]
+    now = timezone.now()
+    books = []
+    for i in range(30):
+        book = Book.objects.create(
+            title=f'Book {i} dragon' if i % 3 == 0 else f'Book {i}', description='desc', isbn=f'isbn{i}',
+            publisher=publishers[i % 3], price=Decimal(10 + i % 7), currency='UAH', stock=5, pages=100,
+            rating=Decimal('4.50'), created_at=now - datetime.timedelta(minutes=i % 4),
+        )
+        BookAuthor.objects.create(book=book, author=authors[i % 5])
+        BookGenre.objects.create(book=book, genre=genres[i % 3])
+        books.append(book)
+    return books
+
+
+@pytest.fixture
+def make_client(db):
+    """An API client authenticated as a new auth.User with the given username."""
+    def make(username, **extra):
+        user = AuthUser.objects.create_user(username=username, email=f'{username}@example.com', password='x', **extra)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    return make
@@ -0,0 +1,41 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+
+
+def async_get(path, headers=None):
+    async def get():
+        return await AsyncClient().get(path, headers={'Accept': 'application/json', **(headers or {})})
+
+    return async_to_sync(get)()
+
+
+@pytest.mark.parametrize('path', [
+    '/books/',
+    '/books/?genre=Kids&sort=price_asc&limit=5',
+    '/books/?q=dragon',
+    '/books/?fields=title,price&facets=genre',
+    '/books/{book}/',
+    '/books/999999/',
+    '/books/?sort=nonsense',
+    '/books/?cursor=not-a-cursor',
+    '/authors/',
+    '/authors/{author}/',
+    '/authors/999999/',
+    '/publishers/',
+    '/publishers/{publisher}/',
+    '/publishers/999999/',
+])
+def test_async_views_answer_like_the_sync_views(catalog, client, path):
+    book = catalog[0]
+    path = path.format(book=book.pk, author=book.authors.first().pk, publisher=book.publisher_id)
+    expected = client.get(path, HTTP_ACCEPT='application/json')
+    response = async_get('/async' + path)
+    assert response.status_code == expected.status_code
+    assert response.json() == expected.json()
+
+
+def test_async_views_answer_304(catalog):
+    for path in ['/async/books/', f'/async/books/{catalog[0].pk}/', '/async/authors/']:
+        etag = async_get(path)['ETag']
+        assert async_get(path, {'If-None-Match': etag}).status_code == 304
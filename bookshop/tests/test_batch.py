@@ -0,0 +1,31 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from bookshop.batch import AuthorBatchWriter, BatchError, BookBatchWriter
+from bookshop.models import BookAuthor, BookListing, CartItem, CoPurchase
+
+from .test_orders import shop_user
+
+
+def test_deleting_books_cascades_through_every_relation(catalog):
+    kept, gone = catalog[0], catalog[1:11]
+    CoPurchase.objects.bulk_create(
+        [CoPurchase(book=kept, other=book, orders=1) for book in gone]
+        + [CoPurchase(book=book, other=kept, orders=1) for book in gone]
+    )
+    CartItem.objects.create(user=shop_user('reader'), book=gone[0], quantity=1)
+    with CaptureQueriesContext(connection) as captured:
+        BookBatchWriter([book.pk for book in gone]).delete()
+    # The links' per-row signals leave the listings to the batch.
+    assert sum('UPDATE "bookshop_booklisting"' in query['sql'] for query in captured.captured_queries) <= 1
+    assert list(CoPurchase.objects.values_list('book_id', 'other_id')) == []
+    assert not CartItem.objects.exists()
+    assert not BookAuthor.objects.filter(book__in=gone).exists()
+    assert sorted(BookListing.objects.values_list('pk', flat=True)) == [book.pk for book in catalog if book not in gone]
+
+
+def test_authors_with_books_are_refused(catalog):
+    with pytest.raises(BatchError) as raised:
+        AuthorBatchWriter([catalog[0].authors.get().pk]).delete()
+    assert raised.value.errors == [{'index': 0, 'errors': {'id': ['Author has books']}}]
@@ -0,0 +1,14 @@
+from bookshop.benchmark import ENDPOINTS, Benchmark
+
+
+def test_runs_against_a_production_host_list(catalog, settings):
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['shop.example.com']
+    report = Benchmark(requests=2, endpoints=['books-list', 'books-detail']).run()
+    assert [result['errors'] for result in report['results'].values()] == [0, 0]
+
+
+def test_runs_the_async_views(catalog):
+    endpoints = [name for name in ENDPOINTS if name.startswith('async-')]
+    report = Benchmark(requests=2, endpoints=endpoints).run()
+    assert {name: result['errors'] for name, result in report['results'].items()} == dict.fromkeys(endpoints, 0)
@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from bookshop import catalog_io
+from bookshop.models import Author, Book
+
+
+def record(**fields):
+    return {
+        'isbn': '978-0000000001', 'title': 'Dune', 'publisher': 'Chilton', 'authors': ['Frank Herbert'],
+        'genres': ['Sci-Fi'], 'price': '12.50', 'stock': 3, 'pages': 412, 'rating': '4.20', **fields,
+    }
+
+
+def jsonl(*lines):
+    return io.StringIO(''.join((line if isinstance(line, str) else json.dumps(line)) + '\n' for line in lines))
+
+
+def test_import_and_reimport(db):
+    result = catalog_io.import_catalog(jsonl(record(), record(isbn='978-0000000002', title='Emma')), 'jsonl')
+    assert result == {'created': 2, 'updated': 0, 'unchanged': 0, 'errors': []}
+    result = catalog_io.import_catalog(jsonl(record(price='13.00'), record(isbn='978-0000000002', title='Emma')), 'jsonl')
+    assert result == {'created': 0, 'updated': 1, 'unchanged': 1, 'errors': []}
+    assert Book.objects.get(isbn='978-0000000001').price == 13
+
+
+def test_books_without_isbn_are_matched_by_title_and_publisher(db):
+    lines = [record(isbn=''), record(isbn='', publisher='Ace'), record(isbn='', price='1.00')]
+    result = catalog_io.import_catalog(jsonl(*lines), 'jsonl')
+    assert result['created'] == 2
+    assert result['updated'] == 0
+    result = catalog_io.import_catalog(jsonl(*lines[:2]), 'jsonl')
+    assert result == {'created': 0, 'updated': 1, 'unchanged': 1, 'errors': []}
+    assert Book.objects.count() == 2
+
+
+@pytest.mark.parametrize('line, error', [
+    ('{"title": "Dune", ', 'invalid JSON'),
+    ('[1, 2]', 'each line must be a JSON object'),
+    ('"Dune"', 'each line must be a JSON object'),
+    (record(title='x' * 101), 'title must be at most 100 characters'),
+    (record(isbn='9' * 21), 'isbn must be at most 20 characters'),
+    (record(publisher='p' * 101), 'publisher must be at most 100 characters'),
+    (record(authors=['a' * 101]), 'authors must be at most 100 characters'),
+    (record(genres=['g' * 101]), 'genres must be at most 100 characters'),
+    (record(title=5), 'title must be text'),
+    (record(authors={'name': 'Frank'}), 'authors must be a list of names'),
+    (record(price='123456789.00'), 'price:'),
+    (record(rating='10'), 'rating:'),
+    (record(stock=-1), 'stock and pages must be between 0 and'),
+    (record(pages=2 ** 40), 'stock and pages must be between 0 and'),
+])
+def test_bad_rows_are_reported_and_skipped(db, line, error):
+    result = catalog_io.import_catalog(jsonl(record(isbn='1'), line, record(isbn='2')), 'jsonl')
+    assert result['created'] == 2
+    assert len(result['errors']) == 1
+    assert result['errors'][0]['row'] == 2
+    assert result['errors'][0]['error'].startswith(error)
+    assert not Author.objects.filter(name__startswith='a' * 101).exists()
+
+
+def test_import_endpoint_reports_bad_lines(db, make_client):
+    client = make_client('admin', is_staff=True)
+    upload = SimpleUploadedFile('books.jsonl', b'[1, 2]\nnot json\n' + json.dumps(record()).encode())
+    response = client.post('/books/import/', {'file': upload}, format='multipart')
+    assert response.status_code == 200
+    assert response.json()['created'] == 1
+    assert [error['row'] for error in response.json()['errors']] == [1, 2]
+
+
+def test_csv_round_trip(catalog):
+    exported = ''.join(catalog_io.export_lines('csv'))
+    Book.objects.filter(pk=catalog[0].pk).update(title='Changed')
+    result = catalog_io.import_catalog(io.StringIO(exported), 'csv')
+    assert result['errors'] == []
+    assert result['created'] == 0
+    assert result['updated'] == 1
+    assert Book.objects.get(pk=catalog[0].pk).title == catalog[0].title
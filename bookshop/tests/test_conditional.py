@@ -0,0 +1,68 @@
+from django.core.cache import cache
+
+from bookshop import listings
+from bookshop.models import Author, Book
+
+
+def etag_changes(client, path, write):
+    """Whether `path` answers 200 with a new ETag, rather than 304, after `write`."""
+    etag = client.get(path)['ETag']
+    assert client.get(path, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    write()
+    response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+    return response.status_code == 200 and response['ETag'] != etag
+
+
+def test_unchanged_resources_answer_304(catalog, client):
+    response = client.get('/books/')
+    assert response.status_code == 200
+    assert client.get('/books/', HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    assert client.get('/books/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code == 304
+
+
+def test_deletes_after_a_cache_clear_are_not_answered_304(catalog, client, django_capture_on_commit_callbacks):
+    last_modified = client.get('/books/')['Last-Modified']
+    cache.clear()
+    with django_capture_on_commit_callbacks(execute=True):
+        catalog[0].delete()
+    response = client.get('/books/', HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 200 and 'Last-Modified' not in response
+    assert catalog[0].pk not in [book['id'] for book in response.json()['data']]
+
+
+def test_etag_depends_on_query_and_format(catalog, client):
+    etag = client.get('/books/')['ETag']
+    assert client.get('/books/?sort=price_asc')['ETag'] != etag
+    assert client.get('/books/', HTTP_ACCEPT='application/x-ndjson')['ETag'] != etag
+
+
+def test_saving_a_book_changes_the_etag(catalog, client, make_client, django_capture_on_commit_callbacks):
+    book = catalog[0]
+    editor = make_client('editor')
+
+    def write():
+        with django_capture_on_commit_callbacks(execute=True):
+            assert editor.put(f'/books/{book.pk}/', {'title': 'Renamed'}, format='json').status_code == 200
+
+    assert etag_changes(client, f'/books/{book.pk}/', write)
+
+
+def test_renaming_an_author_changes_book_etags(catalog, client, django_capture_on_commit_callbacks):
+    def write():
+        with django_capture_on_commit_callbacks(execute=True):
+            author = Author.objects.get(name='Author 0')
+            author.name = 'Renamed'
+            author.save()
+
+    assert etag_changes(client, '/books/', write)
+
+
+def test_queryset_updates_change_the_etag(catalog, client, django_capture_on_commit_callbacks):
+    # Popularity is written with QuerySet.update(), which sends no signals.
+    def write():
+        with django_capture_on_commit_callbacks(execute=True):
+            Book.objects.filter(pk=catalog[5].pk).update(popularity=100)
+            listings.copy_columns(['popularity'], [catalog[5].pk])
+
+    assert etag_changes(client, '/books/?sort=popularity', write)
+    assert client.get('/books/?sort=popularity').json()['data'][0]['id'] == catalog[5].pk
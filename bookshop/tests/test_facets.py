@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from rest_framework.test import APIClient
+
+from bookshop import changes, facets, listings
+from bookshop.models import Book
+
+
+def counted(query=''):
+    return APIClient().get(f'/books/?facets=genre,publisher,price&limit=100{query}').json()['facets']
+
+
+def test_changes_are_applied_in_place(catalog, django_capture_on_commit_callbacks, django_assert_num_queries):
+    counted()
+    index = facets._index
+    with django_assert_num_queries(0):
+        # Nothing published: the index asks the database nothing.
+        facets.facet_counts(('genre', 'publisher'), {'genre': 'Kids'}, Book.objects.none())
+
+    with django_capture_on_commit_callbacks(execute=True):
+        catalog[0].price = Decimal('75.00')
+        catalog[0].save()
+        catalog[1].delete()
+        Book.objects.filter(pk=catalog[2].pk).update(stock=0)
+        listings.copy_columns(['stock'], [catalog[2].pk])
+    found = counted()
+    assert facets._index is index
+    assert {'min': '50', 'max': '100', 'count': 1} in found['price']
+    assert sum(item['count'] for item in found['genre']) == sum(item['count'] for item in found['publisher']) == 29
+    assert [item['count'] for item in counted('&inStock=false')['genre']] == [1]
+    assert index.filter_bitmap('inStock', 'false') == 1 << catalog[2].pk
+    assert list(facets.members(index.all)) == sorted(index.books)
+
+
+def test_lost_changes_rebuild_the_index(catalog, django_capture_on_commit_callbacks, monkeypatch):
+    counted()
+    index = facets._index
+    monkeypatch.setattr(changes, 'MAX_BACKLOG', 1)
+    with django_capture_on_commit_callbacks(execute=True):
+        catalog[0].delete()
+        catalog[3].delete()
+    assert sum(item['count'] for item in counted()['genre']) == 28
+    assert facets._index is not index
@@ -0,0 +1,54 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from bookshop.filters import MAX_ID, BookFilterBackend
+from bookshop.models import BookListing
+from bookshop.pagination import KeysetPaginator
+
+
+@pytest.mark.parametrize('param', ['authorId', 'publisherId', 'genre'])
+@pytest.mark.parametrize('value', ['0', str(MAX_ID + 1), str(2 ** 70)])
+def test_ids_out_of_range_are_rejected(catalog, client, param, value):
+    for extra in ('', '&facets=genre,author'):
+        response = client.get(f'/books/?{param}={value}{extra}')
+        assert response.status_code == 400
+        assert response.json() == {'error': f'{param} must be between 1 and {MAX_ID}'}
+
+
+def test_largest_id_matches_nothing(catalog, client):
+    response = client.get(f'/books/?authorId={MAX_ID}&facets=genre')
+    assert response.status_code == 200
+    assert response.json()['data'] == []
+
+
+def test_filters(catalog, client):
+    author_id = catalog[0].authors.get().pk
+    books = client.get(f'/books/?authorId={author_id}&limit=100').json()['data']
+    assert sorted(book['id'] for book in books) == sorted(book.pk for book in catalog[::5])
+    books = client.get('/books/?genre=Kids&inStock=true&limit=100').json()['data']
+    assert len(books) == 10
+    assert client.get('/books/?inStock=maybe').status_code == 400
+    assert client.get('/books/?sort=title').status_code == 400
+
+
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='reads SQLite plans')
+@pytest.mark.parametrize('params, index', [
+    ({'publisherId': '1'}, 'listing_publisher_id_idx'),
+    ({'authorId': '1'}, 'sqlite_autoindex_bookshop_bookauthor_1 (author_id=?)'),
+    ({'genre': 'Kids'}, 'sqlite_autoindex_bookshop_bookgenre_1 (genre_id=?)'),
+    ({'genre': '2'}, 'sqlite_autoindex_bookshop_bookgenre_1 (genre_id=?)'),
+    ({'sort': 'price_asc'}, 'listing_price_id_idx'),
+    ({'sort': 'popularity'}, 'listing_popularity_id_idx'),
+    ({}, 'listing_created_id_idx'),
+])
+def test_filters_and_sorts_use_their_index(catalog, params, index):
+    backend = BookFilterBackend()
+    queryset = backend.filter_queryset(BookListing.objects.all(), params)
+    plan = queryset.order_by(*KeysetPaginator(backend.get_ordering(params)).ordering)[:20].explain()
+    assert index in plan
+
+
+def test_no_filter_or_sort_scans_a_table(catalog):
+    # EXPLAINs every filter and sort combination; raises CommandError on a full table scan.
+    call_command('check_query_plans', stdout=None)
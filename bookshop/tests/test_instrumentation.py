@@ -0,0 +1,68 @@
+import json
+import logging
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from bookshop import instrumentation
+from bookshop.middleware import InstrumentationMiddleware
+from bookshop.models import Author, Book
+
+
+@pytest.fixture
+def request_log(caplog):
+    # bookshop.requests does not propagate, so caplog listens on it directly.
+    logger = logging.getLogger('bookshop.requests')
+    logger.addHandler(caplog.handler)
+    caplog.set_level(logging.INFO, logger='bookshop.requests')
+    yield caplog
+    logger.removeHandler(caplog.handler)
+
+
+def logged(caplog, level=logging.INFO):
+    return [json.loads(record.getMessage()) for record in caplog.records if record.levelno == level]
+
+
+def test_requests_are_timed_and_logged(catalog, client, request_log):
+    response = client.get(f'/books/{catalog[0].pk}/')
+    timings = dict(part.split(';', 1)[0:2] for part in response['Server-Timing'].split(', '))
+    assert list(timings) == ['total', 'db', 'serialize']
+    line = logged(request_log)[-1]
+    assert line['route'] == 'books/<int:pk>/' and line['method'] == 'GET' and line['status'] == 200
+    assert line['db_queries'] > 0 and line['bytes'] == len(response.content)
+    assert f'desc="{line["db_queries"]} queries"' in response['Server-Timing']
+    assert set(line) == {'route', 'method', 'status', 'duration_ms', 'db_queries', 'db_ms', 'serialize_ms', 'bytes'}
+
+
+def test_repeated_statements_are_reported(catalog, request_log):
+    def view(request):
+        for author in Author.objects.all():
+            Book.objects.filter(bookauthor__author=author).count()
+        Author.objects.count()
+        Author.objects.count()
+        return HttpResponse()
+
+    InstrumentationMiddleware(view)(RequestFactory().get('/'))
+    problems = {line['problem']: line['count'] for line in logged(request_log, logging.WARNING)}
+    assert problems == {'n+1': 5, 'duplicate': 2}
+    assert 'bookshop_query_problems_total{kind="n+1",route="unmatched"}' in instrumentation.registry.render()
+
+
+def test_metrics_are_served_per_route(catalog, client):
+    client.get('/books/')
+    text = client.get('/metrics').content.decode()
+    assert '# TYPE bookshop_request_duration_seconds histogram' in text
+    assert 'bookshop_request_db_queries_count{method="GET",route="books/"}' in text
+    assert 'bookshop_response_bytes_bucket{method="GET",route="books/",le="+Inf"}' in text
+
+
+def test_metrics_are_only_served_to_staff_and_allowed_addresses(client, django_user_model, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'METRICS_ALLOWED_IPS', ['10.0.0.5'])
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code == 200
+
+    client.force_login(django_user_model.objects.create_user(username='ann', password='x'))
+    assert client.get('/metrics').status_code == 403
+    client.force_login(django_user_model.objects.create_user(username='bob', password='x', is_staff=True))
+    assert client.get('/metrics').status_code == 200
@@ -0,0 +1,88 @@
+import io
+from decimal import Decimal
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from bookshop import listings, routers
+from bookshop.models import Author, Book, BookAuthor, BookGenre, BookListing, Genre, Publisher
+
+CLEAN = {'missing': [], 'stale': [], 'orphaned': []}
+
+
+def drift(catalog):
+    """Write the listings behind the models' backs; returns the expected check() report."""
+    BookListing.objects.filter(pk=catalog[0].pk).update(title='Drifted')
+    BookListing.objects.filter(pk=catalog[1].pk).update(reserved=3)
+    BookListing.objects.filter(pk=catalog[2].pk).delete()
+    orphan = BookListing.objects.get(pk=catalog[3].pk)
+    orphan.pk = 10 ** 6
+    orphan.save(force_insert=True)
+    return {'missing': [catalog[2].pk], 'stale': [catalog[0].pk, catalog[1].pk], 'orphaned': [10 ** 6]}
+
+
+def test_check_listings_reports_drift(catalog):
+    expected = drift(catalog)
+    assert listings.check(batch_size=7) == expected
+    stderr = io.StringIO()
+    with pytest.raises(CommandError):
+        call_command('check_listings', stderr=stderr)
+    assert stderr.getvalue().splitlines() == [
+        f'1 missing: {catalog[2].pk}', f'2 stale: {catalog[0].pk}, {catalog[1].pk}', f'1 orphaned: {10 ** 6}',
+    ]
+
+
+def test_check_listings_repairs_drift(catalog):
+    drift(catalog)
+    stdout = io.StringIO()
+    call_command('check_listings', '--repair', stdout=stdout, stderr=io.StringIO())
+    assert 'Repaired 4 listings' in stdout.getvalue()
+    assert listings.check() == CLEAN
+    assert BookListing.objects.get(pk=catalog[0].pk).title == catalog[0].title
+    assert BookListing.objects.get(pk=catalog[1].pk).reserved == 0
+
+    stdout = io.StringIO()
+    call_command('check_listings', stdout=stdout)
+    assert 'Listings match the catalog' in stdout.getvalue()
+
+
+def test_rebuild_listings(catalog):
+    drift(catalog)
+    BookListing.objects.filter(pk__in=[book.pk for book in catalog[10:]]).delete()
+    stdout = io.StringIO()
+    call_command('rebuild_listings', '--batch-size', '7', stdout=stdout)
+    assert 'Rebuilt listings for 30 books' in stdout.getvalue()
+    assert listings.check() == CLEAN
+
+
+def test_model_writes_keep_the_listings_in_step(catalog, django_capture_on_commit_callbacks):
+    book = catalog[0]
+    with django_capture_on_commit_callbacks(execute=True):
+        book.title, book.price, book.stock = 'Renamed', Decimal('99.00'), 0
+        book.save()
+        BookAuthor.objects.create(book=book, author=Author.objects.get(name='Author 3'))
+        BookGenre.objects.filter(book=catalog[1]).delete()
+        Author.objects.filter(name='Author 0').get().delete()
+        genre = Genre.objects.get(name='Kids')
+        genre.name = 'Children'
+        genre.save()
+        publisher = Publisher.objects.get(name='Pub 2')
+        publisher.name = 'Renamed Pub'
+        publisher.save()
+        catalog[4].delete()
+        Book.objects.filter(pk=catalog[5].pk).update(popularity=7)
+        listings.copy_columns(['popularity'], [catalog[5].pk])
+    assert listings.check() == CLEAN
+    listing = BookListing.objects.get(pk=book.pk)
+    assert (listing.title, listing.in_stock, [name for _, name in listing.authors]) == ('Renamed', False, ['Author 3'])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_commands_run_on_the_primary_when_replicas_are_configured(catalog, monkeypatch):
+    # No such database: a read or a transaction routed to it would fail. Outside a test transaction,
+    # only the commands' own pinning keeps them off it.
+    monkeypatch.setattr(routers, 'READ_REPLICAS', ['replica_0'])
+    BookListing.objects.using('default').filter(pk=catalog[0].pk).update(title='Drifted')
+    call_command('check_listings', '--repair', stderr=io.StringIO())
+    call_command('rebuild_listings')
+    assert BookListing.objects.using('default').get(pk=catalog[0].pk).title == catalog[0].title
@@ -0,0 +1,241 @@
+import datetime
+import threading
+
+import pytest
+from django.contrib.auth.models import User as AuthUser
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookshop import listings
+from bookshop.models import Book, BookListing, BookStats, CartItem, OrderItem
+from bookshop.orders import OutOfStockError, checkout, get_shop_user, hold, release_expired_holds
+
+
+def run_threads(target, args_list):
+    """Run `target` once per args tuple, all released together; returns the results in order."""
+    barrier = threading.Barrier(len(args_list))
+    results = [None] * len(args_list)
+
+    def run(index, args):
+        try:
+            barrier.wait()
+            results[index] = target(*args)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(index, args)) for index, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def shop_user(username):
+    return get_shop_user(AuthUser.objects.create_user(username=username, email=f'{username}@example.com', password='x'))
+
+
+def reserved(book):
+    return BookListing.objects.get(pk=book.pk).reserved
+
+
+def held(book):
+    return CartItem.objects.filter(book=book, held_until__isnull=False).aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def add(user, book, quantity):
+    try:
+        hold(user, book.pk, quantity)
+        return 'held'
+    except OutOfStockError:
+        return 'out of stock'
+
+
+def buy(user):
+    try:
+        checkout(user)
+        return 'ordered'
+    except OutOfStockError:
+        return 'out of stock'
+
+
+def test_checkout(catalog, make_client, django_capture_on_commit_callbacks):
+    client = make_client('bob')
+    book = catalog[1]
+    assert client.post('/order/').status_code == 400
+    assert client.post('/cart/', {'bookId': book.pk, 'quantity': 3}, format='json').status_code == 200
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post('/order/')
+    assert response.status_code == 201
+    assert response.json()['items'][0]['bookId'] == book.pk
+    assert Book.objects.get(pk=book.pk).stock == 2
+    assert BookListing.objects.get(pk=book.pk).reserved == 0
+    assert BookStats.objects.get(pk=book.pk).units_sold == 3
+    assert client.get('/cart/').json()['items'] == []
+    assert client.post('/cart/', {'bookId': book.pk, 'quantity': 5}, format='json').status_code == 409
+
+
+@pytest.mark.parametrize('email', ['victim@example.com', ''])
+def test_accounts_sharing_an_email_keep_their_own_carts(catalog, email):
+    clients = []
+    for username in ('victim', 'intruder'):
+        client = APIClient()
+        client.force_authenticate(AuthUser.objects.create_user(username=username, email=email, password='x'))
+        clients.append(client)
+    victim, intruder = clients
+    assert victim.post('/cart/', {'bookId': catalog[1].pk, 'quantity': 2}, format='json').status_code == 200
+    assert victim.post('/order/').status_code == 201
+    assert victim.post('/cart/', {'bookId': catalog[2].pk, 'quantity': 1}, format='json').status_code == 200
+
+    assert intruder.get('/cart/').json()['items'] == []
+    assert intruder.get('/orders/').json() == []
+    assert intruder.post('/order/').status_code == 400
+    assert [item['bookId'] for item in victim.get('/cart/').json()['items']] == [catalog[2].pk]
+
+
+def test_checkout_invalidates_cached_stock(catalog, make_client, django_capture_on_commit_callbacks):
+    client = make_client('bob')
+    book = catalog[1]
+    first = client.get(f'/books/{book.pk}/')
+    assert first.json()['stock'] == 5
+    client.post('/cart/', {'bookId': book.pk, 'quantity': 4}, format='json')
+    with django_capture_on_commit_callbacks(execute=True):
+        assert client.post('/order/').status_code == 201
+    response = client.get(f'/books/{book.pk}/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 200
+    assert response.json()['stock'] == 1
+    assert response['ETag'] != first['ETag']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_checkouts_for_the_last_copy(catalog):
+    book = catalog[2]
+    Book.objects.filter(pk=book.pk).update(stock=1)
+    BookListing.objects.filter(pk=book.pk).update(stock=1)
+    users = [shop_user('ann'), shop_user('bob')]
+    for user in users:
+        CartItem.objects.create(user=user, book=book, quantity=1)
+
+    results = run_threads(buy, [(user,) for user in users])
+
+    assert sorted(results) == ['ordered', 'out of stock']
+    assert Book.objects.get(pk=book.pk).stock == 0
+    assert OrderItem.objects.filter(book=book).count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_checkouts_never_oversell(catalog):
+    book = catalog[2]
+    Book.objects.filter(pk=book.pk).update(stock=8)
+    BookListing.objects.filter(pk=book.pk).update(stock=8)
+    users = [shop_user(f'user{i}') for i in range(12)]
+    for user in users:
+        CartItem.objects.create(user=user, book=book, quantity=1)
+
+    results = run_threads(buy, [(user,) for user in users])
+
+    assert results.count('ordered') == 8
+    assert Book.objects.get(pk=book.pk).stock == 0
+    assert BookListing.objects.get(pk=book.pk).stock == 0
+    assert OrderItem.objects.filter(book=book).count() == 8
+
+
+def test_holds(catalog, make_client):
+    book = catalog[0]
+    ann, bob = make_client('ann'), make_client('bob')
+    response = ann.post('/cart/', {'bookId': book.pk, 'quantity': 3}, format='json')
+    assert response.status_code == 200
+    assert response.json()['items'][0]['heldUntil']
+    assert reserved(book) == 3
+    response = bob.post('/cart/', {'bookId': book.pk, 'quantity': 3}, format='json')
+    assert response.status_code == 409
+    assert response.json()['bookId'] == book.pk
+    assert bob.get('/cart/').json()['items'] == []
+    assert bob.post('/cart/', {'bookId': book.pk, 'quantity': 2}, format='json').status_code == 200
+    assert ann.post('/cart/', {'bookId': book.pk, 'quantity': 1}, format='json').status_code == 200
+    assert reserved(book) == 3
+    assert ann.delete(f'/cart/{book.pk}/').status_code == 200
+    assert reserved(book) == 2
+    assert bob.post('/order/').status_code == 201
+    assert Book.objects.get(pk=book.pk).stock == 3
+    assert reserved(book) == 0
+    assert listings.check() == {'missing': [], 'stale': [], 'orphaned': []}
+
+
+def test_holds_invalidate_cached_availability(catalog, make_client, django_capture_on_commit_callbacks):
+    book = catalog[0]
+    client = make_client('ann')
+    first = client.get(f'/books/{book.pk}/')
+    assert first.json()['available'] == 5
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post('/cart/', {'bookId': book.pk, 'quantity': 3}, format='json')
+    response = client.get(f'/books/{book.pk}/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 200
+    assert response.json()['available'] == 2
+
+    CartItem.objects.update(held_until=timezone.now() - datetime.timedelta(seconds=1))
+    with django_capture_on_commit_callbacks(execute=True):
+        assert release_expired_holds() == 1
+    assert client.get(f'/books/{book.pk}/').json()['available'] == 5
+
+
+def test_release_expired_holds_in_batches(catalog, make_client):
+    for i in range(7):
+        make_client(f'user{i}').post('/cart/', {'bookId': catalog[i % 3].pk, 'quantity': 1}, format='json')
+    expired = list(CartItem.objects.values_list('pk', flat=True)[:5])
+    CartItem.objects.filter(pk__in=expired).update(held_until=timezone.now() - datetime.timedelta(seconds=1))
+    assert release_expired_holds(batch_size=2) == 5
+    assert sum(reserved(book) for book in catalog[:3]) == 2
+    assert CartItem.objects.count() == 7
+
+
+def test_deleting_a_user_releases_their_holds(catalog, make_client):
+    make_client('ann').post('/cart/', {'bookId': catalog[2].pk, 'quantity': 2}, format='json')
+    get_shop_user(AuthUser.objects.get(username='ann')).delete()
+    assert reserved(catalog[2]) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_holds_never_exceed_stock(catalog):
+    book = catalog[2]
+    book.stock = 10
+    book.save()
+    users = [shop_user(f'user{i}') for i in range(12)]
+
+    results = run_threads(add, [(user, book, 1 + i % 2) for i, user in enumerate(users)])
+
+    assert results.count('held') == CartItem.objects.filter(book=book).count()
+    assert 9 <= held(book) <= 10
+    assert reserved(book) == held(book)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_first_holds_of_a_book_hold_it_once(catalog):
+    book, user = catalog[2], shop_user('ann')
+
+    assert run_threads(add, [(user, book, 2)] * 4) == ['held'] * 4
+    assert held(book) == reserved(book) == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_checkouts_race_new_holds(catalog):
+    book = catalog[2]
+    book.stock = 6
+    book.save()
+    buyers = [shop_user(f'buyer{i}') for i in range(6)]
+    for buyer in buyers:
+        hold(buyer, book.pk, 1)
+    others = [shop_user(f'user{i}') for i in range(6)]
+
+    results = run_threads(
+        lambda kind, user: buy(user) if kind == 'buy' else add(user, book, 1),
+        [('buy', user) for user in buyers] + [('add', user) for user in others],
+    )
+
+    # The buyers hold every copy, so no other cart gets one.
+    assert results == ['ordered'] * 6 + ['out of stock'] * 6
+    assert Book.objects.get(pk=book.pk).stock == 0
+    assert reserved(book) == held(book) == 0
+    assert listings.check() == {'missing': [], 'stale': [], 'orphaned': []}
@@ -0,0 +1,48 @@
+import pytest
+
+from bookshop.pagination import encode_cursor
+
+
+def test_cursor_pages_follow_each_other(catalog, client):
+    seen = []
+    response = client.get('/books/?limit=7&sort=price_asc').json()
+    seen += [book['id'] for book in response['data']]
+    while response['meta']['next']:
+        response = client.get(f"/books/?limit=7&sort=price_asc&cursor={response['meta']['next']}").json()
+        seen += [book['id'] for book in response['data']]
+    assert sorted(seen) == sorted(book.pk for book in catalog)
+    assert len(seen) == len(set(seen))
+
+
+def test_search_results_page_by_rank(catalog, client):
+    first = client.get('/books/?q=dragon&limit=4').json()
+    second = client.get(f"/books/?q=dragon&limit=4&cursor={first['meta']['next']}").json()
+    ids = [book['id'] for book in first['data'] + second['data']]
+    assert len(ids) == len(set(ids)) == 8
+
+
+@pytest.mark.parametrize('values, sort', [
+    (['abc', 'x'], None),
+    ([{'a': 1}, 2], None),
+    ([None, None], None),
+    (['2024-01-01T00:00:00Z'], None),
+    ([5, 1], None),
+    (['abc', 1], 'price_asc'),
+    (['NaN', 1], 'price_asc'),
+    (['10.00', 2 ** 70], 'price_asc'),
+    (['10.00', True], 'price_asc'),
+    ([[1], 1], 'popularity'),
+    (['x', 1], 'popularity'),
+])
+def test_crafted_cursors_are_rejected(catalog, client, values, sort):
+    params = {'cursor': encode_cursor(values)}
+    if sort:
+        params['sort'] = sort
+    response = client.get('/books/', params)
+    assert response.status_code == 400
+    assert response.json() == {'error': 'Invalid cursor'}
+
+
+def test_malformed_cursor_is_rejected(catalog, client):
+    assert client.get('/books/?cursor=!!!').status_code == 400
+    assert client.get(f"/books/?cursor={encode_cursor({'a': 1})}").status_code == 400
@@ -0,0 +1,58 @@
+import pytest
+
+from bookshop.models import Author, Book, BookAuthor, Publisher
+
+
+@pytest.fixture
+def more_books(catalog):
+    """Another 30 books, so a query count that grows with the page shows up."""
+    authors = list(Author.objects.all())
+    for i in range(30):
+        book = Book.objects.create(
+            title=f'Extra {i}', description='desc', isbn=f'extra{i}', publisher=catalog[i].publisher,
+            price=10, currency='UAH', stock=1, pages=10, rating=4, created_at=catalog[0].created_at,
+        )
+        BookAuthor.objects.create(book=book, author=authors[i % len(authors)])
+    return catalog
+
+
+@pytest.mark.parametrize('path, queries', [
+    ('/books/?limit=5', 4),
+    ('/books/?limit=60', 4),
+    ('/books/?limit=60&authorId=1&sort=price_asc', 4),
+    ('/books/?limit=60&fields=id,title,authors.bio', 3),
+    ('/books/?limit=60&fields=id,title', 2),
+    ('/authors/?limit=5', 1),
+    ('/authors/?limit=60', 1),
+    ('/publishers/', 1),
+])
+def test_list_queries_do_not_grow_with_the_page(more_books, client, django_assert_num_queries, path, queries):
+    with django_assert_num_queries(queries):
+        assert client.get(path).status_code == 200
+
+
+def test_detail_queries(more_books, client, django_assert_num_queries):
+    book, author, publisher = more_books[0], Author.objects.first(), Publisher.objects.first()
+    for path, queries in [
+        (f'/books/{book.pk}/', 3),
+        (f'/books/{book.pk}/related/', 2),
+        (f'/authors/{author.pk}/', 4),
+        (f'/publishers/{publisher.pk}/', 4),
+    ]:
+        with django_assert_num_queries(queries):
+            assert client.get(path).status_code == 200
+
+
+def test_cached_responses_run_no_queries(catalog, client, django_assert_num_queries):
+    client.get('/books/')
+    with django_assert_num_queries(0):
+        assert client.get('/books/').status_code == 200
+
+
+def test_orders_queries_do_not_grow_with_the_orders(catalog, make_client, django_assert_num_queries):
+    client = make_client('bob')
+    for book in catalog[:6]:
+        client.post('/cart/', {'bookId': book.pk, 'quantity': 1}, format='json')
+        client.post('/order/')
+    with django_assert_num_queries(4):
+        assert len(client.get('/orders/').json()) == 6
@@ -0,0 +1,71 @@
+from rest_framework.test import APIClient
+
+from bookshop import recommendations
+from bookshop.models import CartItem, CoPurchase, Order, OrderItem
+from bookshop.orders import checkout
+
+from .test_orders import shop_user
+from .test_stats import place_order
+
+
+def counted():
+    return {(book_id, other): orders for book_id, other, orders in CoPurchase.objects.values_list(
+        'book_id', 'other_id', 'orders',
+    )}
+
+
+def recounted():
+    return {(book_id, other): orders for book_id, other, orders in recommendations.co_purchase_rows()}
+
+
+def test_co_purchases_follow_every_order_change(catalog):
+    a, b, c, d = catalog[:4]
+    user = shop_user('reader')
+    first = place_order(user, [(a, 1), (b, 2), (c, 1)])
+    second = place_order(user, [(a, 1), (b, 1)])
+    for book in (a, d):
+        CartItem.objects.create(user=user, book=book, quantity=1)
+    checkout(user)
+    assert counted() == recounted()
+    assert counted()[a.pk, b.pk] == 2 and counted()[a.pk, a.pk] == 3
+
+    second.status = 'cancelled'
+    second.save()
+    assert counted() == recounted()
+    second.status = 'shipped'
+    second.save()
+    assert counted() == recounted()
+
+    item = first.items.get(book=c)
+    item.book = d
+    item.save()
+    assert counted() == recounted()
+    first.items.get(book=d).delete()
+    assert counted() == recounted()
+    OrderItem.objects.filter(order=second).delete()
+    assert counted() == recounted()
+    first.delete()
+    assert counted() == recounted()
+    Order.objects.all().delete()
+    assert counted() == {}
+
+    place_order(user, [(a, 1), (c, 1)])
+    CoPurchase.objects.all().delete()
+    recommendations.rebuild_co_purchases()
+    assert counted() == recounted() != {}
+
+
+def test_refresh_only_invalidates_the_books_it_recomputed(catalog):
+    a, b = catalog[:2]
+    place_order(shop_user('reader'), [(a, 1), (b, 1)])
+    client = APIClient()
+    etags = {book.pk: client.get(f'/books/{book.pk}/related/')['ETag'] for book in (a, b)}
+    assert client.get(f'/books/{a.pk}/related/', HTTP_IF_NONE_MATCH=etags[a.pk]).status_code == 304
+
+    recommendations.refresh([b.pk])
+    assert client.get(f'/books/{a.pk}/related/', HTTP_IF_NONE_MATCH=etags[a.pk]).status_code == 304
+    response = client.get(f'/books/{b.pk}/related/', HTTP_IF_NONE_MATCH=etags[b.pk])
+    assert response.status_code == 200 and a.pk in [book['id'] for book in response.json()['data']]
+
+    recommendations.rebuild()
+    assert client.get(f'/books/{a.pk}/related/', HTTP_IF_NONE_MATCH=etags[a.pk]).status_code == 200
@@ -0,0 +1,70 @@
+import gzip
+
+import pytest
+from django.contrib.auth.models import User as AuthUser
+
+
+def expand(data):
+    """The list of objects a columnar `data` stands for, with `included` objects put back."""
+    included = {column: {obj['id']: obj for obj in objects} for column, objects in data.get('included', {}).items()}
+    items = []
+    for row in data['data']['rows']:
+        item = dict(zip(data['data']['columns'], row))
+        for column, objects in included.items():
+            value = item[column]
+            item[column] = [objects[pk] for pk in value] if isinstance(value, list) else objects.get(value)
+        items.append(item)
+    return items
+
+
+@pytest.mark.parametrize('query', ['', '&fields=title,price', '&expand=publisher&fields=title,publisher'])
+def test_columns_round_trip(catalog, client, query):
+    expected = client.get(f'/books/?limit=50{query}', HTTP_ACCEPT='application/json').json()
+    response = client.get(f'/books/?limit=50{query}', HTTP_ACCEPT='application/vnd.bookshop.columns+json')
+    assert response['Content-Type'].startswith('application/vnd.bookshop.columns+json')
+    data = response.json()
+    assert expand(data) == expected['data'] and data['meta'] == expected['meta']
+    assert client.get(f'/books/?limit=50{query}&format=columns').json() == data
+
+
+def test_msgpack_round_trip(catalog, client):
+    msgpack = pytest.importorskip('msgpack')
+    expected = client.get('/books/?limit=50', HTTP_ACCEPT='application/json').json()
+    response = client.get('/books/?limit=50', HTTP_ACCEPT='application/msgpack')
+    assert response['Content-Type'] == 'application/msgpack'
+    assert msgpack.unpackb(response.content) == expected
+    assert client.get('/books/?limit=50&format=msgpack').content == response.content
+
+
+@pytest.mark.parametrize('path', ['/books/?limit=50', '/books/?stream=1'])
+def test_responses_are_compressed(catalog, client, path):
+    brotli = pytest.importorskip('brotli')
+    plain = client.get(path)
+    body = b''.join(plain.streaming_content) if plain.streaming else plain.content
+
+    response = client.get(path, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+    assert response['Content-Encoding'] == 'br' and 'Accept-Encoding' in response['Vary']
+    compressed = b''.join(response.streaming_content) if response.streaming else response.content
+    assert brotli.decompress(compressed) == body
+
+    response = client.get(path, HTTP_ACCEPT_ENCODING='gzip')
+    assert response['Content-Encoding'] == 'gzip'
+    compressed = b''.join(response.streaming_content) if response.streaming else response.content
+    assert gzip.decompress(compressed) == body
+
+
+def test_compressed_responses_weaken_the_etag(catalog, client):
+    etag = client.get('/books/')['ETag']
+    assert client.get('/books/', HTTP_ACCEPT_ENCODING='br')['ETag'] == 'W/' + etag
+    assert client.get('/books/', HTTP_ACCEPT_ENCODING='gzip')['ETag'] == 'W/' + etag
+
+
+def test_tokens_are_never_compressed(db, client, settings):
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    AuthUser.objects.create_user(username='ann', password='right-password-1')
+    response = client.post(
+        '/auth/login/', {'username': 'ann', 'password': 'right-password-1'},
+        content_type='application/json', HTTP_ACCEPT_ENCODING='gzip, br',
+    )
+    assert response.status_code == 200 and 'access' in response.json()
+    assert not response.has_header('Content-Encoding')
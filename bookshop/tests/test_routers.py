@@ -0,0 +1,44 @@
+from bookshop import routers, tasks
+from bookshop.models import Book
+
+router = routers.ReplicaRouter()
+
+
+def test_reads_outside_a_request_go_to_the_primary(monkeypatch):
+    monkeypatch.setattr(routers, 'READ_REPLICAS', ['replica_0'])
+    # Commands, workers and threads open no scope.
+    assert router.db_for_read(Book) == 'default'
+    router.db_for_write(Book)
+    assert not routers.has_written()
+
+    token = routers.pin_to_primary(False)
+    assert router.db_for_read(Book) == 'replica_0'
+    routers.release(token)
+    assert router.db_for_read(Book) == 'default'
+
+
+def test_writes_are_remembered_only_inside_a_scope(monkeypatch):
+    monkeypatch.setattr(routers, 'READ_REPLICAS', ['replica_0'])
+    outer = routers.pin_to_primary(False)
+    inner = routers.pin_to_primary(False)
+    router.db_for_write(Book)
+    assert router.db_for_read(Book) == 'default'
+    routers.release(inner)
+    # The request that ran the inner job wrote too.
+    assert routers.has_written()
+    routers.release(outer)
+    assert not routers.has_written()
+
+
+def test_thread_broker_tasks_read_the_primary_and_leave_no_scope(monkeypatch):
+    monkeypatch.setattr(routers, 'READ_REPLICAS', ['replica_0'])
+    seen = []
+
+    def read():
+        seen.append(router.db_for_read(Book))
+
+    broker = tasks.ThreadBroker(threads=1)
+    broker.executor.submit(broker.run, tasks.TaskFunction(read), [], '', 1).result()
+    broker.executor.submit(lambda: seen.append(routers._scope.get())).result()
+    broker.executor.shutdown()
+    assert seen == ['default', None]
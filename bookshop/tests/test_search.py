@@ -0,0 +1,75 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bookshop import search
+from bookshop.models import Author, Book, Genre
+
+
+def found(query):
+    return [book['id'] for book in APIClient().get(f'/books/?q={query}&limit=100').json()['data']]
+
+
+def titled(*words):
+    return sorted(Book.objects.filter(title__icontains=' '.join(words)).values_list('pk', flat=True))
+
+
+def new_book(title, description='desc', **kwargs):
+    return Book.objects.create(
+        title=title, description=description, isbn=title, price=Decimal(10), currency='UAH', stock=5, pages=100,
+        rating=Decimal('4.00'), created_at=timezone.now() - datetime.timedelta(days=1), **kwargs,
+    )
+
+
+@pytest.mark.parametrize('query', ['dragon', 'drag', 'dr', 'DRAGON', 'drag book', 'dragón'])
+def test_terms_match_by_prefix(catalog, query):
+    assert sorted(found(query)) == titled('dragon')
+
+
+def test_every_term_must_match(catalog):
+    assert found('dragon 12') == [catalog[12].pk]
+    assert found('dragon nothing') == []
+
+
+def test_title_matches_rank_first(catalog, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        described = new_book('Ordinary tales', 'A wizard, a wizard and a wizard')
+        titled_book = new_book('The wizard')
+        named = new_book('Plain')
+        named.authors.add(Author.objects.create(name='Wizard Smith', bio=''))
+    assert found('wizard') == [titled_book.pk, named.pk, described.pk]
+
+
+def test_authors_are_searched_by_name(catalog, client):
+    names = [author['name'] for author in client.get('/authors/?q=auth').json()]
+    assert sorted(names) == [f'Author {i}' for i in range(5)]
+
+
+def test_fallback_matches_titles(catalog, monkeypatch):
+    monkeypatch.setattr(search, 'BACKENDS', {})
+    assert found('DRAGON') == sorted(titled('dragon'), key=lambda pk: Book.objects.get(pk=pk).title)
+    # Each term is a substring of the title, in any order.
+    assert found('1 OOK') == [book.pk for book in sorted(catalog, key=lambda book: book.title) if '1' in book.title]
+
+
+def test_renames_and_relation_changes_are_indexed(catalog, django_capture_on_commit_callbacks):
+    book = catalog[1]
+    with django_capture_on_commit_callbacks(execute=True):
+        author = Author.objects.get(name='Author 0')
+        author.name = 'Zelazny'
+        author.save()
+        genre = Genre.objects.get(name='Kids')
+        genre.name = 'Children'
+        genre.save()
+        book.authors.add(Author.objects.create(name='Le Guin', bio=''))
+        book.genres.clear()
+        catalog[0].delete()
+    assert sorted(found('zelazny')) == [b.pk for b in catalog[5::5]]
+    assert found('kids') == []
+    assert sorted(found('children')) == [b.pk for b in catalog[4::3]]
+    assert found('guin') == [book.pk]
+    assert book.pk not in found('kids') + found('children')
+    assert catalog[0].pk not in found('dragon')
@@ -0,0 +1,63 @@
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+
+from bookshop import listings
+from bookshop.fast_serializers import FULL_FIELDSET, BookFieldset, book_list_data, book_list_values, iter_book_list
+from bookshop.models import Book, BookListing, Publisher
+from bookshop.renderers import ORJSONRenderer
+from bookshop.serializers import BookListSerializer
+
+
+def model_serializer_data(ids):
+    books = BookListSerializer.optimize(Book.objects.filter(pk__in=ids)).order_by('pk')
+    return BookListSerializer(books, many=True).data
+
+
+def fast_data(ids, fieldset=FULL_FIELDSET):
+    rows = book_list_values(BookListing.objects.filter(pk__in=ids).order_by('pk'), fieldset=fieldset)
+    return book_list_data(rows, fieldset)
+
+
+def test_fast_path_matches_book_list_serializer(catalog):
+    publisher = Publisher.objects.create(name='Ünïcode   press', description='"quoted"', website='https://e.x')
+    Book.objects.filter(pk=catalog[0].pk).update(publisher=publisher, price=Decimal('7.5'), cover_url='https://c.x/1')
+    Book.objects.filter(pk=catalog[1].pk).update(publisher=None)
+    catalog[2].authors.clear()
+    listings.refresh([book.pk for book in catalog])
+    ids = [book.pk for book in catalog]
+
+    expected = model_serializer_data(ids)
+    assert fast_data(ids) == expected
+    assert list(iter_book_list(BookListing.objects.filter(pk__in=ids).order_by('pk'), chunk_size=7)) == expected
+
+
+def test_orjson_renderer_matches_json_renderer(catalog):
+    data = {'data': model_serializer_data([book.pk for book in catalog]), 'text': 'a b c "é" </script>'}
+    assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+def test_fieldsets_trim_the_full_output(catalog):
+    ids = [book.pk for book in catalog[:5]]
+    full = model_serializer_data(ids)
+    trimmed = fast_data(ids, BookFieldset(['title', 'authors.name', 'price']))
+    assert trimmed == [
+        {
+            'id': book['id'], 'title': book['title'], 'price': book['price'],
+            'authors': [{'id': author['id'], 'name': author['name']} for author in book['authors']],
+        }
+        for book in full
+    ]
+
+
+def test_book_details_leave_out_bookkeeping_columns(catalog, client, make_client, django_capture_on_commit_callbacks):
+    book = catalog[0]
+    data = client.get(f'/books/{book.pk}/', HTTP_ACCEPT='application/json').json()
+    assert 'updated_at' not in data and 'popularity' not in data
+    assert data['available'] == 5 and data['title'] == book.title
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = make_client('editor').put(f'/books/{book.pk}/', {'popularity': 1000, 'pages': 321}, format='json')
+    assert response.status_code == 200 and 'popularity' not in response.json()
+    book.refresh_from_db()
+    assert (book.pages, book.popularity) == (321, 0)
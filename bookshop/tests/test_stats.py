@@ -0,0 +1,76 @@
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from bookshop import stats
+from bookshop.models import Book, BookListing, BookStats, CartItem, Order, OrderItem
+from bookshop.orders import checkout
+
+from .test_orders import shop_user
+
+
+def recounted(book):
+    """The book's stats as rebuild() would compute them from its whole history."""
+    row = next(iter(stats.sales_rows([book.pk])), {})
+    return tuple(row.get(field, 0) for field in ('units_sold', 'revenue', 'units_sold_7d', 'units_sold_30d'))
+
+
+def counted(book):
+    row = BookStats.objects.filter(pk=book.pk).values_list('units_sold', 'revenue', 'units_sold_7d', 'units_sold_30d')
+    return row.first() or (0, 0, 0, 0)
+
+
+def place_order(user, items, days_ago=0):
+    order = Order.objects.create(
+        user=user, total_amount=sum(book.price * quantity for book, quantity in items),
+        created_at=timezone.now() - datetime.timedelta(days=days_ago),
+    )
+    for book, quantity in items:
+        OrderItem.objects.create(order=order, book=book, quantity=quantity, unit_price=book.price)
+    return order
+
+
+def test_sales_move_the_counters(catalog):
+    book, other = catalog[0], catalog[1]
+    user = shop_user('reader')
+    place_order(user, [(book, 2), (other, 1)])
+    old = place_order(user, [(book, 5)], days_ago=10)
+    assert counted(book) == recounted(book) == (7, book.price * 7, 2, 7)
+    assert Book.objects.get(pk=book.pk).popularity == BookListing.objects.get(pk=book.pk).popularity == 7
+
+    item = old.items.get()
+    item.quantity = 1
+    item.save()
+    assert counted(book) == recounted(book)
+    old.status = 'cancelled'
+    old.save()
+    assert counted(book) == recounted(book) == (2, book.price * 2, 2, 2)
+    old.status = 'shipped'
+    old.save()
+    assert counted(book) == recounted(book)
+    old.delete()
+    assert counted(book) == recounted(book) == (2, book.price * 2, 2, 2)
+    assert counted(other) == recounted(other) == (1, other.price, 1, 1)
+
+
+def test_checkout_does_not_recount_the_history(catalog):
+    book = catalog[0]
+    user = shop_user('reader')
+    for _ in range(20):
+        place_order(user, [(book, 1)], days_ago=40)
+    CartItem.objects.create(user=user, book=book, quantity=1)
+    with CaptureQueriesContext(connection) as captured:
+        checkout(user)
+    assert not any('bookshop_orderitem' in query['sql'] and 'GROUP BY' in query['sql'] for query in captured.captured_queries)
+    assert counted(book) == recounted(book) == (21, book.price * 21, 1, 1)
+
+
+def test_windows_only_roll_when_refreshed(catalog):
+    book = catalog[0]
+    order = place_order(shop_user('reader'), [(book, 3)])
+    Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - datetime.timedelta(days=8))
+    assert counted(book) == (3, book.price * 3, 3, 3)
+    stats.refresh_windows()
+    assert counted(book) == recounted(book) == (3, book.price * 3, 0, 3)
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from bookshop.models import Author
+
+
+def streamed(response):
+    assert response.streaming
+    return b''.join(response.streaming_content)
+
+
+def paginated(client, path):
+    """Every item of every page of `path`, following the cursors."""
+    items, cursor = [], ''
+    while True:
+        page = client.get(f'{path}&limit=7{cursor}', HTTP_ACCEPT='application/json').json()
+        items += page['data']
+        if not page['meta']['next']:
+            return items
+        cursor = f"&cursor={page['meta']['next']}"
+
+
+@pytest.mark.parametrize('query', ['?sort=price_asc', '?genre=Kids&sort=price_desc', '?q=dragon', '?fields=title,price&sort=popularity'])
+def test_streamed_lists_match_the_pages(catalog, client, query):
+    expected = paginated(client, f'/books/{query}')
+    body = streamed(client.get(f'/books/{query}&stream=1'))
+    assert json.loads(body) == {'data': expected}
+
+    body = streamed(client.get(f'/books/{query}', HTTP_ACCEPT='application/x-ndjson'))
+    assert body.endswith(b'\n') and not body.endswith(b'\n\n')
+    assert [json.loads(line) for line in body.decode().split('\n')[:-1]] == expected
+
+
+def test_streamed_details_put_the_object_first(catalog, client):
+    author = Author.objects.get(name='Author 0')
+    expected = client.get(f'/authors/{author.pk}/', HTTP_ACCEPT='application/json').json()
+    response = client.get(f'/authors/{author.pk}/', HTTP_ACCEPT='application/x-ndjson')
+    assert response['Content-Type'] == 'application/x-ndjson'
+    head, *books = [json.loads(line) for line in streamed(response).decode().splitlines()]
+    assert books == expected.pop('books') and head == expected
+    assert json.loads(streamed(client.get(f'/authors/{author.pk}/?stream=1'))) == client.get(
+        f'/authors/{author.pk}/', HTTP_ACCEPT='application/json',
+    ).json()
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db.models import F
+from django.utils import timezone
+
+from bookshop import changes, listings, suggest
+from bookshop.models import Author, Book, Order, OrderItem, Publisher, User
+from bookshop.suggest import PrefixIndex, Suggester
+
+
+@pytest.fixture(autouse=True)
+def no_snapshot(monkeypatch):
+    monkeypatch.setattr(suggest, 'SNAPSHOT_PATH', '')
+
+
+def ids(found):
+    return [item['id'] for item in found]
+
+
+def test_writes_arrive_through_the_feed(catalog, django_capture_on_commit_callbacks, django_assert_num_queries):
+    suggester = Suggester()
+    assert suggester.suggest('zeb')['books'] == []
+    with django_assert_num_queries(0):
+        # Nothing published: no version polling and no counts.
+        suggester.suggest('book')
+
+    book = catalog[0]
+    with django_capture_on_commit_callbacks(execute=True):
+        book.title = 'Zebra crossing'
+        book.save()
+        author = Author.objects.create(name='Zadie Smith', bio='')
+    assert suggester.suggest('zeb')['books'] == [{'id': book.pk, 'name': 'Zebra crossing'}]
+    assert suggester.suggest('smi')['authors'] == [{'id': author.pk, 'name': 'Zadie Smith'}]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        author.delete()
+        catalog[1].delete()
+    assert suggester.suggest('smi')['authors'] == []
+    assert catalog[1].pk not in ids(suggester.suggest('book', 20)['books'])
+
+
+def test_lost_changes_rebuild_the_index(catalog, django_capture_on_commit_callbacks, monkeypatch):
+    suggester = Suggester()
+    suggester.suggest('book')
+    monkeypatch.setattr(changes, 'MAX_BACKLOG', 1)
+    with django_capture_on_commit_callbacks(execute=True):
+        Publisher.objects.create(name='Quantum Press')
+        Publisher.objects.create(name='Quill Books')
+    assert [item['name'] for item in suggester.suggest('qu')['publishers']] == ['Quantum Press', 'Quill Books']
+
+
+def test_sales_rescore_authors_and_publishers(catalog, django_capture_on_commit_callbacks):
+    suggester = Suggester()
+    assert ids(suggester.suggest('author')['authors'])[0] == catalog[0].authors.get().pk
+    book = catalog[8]
+    now = timezone.now()
+    shopper = User.objects.create(
+        name='Shopper', email='shopper@example.com', password_hash='x', role='user', created_at=now, updated_at=now,
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        order = Order.objects.create(user=shopper, total_amount=book.price * 3, created_at=now)
+        OrderItem.objects.create(order=order, book=book, quantity=3, unit_price=book.price)
+    assert Book.objects.filter(pk=book.pk, popularity=3).exists()
+    found = suggester.suggest('book', 1)['books'] + suggester.suggest('author', 1)['authors']
+    found += suggester.suggest('pub', 1)['publishers']
+    assert ids(found) == [book.pk, book.authors.get().pk, book.publisher_id]
+    genres = suggester.indexes['genres']
+    assert genres.scores[genres.slot(book.genres.get().pk)] == 3
+
+
+def test_snapshot_is_json(catalog, tmp_path, monkeypatch, django_capture_on_commit_callbacks):
+    path = tmp_path / 'names.json'
+    call_command('build_suggest_snapshot', path=str(path))
+    snapshot = json.loads(path.read_text(encoding='utf-8'))
+    assert snapshot['format'] == suggest.SNAPSHOT_FORMAT
+    monkeypatch.setattr(suggest, 'SNAPSHOT_PATH', str(path))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        publisher = Publisher.objects.create(name='Quantum Press')
+        # Sales counted after the snapshot still reach the publishers' ranking.
+        Book.objects.filter(pk=catalog[4].pk).update(popularity=F('popularity') + 7)
+        listings.copy_columns(['popularity'], [catalog[4].pk])
+    suggester = Suggester()
+    assert suggester.suggest('quant')['publishers'] == [{'id': publisher.pk, 'name': 'Quantum Press'}]
+    assert ids(suggester.suggest('pub', 1)['publishers']) == [catalog[4].publisher_id]
+    assert len(suggester.suggest('book', 20)['books']) == 20
+
+
+def test_prefix_index_round_trips_through_its_dump():
+    index = PrefixIndex.build([(1, 'The Hobbit', 5), (2, 'Hobbit Tales', 9), (3, 'Hoarding', 1)])
+    assert [pk for pk, _ in index.lookup('hob', 5)] == [2, 1]
+    index.put(1, 'The Hobbit', 50)
+    index.put(0, 'Hobnob', 0)
+    index.remove(2)
+    again = PrefixIndex.load(json.loads(json.dumps(index.dump())))
+    assert [pk for pk, _ in again.lookup('ho', 5)] == [1, 3, 0]
+    assert again.lookup('tal', 5) == []
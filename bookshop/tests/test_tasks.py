@@ -0,0 +1,39 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from bookshop import tasks
+from bookshop.models import Task
+
+
+def test_database_broker_is_the_default(db, django_capture_on_commit_callbacks, monkeypatch):
+    monkeypatch.setattr(tasks, '_broker', None)
+    assert tasks.TASK_BROKER == 'database'
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.reindex_books.delay([1, 2])
+        tasks.reindex_books.delay([1, 2])
+    assert list(Task.objects.values_list('name', 'args')) == [('bookshop.tasks.reindex_books', [[1, 2]])]
+
+
+def test_thread_broker_drops_tasks_sent_while_exiting(caplog):
+    broker = tasks.ThreadBroker(threads=1)
+    broker.executor.shutdown()
+    broker.send(tasks.reindex_books, [[1]])
+    assert 'dropped' in caplog.text and not broker.pending
+
+
+def test_warming_fills_the_response_cache(catalog, monkeypatch, django_assert_num_queries):
+    monkeypatch.setattr(tasks, 'CACHE_WARM_PATHS', ['/books/'])
+    tasks.refresh_catalog_cache(['book'])
+    with django_assert_num_queries(0):
+        assert APIClient().get('/books/', HTTP_ACCEPT='application/json').status_code == 200
+
+
+def test_workers_do_not_warm_a_per_process_cache(catalog, monkeypatch):
+    monkeypatch.setattr(tasks, 'CACHE_WARM_PATHS', ['/books/'])
+    monkeypatch.setattr(tasks, '_broker', tasks.DatabaseBroker())
+    assert not tasks.cache_is_shared()
+    tasks.refresh_catalog_cache(['book'])
+    with CaptureQueriesContext(connection) as queries:
+        assert APIClient().get('/books/', HTTP_ACCEPT='application/json').status_code == 200
+    assert len(queries)
@@ -1,20 +1,53 @@
 from django.urls import path
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from .views import (
-    BookListCreateAPIView, BookDetailAPIView,
+    BookListCreateAPIView, BookDetailAPIView, BookRelatedAPIView, BookImportAPIView, BookExportAPIView, SuggestAPIView,
+    BookBatchAPIView, AuthorBatchAPIView, PublisherBatchAPIView,
     AuthorListCreateAPIView, AuthorDetailAPIView,
-    PublisherListCreateAPIView, PublisherDetailAPIView
+    PublisherListCreateAPIView, PublisherDetailAPIView,
+    CartAPIView, CartItemAPIView, OrderCreateAPIView, OrderListAPIView, OrderDetailAPIView
 )
+from .async_views import (
+    AsyncBookListView, AsyncBookDetailView, AsyncAuthorListView, AsyncAuthorDetailView,
+    AsyncPublisherListView, AsyncPublisherDetailView
+)
+from . import instrumentation
 
 def api_root(request):
     return JsonResponse({"message": "Welcome to the Bookshop API"})
 
+def metrics(request):
+    # Staff sessions, and scrapers connecting from BOOKSHOP_METRICS_ALLOWED_IPS.
+    allowed = request.user.is_staff or request.META.get('REMOTE_ADDR') in instrumentation.METRICS_ALLOWED_IPS
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(instrumentation.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 urlpatterns = [
     path('', api_root, name='api-root'),
+    path('metrics', metrics, name='metrics'),
     path('books/', BookListCreateAPIView.as_view(), name='books-list'),
     path('books/<int:pk>/', BookDetailAPIView.as_view(), name='books-detail'),
+    path('books/<int:pk>/related/', BookRelatedAPIView.as_view(), name='books-related'),
+    path('books/import/', BookImportAPIView.as_view(), name='books-import'),
+    path('books/export/', BookExportAPIView.as_view(), name='books-export'),
+    path('books/batch/', BookBatchAPIView.as_view(), name='books-batch'),
+    path('authors/batch/', AuthorBatchAPIView.as_view(), name='authors-batch'),
+    path('publishers/batch/', PublisherBatchAPIView.as_view(), name='publishers-batch'),
+    path('suggest/', SuggestAPIView.as_view(), name='suggest'),
     path('authors/', AuthorListCreateAPIView.as_view(), name='authors-list'),
     path('authors/<int:pk>/', AuthorDetailAPIView.as_view(), name='authors-detail'),
     path('publishers/', PublisherListCreateAPIView.as_view(), name='publishers-list'),
     path('publishers/<int:pk>/', PublisherDetailAPIView.as_view(), name='publishers-detail'),
+    path('cart/', CartAPIView.as_view(), name='cart'),
+    path('cart/<int:book_id>/', CartItemAPIView.as_view(), name='cart-item'),
+    path('order/', OrderCreateAPIView.as_view(), name='order-create'),
+    path('orders/', OrderListAPIView.as_view(), name='orders-list'),
+    path('orders/<int:pk>/', OrderDetailAPIView.as_view(), name='orders-detail'),
+    path('async/books/', AsyncBookListView.as_view(), name='async-books-list'),
+    path('async/books/<int:pk>/', AsyncBookDetailView.as_view(), name='async-books-detail'),
+    path('async/authors/', AsyncAuthorListView.as_view(), name='async-authors-list'),
+    path('async/authors/<int:pk>/', AsyncAuthorDetailView.as_view(), name='async-authors-detail'),
+    path('async/publishers/', AsyncPublisherListView.as_view(), name='async-publishers-list'),
+    path('async/publishers/<int:pk>/', AsyncPublisherDetailView.as_view(), name='async-publishers-detail'),
 ]
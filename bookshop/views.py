@@ -1,27 +1,72 @@
+import io
+from decimal import Decimal
+
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import Book, Author, Publisher, User
-from .serializers import BookListSerializer, BookDetailSerializer, AuthorSerializer, PublisherSerializer, UserSerializer
+from .models import Book, BookListing, Author, Publisher, User, BookAuthor, CartItem, Order, RelatedBooks
+from .serializers import (
+    BookDetailSerializer, AuthorSerializer, PublisherSerializer, UserSerializer,
+    CartItemSerializer, OrderSerializer
+)
+from .pagination import KeysetPaginator, PaginationError
+from .filters import BookFilterBackend, FilterError
+from . import search, catalog_io, batch, facets, suggest
+from .caching import CATALOG_MODELS, cache_response
+from .conditional import conditional_response
+from .streaming import stream_format, streaming_response
+from .renderers import CATALOG_RENDERER_CLASSES
+from .fast_serializers import BookFieldset, FieldsetError, book_list_values, book_list_data, iter_book_list
+from .orders import get_shop_user, checkout, hold, EmptyCartError, OutOfStockError
+from login.authentication import CLAIMS_AUTHENTICATION_CLASSES
 
 class BookListCreateAPIView(APIView):
+    throttle_scope = 'catalog'
+    renderer_classes = CATALOG_RENDERER_CLASSES
+
     def get_permissions(self):
         if self.request.method == 'POST':
             return [IsAuthenticated()]
         return [AllowAny()]
+    @conditional_response()
+    @cache_response()
     def get(self, request):
-        publisher_id = request.query_params.get('publisherId')
-        genre = request.query_params.get('genre')
+        q = request.query_params.get('q')
+        filter_backend = BookFilterBackend()
+
+        query_param = BookListing.objects.all()
+        rank_ordering = None
 
-        query_param = Book.objects.all().prefetch_related('authors','genres','publisher')
+        try:
+            fieldset = BookFieldset.from_params(request.query_params)
+            facet_names = facets.requested(request.query_params)
+            query_param = filter_backend.filter_queryset(query_param, request.query_params)
 
-        if publisher_id:
-            query_param = query_param.filter(publisher_id=publisher_id)
+            if q:
+                result = search.search_books(query_param, q)
+                if result is None:
+                    query_param = query_param.none()
+                else:
+                    query_param, rank_ordering = result
+                    rank_ordering = (rank_ordering,)
 
-        serializer = BookListSerializer(query_param, many=True)
-        return Response({'data': serializer.data})
+            ordering = filter_backend.get_ordering(request.query_params, rank_ordering)
+            paginator = KeysetPaginator(ordering)
+            fmt = stream_format(request)
+            if fmt:
+                books = query_param.order_by(*paginator.ordering)
+                return streaming_response(fmt, iter_book_list(books, fieldset=fieldset))
+            page = paginator.paginate(book_list_values(query_param, *paginator.ordering, fieldset=fieldset), request)
+        except (FilterError, PaginationError, FieldsetError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {'data': book_list_data(page.object_list, fieldset), 'meta': page.meta}
+        if facet_names:
+            data['facets'] = facets.facet_counts(facet_names, request.query_params, query_param)
+        return Response(data)
 
     def post(self, request):
         data = request.data
@@ -54,12 +99,15 @@ class BookListCreateAPIView(APIView):
 
 
 class BookDetailAPIView(APIView):
+    throttle_scope = 'catalog'
     def get_permissions(self):
         if self.request.method == 'PUT':
             return [IsAuthenticated()]
         return [AllowAny()]
+    @conditional_response()
+    @cache_response()
     def get(self, request, pk):
-        book = get_object_or_404(Book, pk=pk)
+        book = get_object_or_404(BookDetailSerializer.optimize(Book.objects.all()), pk=pk)
         return Response(BookDetailSerializer(book).data)
 
     def put(self, request, pk):
@@ -76,13 +124,128 @@ class BookDetailAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BookRelatedAPIView(APIView):
+    throttle_scope = 'catalog'
+    renderer_classes = CATALOG_RENDERER_CLASSES
+
+    # A refresh moves the counter of the books it recomputed; a rebuild moves RelatedBooks'.
+    @conditional_response(CATALOG_MODELS + (RelatedBooks,), per_object=(RelatedBooks,))
+    @cache_response(CATALOG_MODELS + (RelatedBooks,), per_object=(RelatedBooks,))
+    def get(self, request, pk):
+        try:
+            fieldset = BookFieldset.from_params(request.query_params)
+        except FieldsetError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # Precomputed by bookshop.recommendations: one row lookup, then one page of listing rows.
+        book_ids = RelatedBooks.objects.filter(pk=pk).values_list('book_ids', flat=True).first()
+        if book_ids is None:
+            get_object_or_404(Book, pk=pk)
+            book_ids = []
+        rows = book_list_values(BookListing.objects.filter(pk__in=book_ids), fieldset=fieldset)
+        rows = {row['id']: row for row in rows}
+        return Response({'data': book_list_data([rows[book_id] for book_id in book_ids if book_id in rows], fieldset)})
+
+
+class SuggestAPIView(APIView):
+    throttle_scope = 'catalog'
+    renderer_classes = CATALOG_RENDERER_CLASSES
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', suggest.SUGGEST_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= suggest.MAX_SUGGEST_LIMIT:
+            return Response(
+                {'error': f'limit must be an integer from 1 to {suggest.MAX_SUGGEST_LIMIT}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Answered from this process's in-memory index, so there is no response cache in front of it.
+        return Response(suggest.suggester.suggest(request.query_params.get('q', ''), limit))
+
+
+class BookImportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload a CSV or JSONL file as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fmt = request.query_params.get('fileType') or catalog_io.guess_format(upload.name)
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+            result = catalog_io.import_catalog(stream, fmt)
+        except (catalog_io.CatalogImportError, UnicodeDecodeError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+
+class BookExportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    content_types = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+    def get(self, request):
+        fmt = request.query_params.get('fileType', 'jsonl')
+        if fmt not in self.content_types:
+            return Response({'error': 'fileType must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(catalog_io.export_lines(fmt), content_type=self.content_types[fmt])
+        response['Content-Disposition'] = f'attachment; filename="books.{fmt}"'
+        return response
+
+
+class BatchAPIView(APIView):
+    """POST creates, PATCH updates and DELETE removes a list of objects; see bookshop.batch."""
+    throttle_scope = 'catalog'
+    permission_classes = [IsAuthenticated]
+    writer_class = None
+
+    def write(self, request, operation, success_status=status.HTTP_200_OK):
+        try:
+            results = getattr(self.writer_class(request.data), operation)()
+        except batch.BatchError as e:
+            return Response({'error': str(e), 'items': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results}, status=success_status)
+
+    def post(self, request):
+        return self.write(request, 'create', status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        return self.write(request, 'update')
+
+    def delete(self, request):
+        return self.write(request, 'delete')
+
+
+class BookBatchAPIView(BatchAPIView):
+    writer_class = batch.BookBatchWriter
+
+
+class AuthorBatchAPIView(BatchAPIView):
+    writer_class = batch.AuthorBatchWriter
+
+
+class PublisherBatchAPIView(BatchAPIView):
+    writer_class = batch.PublisherBatchWriter
+
+
 class AuthorListCreateAPIView(APIView):
+    throttle_scope = 'catalog'
     def get_permissions(self):
         if self.request.method == 'POST':
             return [IsAuthenticated()]
         return [AllowAny()]
+    @conditional_response((Author, BookAuthor))
     def get(self, request):
-        authors = Author.objects.all()
+        authors = AuthorSerializer.optimize(Author.objects.all())
+
+        q = request.query_params.get('q')
+        if q:
+            result = search.search_authors(authors, q)
+            if result is None:
+                authors = authors.none()
+            else:
+                authors, rank_ordering = result
+                authors = authors.order_by(rank_ordering, 'id')
 
         serializer = AuthorSerializer(authors, many=True)
         return Response(serializer.data)
@@ -95,16 +258,25 @@ class AuthorListCreateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class AuthorDetailAPIView(APIView):
+    throttle_scope = 'catalog'
+    renderer_classes = CATALOG_RENDERER_CLASSES
+
     def get_permissions(self):
         if self.request.method == 'PUT' or self.request.method == 'DELETE':
             return [IsAuthenticated()]
         return [AllowAny()]
+    @conditional_response()
+    @cache_response()
     def get(self, request, pk):
-        author = get_object_or_404(Author, pk=pk)
+        author = get_object_or_404(AuthorSerializer.optimize(Author.objects.all()), pk=pk)
         data = AuthorSerializer(author).data
 
-        books = author.books.all()
-        data['books'] = BookListSerializer(books, many=True).data
+        book_ids = BookAuthor.objects.filter(author_id=pk).values('book_id')
+        books = BookListing.objects.filter(pk__in=book_ids).order_by('id')
+        fmt = stream_format(request)
+        if fmt:
+            return streaming_response(fmt, iter_book_list(books), data, 'books')
+        data['books'] = book_list_data(book_list_values(books))
         return Response(data)
 
     def post(self, request, pk):
@@ -126,10 +298,12 @@ class AuthorDetailAPIView(APIView):
 
 
 class PublisherListCreateAPIView(APIView):
+    throttle_scope = 'catalog'
     def get_permissions(self):
         if self.request.method == 'POST':
             return [IsAuthenticated()]
         return [AllowAny()]
+    @conditional_response((Publisher,))
     def get(self, request):
         publishers = Publisher.objects.all()
         serializer = PublisherSerializer(publishers, many=True)
@@ -143,10 +317,19 @@ class PublisherListCreateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class PublisherDetailAPIView(APIView):
+    throttle_scope = 'catalog'
+    renderer_classes = CATALOG_RENDERER_CLASSES
+
+    @conditional_response()
+    @cache_response()
     def get(self, request, pk):
         publisher = get_object_or_404(Publisher, pk=pk)
         data = PublisherSerializer(publisher).data
-        data['books'] = BookListSerializer(publisher.books.all(), many=True).data
+        books = BookListing.objects.filter(publisher_id=pk).order_by('id')
+        fmt = stream_format(request)
+        if fmt:
+            return streaming_response(fmt, iter_book_list(books), data, 'books')
+        data['books'] = book_list_data(book_list_values(books))
         return Response(data)
 
     def post(self, request, pk):
@@ -168,3 +351,70 @@ class UserDetailAPIView(APIView):
         serializers = UserDetailAPIView(user_data).data
         return Response({"User":serializers})
 
+
+def cart_response(user):
+    items = CartItem.objects.filter(user=user).select_related('book').order_by('id')
+    total = sum((item.book.price * item.quantity for item in items), Decimal('0.00'))
+    return Response({'items': CartItemSerializer(items, many=True).data, 'total': str(total)})
+
+
+class CartAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return cart_response(get_shop_user(request.user))
+
+    def post(self, request):
+        serializer = CartItemSerializer(data=request.data)
+        if serializer.is_valid():
+            user = get_shop_user(request.user)
+            try:
+                hold(user, serializer.validated_data['book'].pk, serializer.validated_data.get('quantity', 1))
+            except OutOfStockError as e:
+                return Response({'error': str(e), 'bookId': e.book_id}, status=status.HTTP_409_CONFLICT)
+            return cart_response(user)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CartItemAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, book_id):
+        user = get_shop_user(request.user)
+        deleted, _ = CartItem.objects.filter(user=user, book_id=book_id).delete()
+        if not deleted:
+            return Response({"error":"Book is not in the cart"}, status=status.HTTP_404_NOT_FOUND)
+        return cart_response(user)
+
+
+class OrderCreateAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            order = checkout(get_shop_user(request.user))
+        except EmptyCartError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except OutOfStockError as e:
+            return Response({'error': str(e), 'bookId': e.book_id}, status=status.HTTP_409_CONFLICT)
+        order = OrderSerializer.optimize(Order.objects.all()).get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class OrderListAPIView(APIView):
+    authentication_classes = CLAIMS_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        orders = OrderSerializer.optimize(Order.objects.filter(user=get_shop_user(request.user)))
+        return Response(OrderSerializer(orders.order_by('-created_at', '-id'), many=True).data)
+
+
+class OrderDetailAPIView(APIView):
+    authentication_classes = CLAIMS_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        orders = OrderSerializer.optimize(Order.objects.filter(user=get_shop_user(request.user)))
+        order = get_object_or_404(orders, pk=pk)
+        return Response(OrderSerializer(order).data)
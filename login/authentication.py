@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import SessionAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# Shared-cache entries are deleted when the user changes (login.signals covers
+# saves and deletes; QuerySet.update() callers call login.signals.forget()); the
+# in-process copies are not, so LOCAL_TIMEOUT bounds how long another worker may
+# see a stale user. Other writes are seen after USER_CACHE_TIMEOUT.
+USER_CACHE_TIMEOUT = getattr(settings, 'BOOKSHOP_AUTH_USER_CACHE_TIMEOUT', 300)
+LOCAL_TIMEOUT = getattr(settings, 'BOOKSHOP_AUTH_USER_LOCAL_TIMEOUT', 10)
+LOCAL_SIZE = getattr(settings, 'BOOKSHOP_AUTH_USER_LOCAL_SIZE', 1024)
+# Claims ClaimsJWTAuthentication needs before it trusts a token without a lookup.
+USER_CLAIMS = ('username', 'email', 'is_staff')
+
+
+class LRUCache:
+    """A thread-safe, size-bounded dict whose entries expire `timeout` seconds after they are set."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = LRUCache(LOCAL_SIZE, LOCAL_TIMEOUT)
+
+
+def _user_key(user_id):
+    return f'login:user:{user_id}'
+
+
+class CachedUser:
+    """
+    The authenticated user as get_cached_user() keeps it: the primary key,
+    the flags authentication and permissions check, and the token version.
+    Anything else (email, names, groups) is read from the database on first
+    use, so the password hash and personal data are never cached.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_model, pk, is_active, is_staff, token_version):
+        self._user_model = user_model
+        self._user = None
+        self.pk = self.id = pk
+        self.is_active = is_active
+        self.is_staff = is_staff
+        self.token_version = token_version
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = self._user_model._default_manager.get(pk=self.pk)
+        return self._user
+
+    def __getattr__(self, name):
+        # Only called for attributes not set above.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        return isinstance(other, (CachedUser, self._user_model)) and other.pk == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return str(self.user)
+
+
+def _token_version(password):
+    # What SimpleJWT's revocation claim holds: a hash of the password hash, not the hash itself.
+    return get_md5_hash_password(password)
+
+
+def get_cached_user(user_model, user_id):
+    """
+    A CachedUser for the user with USER_ID_FIELD `user_id`, from the
+    in-process LRU, then the shared cache, then the database; None if there
+    is no such user. Only (pk, is_active, is_staff, token_version) is cached.
+    """
+    key = str(user_id)
+    row = local_users.get(key)
+    if row is None:
+        row = cache.get(_user_key(key))
+        if row is None:
+            found = user_model._default_manager.filter(**{api_settings.USER_ID_FIELD: user_id})
+            found = found.values_list('pk', 'is_active', 'is_staff', 'password').first()
+            if found is None:
+                return None
+            pk, is_active, is_staff, password = found
+            row = (pk, is_active, is_staff, _token_version(password))
+            cache.set(_user_key(key), row, USER_CACHE_TIMEOUT)
+        local_users.set(key, row)
+    return CachedUser(user_model, *row)
+
+
+def invalidate_user(user_id):
+    local_users.delete(str(user_id))
+    cache.delete(_user_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through
+    get_cached_user(), so an authenticated request usually costs no query.
+    The active and password-revocation checks are the same as SimpleJWT's.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = get_cached_user(self.user_model, user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != user.token_version:
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+
+class ClaimsUser(TokenUser):
+    """A TokenUser that also answers the auth.User calls the bookshop makes (email, full name)."""
+
+    def get_full_name(self):
+        return self.token.get('name', '')
+
+
+class ClaimsJWTAuthentication(CachedJWTAuthentication):
+    """
+    Token-claims-only authentication for read-heavy endpoints: the user is
+    built from the access token's claims without any lookup, so a
+    deactivated user keeps access until the token expires. Tokens issued
+    without the USER_CLAIMS fall back to the cached lookup.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM in validated_token and all(claim in validated_token for claim in USER_CLAIMS):
+            return ClaimsUser(validated_token)
+        return super().get_user(validated_token)
+
+
+CLAIMS_AUTHENTICATION_CLASSES = [ClaimsJWTAuthentication, SessionAuthentication]
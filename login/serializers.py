@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8, max_length=128)
@@ -24,4 +25,17 @@ class RegisterSerializer(serializers.ModelSerializer):
             first_name=validated_data.get('first_name', ''),
             last_name=validated_data.get('last_name', '')
         )
-        return user
\ No newline at end of file
+        return user
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """Adds the claims login.authentication.ClaimsJWTAuthentication builds a user from."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['email'] = user.email
+        token['name'] = user.get_full_name()
+        token['is_staff'] = user.is_staff
+        return token
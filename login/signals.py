@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import invalidate_user
+
+
+def forget(user_ids):
+    """
+    Drop the cached users with these USER_ID_FIELD values. Saves and deletes
+    call it through the receivers below; code that writes users with
+    QuerySet.update() or bulk_update(), which send no signals, calls it itself.
+    """
+    user_ids = list(user_ids)
+
+    def invalidate():
+        for user_id in user_ids:
+            invalidate_user(user_id)
+
+    invalidate()
+    # Again on commit: a concurrent request may have cached the pre-commit row.
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_cached_user(sender, instance, **kwargs):
+    forget([getattr(instance, api_settings.USER_ID_FIELD)])
@@ -0,0 +1,14 @@
+import logging
+
+from django.contrib.auth.models import User
+
+from bookshop.tasks import task
+
+logger = logging.getLogger(__name__)
+
+
+@task()
+def log_registration(user_id):
+    username = User.objects.filter(pk=user_id).values_list('username', flat=True).first()
+    if username is not None:
+        logger.info(f"New user registered: {username}")
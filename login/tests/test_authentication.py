@@ -0,0 +1,67 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from login.authentication import _user_key, local_users
+from login.signals import forget
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    cache.clear()
+    local_users.clear()
+
+
+@pytest.fixture
+def ann(db):
+    return User.objects.create_user(username='ann', email='ann@example.com', password='right-password-1')
+
+
+def get_cart(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client.get('/cart/')
+
+
+def test_only_the_flags_are_cached(ann):
+    assert get_cart(ann).status_code == 200
+    pk, is_active, is_staff, token_version = cache.get(_user_key(ann.pk))
+    assert (pk, is_active, is_staff) == (ann.pk, True, False)
+    assert ann.password not in token_version
+
+
+def test_writes_without_signals_are_seen_once_forgotten(ann, django_capture_on_commit_callbacks):
+    assert get_cart(ann).status_code == 200
+    with django_capture_on_commit_callbacks(execute=True):
+        User.objects.filter(pk=ann.pk).update(is_active=False)
+        forget([ann.pk])
+    assert get_cart(ann).status_code == 401
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ann.is_active = True
+        User.objects.bulk_update([ann], ['is_active'])
+        forget([ann.pk])
+    assert get_cart(ann).status_code == 200
+
+
+def test_saves_are_seen(ann, django_capture_on_commit_callbacks):
+    assert get_cart(ann).status_code == 200
+    with django_capture_on_commit_callbacks(execute=True):
+        ann.is_active = False
+        ann.save()
+    assert get_cart(ann).status_code == 401
+
+
+def test_password_change_revokes_tokens(ann, monkeypatch):
+    monkeypatch.setattr(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(ann)}')
+    assert client.get('/cart/').status_code == 200
+    ann.set_password('other-password-2')
+    ann.save()
+    response = client.get('/cart/')
+    assert response.status_code == 401 and response.json()['code'] == 'password_changed'
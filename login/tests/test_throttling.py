@@ -0,0 +1,83 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from login.throttling import TokenBucketThrottle
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    cache.clear()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable clock for the token buckets."""
+    now = [1000.0]
+    monkeypatch.setattr(TokenBucketThrottle, 'timer', staticmethod(lambda: now[0]))
+    return now
+
+
+def login(client, username, password='wrong'):
+    return client.post('/auth/login/', {'username': username, 'password': password}, format='json')
+
+
+def test_login_flood_for_one_username_is_cut_off(db, clock):
+    User.objects.create_user(username='ann', password='right-password-1')
+    client = APIClient()
+    statuses = [login(client, 'ann').status_code for _ in range(200)]
+    # Only the first 5 reach the password check; the rest are refused before it.
+    assert statuses[:5] == [401] * 5
+    assert set(statuses[5:]) == {429}
+    response = login(client, 'Ann ', 'right-password-1')
+    assert response.status_code == 429
+    assert int(response['Retry-After']) > 0
+
+
+def test_buckets_refill(db, clock):
+    User.objects.create_user(username='ann', password='right-password-1')
+    client = APIClient()
+    for _ in range(5):
+        login(client, 'ann')
+    assert login(client, 'ann', 'right-password-1').status_code == 429
+    clock[0] += 12  # 5/min refills one attempt every 12 seconds
+    assert login(client, 'ann', 'right-password-1').status_code == 200
+    assert login(client, 'ann', 'right-password-1').status_code == 429
+
+
+def test_login_flood_from_one_address_is_cut_off(db, clock):
+    client = APIClient()
+    statuses = [login(client, f'user{i}').status_code for i in range(40)]
+    assert statuses[:20] == [401] * 20
+    assert set(statuses[20:]) == {429}
+    # Another address has its own bucket.
+    assert login(APIClient(REMOTE_ADDR='10.0.0.2'), 'someone').status_code == 401
+
+
+def test_a_refusing_bucket_is_not_written(db, clock, monkeypatch):
+    client = APIClient()
+    for username in ['ann'] * 5 + [f'user{i}' for i in range(15)]:
+        login(client, username)
+    writes = []
+    monkeypatch.setattr(TokenBucketThrottle.cache, 'set', lambda key, *args, **kwargs: writes.append(key))
+    assert login(client, 'ann').status_code == 429
+    # Both buckets refuse, so the flood costs reads only.
+    assert writes == []
+    assert login(client, 'fresh').status_code == 429
+    assert [key.split(':')[2] for key in writes] == ['username']
+
+
+def test_catalog_is_not_throttled_without_a_rate(db):
+    client = APIClient()
+    assert {client.get('/books/').status_code for _ in range(30)} == {200}
+
+
+def test_catalog_rate(db, clock, settings):
+    settings.REST_FRAMEWORK = {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'catalog': '3/min'},
+    }
+    client = APIClient()
+    assert [client.get('/books/').status_code for _ in range(4)] == [200, 200, 200, 429]
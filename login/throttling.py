@@ -0,0 +1,82 @@
+import hashlib
+import time
+
+from django.core.cache import cache as default_cache
+from rest_framework.exceptions import ParseError
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60), like DRF's SimpleRateThrottle."""
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket throttle kept in the shared cache. A rate of 'N/period'
+    allows bursts of N requests and refills at N per period. The rate comes
+    from DEFAULT_THROTTLE_RATES under the view's `throttle_scope` (plus
+    `rate_suffix`); views without a scope, or scopes without a rate, are not
+    throttled. A rejection costs one cache read and nothing is written, so
+    it stays cheap under a flood. The read and write of an allowed request
+    are not atomic, so concurrent requests may overshoot a bucket by a few.
+    """
+    cache = default_cache
+    timer = time.time
+    kind = None
+    rate_suffix = ''
+
+    def get_bucket_ident(self, request):
+        raise NotImplementedError('.get_bucket_ident() must be overridden')
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f'{scope}{self.rate_suffix}') if scope else None
+        if not rate:
+            return True
+        ident = self.get_bucket_ident(request)
+        if ident is None:
+            return True
+
+        capacity, duration = parse_rate(rate)
+        refill = capacity / duration
+        digest = hashlib.md5(str(ident).encode()).hexdigest()
+        key = f'throttle:{scope}:{self.kind}:{digest}'
+        now = self.timer()
+        tokens, updated = self.cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        if tokens < 1:
+            self.wait_seconds = (1 - tokens) / refill
+            return False
+        self.cache.set(key, (tokens - 1, now), int(duration) + 1)
+        return True
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    kind = 'ip'
+
+    def get_bucket_ident(self, request):
+        return self.get_ident(request)
+
+
+class UsernameRateThrottle(TokenBucketThrottle):
+    """Buckets by the `username` in the request body, under the '<scope>_username' rate."""
+    kind = 'username'
+    rate_suffix = '_username'
+
+    def get_bucket_ident(self, request):
+        try:
+            username = request.data.get('username')
+        except (ParseError, AttributeError):
+            return None
+        return username.strip().lower() if isinstance(username, str) and username.strip() else None
+
+
+AUTH_THROTTLE_CLASSES = [IPRateThrottle, UsernameRateThrottle]
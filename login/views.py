@@ -2,6 +2,8 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from .serializers import RegisterSerializer
+from .tasks import log_registration
+from .throttling import AUTH_THROTTLE_CLASSES
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 import logging
 
@@ -11,9 +13,19 @@ class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'register'
 
     def perform_create(self, serializer):
         user = serializer.save()
-        logger.info(f"New user registered: {user.username}")
+        log_registration.delay(user.pk)
 
-# JWT login/logout handled by SimpleJWT views
\ No newline at end of file
+# JWT login/logout handled by SimpleJWT views, throttled before any password hashing runs.
+class LoginView(TokenObtainPairView):
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'login'
+
+
+class RefreshView(TokenRefreshView):
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'token_refresh'
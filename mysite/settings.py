@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bookshop.middleware.InstrumentationMiddleware',
+    'bookshop.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'bookshop.middleware.PrimaryDatabaseMiddleware',
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -78,14 +82,150 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default (dev and CI; WAL mode and tuned pragmas are applied in bookshop/signals.py).
+# Set DATABASE_HOST to run on PostgreSQL in production, and DATABASE_REPLICA_HOSTS
+# (comma separated) to send bookshop catalog reads to replicas, see bookshop/routers.py.
+
+if os.environ.get('DATABASE_HOST'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'bookshop'),
+            'USER': os.environ.get('DATABASE_USER', 'bookshop'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ['DATABASE_HOST'],
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            # Persistent connections, checked before reuse after an error.
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # Pooling is done by PgBouncer (set DATABASE_POOLER when HOST points at it); in
+            # transaction pooling mode the server-side cursors behind .iterator() cannot be used.
+            'DISABLE_SERVER_SIDE_CURSORS': bool(os.environ.get('DATABASE_POOLER')),
+        }
     }
+    for number, host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(','))):
+        DATABASES[f'replica_{number}'] = {
+            **DATABASES['default'],
+            'HOST': host.strip(),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {'timeout': 20},
+            # Kept open between requests like the PostgreSQL connections, and checked before reuse after an error.
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # A file rather than memory, so tests can hit it from several threads.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+DATABASE_ROUTERS = ['bookshop.routers.ReplicaRouter']
+BOOKSHOP_READ_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+BOOKSHOP_REPLICA_LAG = int(os.environ.get('BOOKSHOP_REPLICA_LAG', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory by default (dev and tests); set REDIS_URL or MEMCACHED_LOCATION in production
+# so the response cache and its version counters are shared between workers.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+BOOKSHOP_RESPONSE_CACHE_TIMEOUT = int(os.environ.get('BOOKSHOP_RESPONSE_CACHE_TIMEOUT', 300))
+
+# Post-write work (search reindexing, cache refresh, related books): 'database' queues it for `manage.py run_workers`,
+# 'thread' runs it on a pool in the web process and loses what is queued when the process exits, 'immediate' runs
+# it inline after commit.
+BOOKSHOP_TASK_BROKER = os.environ.get('BOOKSHOP_TASK_BROKER', 'database')
+BOOKSHOP_TASK_THREADS = int(os.environ.get('BOOKSHOP_TASK_THREADS', 4))
+
+# Most items accepted by one request to the books/, authors/ and publishers/ batch endpoints.
+BOOKSHOP_BATCH_LIMIT = int(os.environ.get('BOOKSHOP_BATCH_LIMIT', 5000))
+
+# Seconds the copies added to a cart stay held; `manage.py release_expired_holds` reclaims them after.
+BOOKSHOP_CART_HOLD_TTL = int(os.environ.get('BOOKSHOP_CART_HOLD_TTL', 900))
+
+# Edges of the price bands counted by `GET /books/?facets=price`, and the seconds between the facet index's syncs
+# with the change feed (0 syncs on the requests).
+BOOKSHOP_PRICE_FACETS = [int(edge) for edge in os.environ.get('BOOKSHOP_PRICE_FACETS', '10,20,50,100,200,500').split(',')]
+BOOKSHOP_FACET_SYNC_INTERVAL = int(os.environ.get('BOOKSHOP_FACET_SYNC_INTERVAL', 1))
+
+# JSON snapshot of the names behind `GET /suggest/`, written by `manage.py build_suggest_snapshot`; empty reads
+# the database on the first request instead.
+BOOKSHOP_SUGGEST_SNAPSHOT = os.environ.get('BOOKSHOP_SUGGEST_SNAPSHOT', '')
+
+BOOKSHOP_BROTLI_QUALITY = int(os.environ.get('BOOKSHOP_BROTLI_QUALITY', 5))
+
+BOOKSHOP_N_PLUS_ONE_THRESHOLD = int(os.environ.get('BOOKSHOP_N_PLUS_ONE_THRESHOLD', 5))
+BOOKSHOP_METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('BOOKSHOP_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+
+# One JSON line per request from bookshop.middleware.InstrumentationMiddleware.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'bookshop.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('BOOKSHOP_REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
 }
 
 
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'login.authentication.CachedJWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    # Token buckets per client IP (and per username on login); a scope without a rate is not throttled.
+    'DEFAULT_THROTTLE_CLASSES': ['login.throttling.IPRateThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'login': os.environ.get('BOOKSHOP_LOGIN_RATE', '20/min'),
+        'login_username': os.environ.get('BOOKSHOP_LOGIN_USERNAME_RATE', '5/min'),
+        'register': os.environ.get('BOOKSHOP_REGISTER_RATE', '10/hour'),
+        'token_refresh': os.environ.get('BOOKSHOP_TOKEN_REFRESH_RATE', '60/min'),
+        'catalog': os.environ.get('BOOKSHOP_CATALOG_RATE'),
+    },
+    # Proxies in front of the app; 0 ignores X-Forwarded-For so clients can't pick their own bucket.
+    'NUM_PROXIES': int(os.environ.get('BOOKSHOP_NUM_PROXIES', 0)),
+}
+
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'login.serializers.TokenObtainPairSerializer',
+}
+
+# Authenticated users are cached in the shared cache and, for a few seconds, in each process.
+BOOKSHOP_AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('BOOKSHOP_AUTH_USER_CACHE_TIMEOUT', 300))
+BOOKSHOP_AUTH_USER_LOCAL_TIMEOUT = int(os.environ.get('BOOKSHOP_AUTH_USER_LOCAL_TIMEOUT', 10))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 